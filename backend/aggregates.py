@@ -0,0 +1,167 @@
+# aggregates.py
+"""
+Aggregate tables for price and rating analytics.
+
+- drg_state_stats        per (DRG, state): provider count, discharges, average / min / max charges
+- drg_provider_stats     per (DRG, provider): figures, rating and price rank within the state
+- provider_rating_stats  per provider: rating, DRG count, discharges and average charges
+
+Uploads refresh them incrementally inside each batch transaction, together with the data version bump,
+so a reader never sees aggregates that disagree with the rows they summarize. Only the groups a batch
+touched are recomputed: every (DRG, state) group of the batch's DRGs and states, and its providers.
+rebuild_aggregates() recomputes everything, e.g. for a database loaded before these tables existed.
+
+All functions accept a Session or a Connection and leave committing to the caller.
+"""
+
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, text
+
+from models.models import SCHEMA_MODE
+
+if TYPE_CHECKING:
+    import pandas as pd  # only the ETL hands DataFrames in; the API imports this module without pandas
+
+AGGREGATE_TABLES = ("drg_state_stats", "drg_provider_stats", "provider_rating_stats")
+
+_NORMALIZED_BASE = """(
+    SELECT d.ms_drg_definition, p.provider_id, p.provider_name, p.provider_city, p.provider_state,
+           pd.total_discharges, pd.average_covered_charges, pd.average_total_payments, pd.average_medicare_payments
+    FROM provider_drg pd
+    JOIN provider p ON p.provider_id = pd.provider_id
+    JOIN drg d ON d.drg_id = pd.drg_id
+)"""
+
+_DRG_STATE_SELECT = """
+    INSERT INTO drg_state_stats (ms_drg_definition, provider_state, provider_count, total_discharges, avg_covered_charges,
+                                 min_covered_charges, max_covered_charges, avg_total_payments, avg_medicare_payments)
+    SELECT hd.ms_drg_definition, hd.provider_state, COUNT(DISTINCT hd.provider_id), SUM(hd.total_discharges),
+           AVG(hd.average_covered_charges), MIN(hd.average_covered_charges), MAX(hd.average_covered_charges),
+           AVG(hd.average_total_payments), AVG(hd.average_medicare_payments)
+    FROM {base} hd
+    WHERE hd.ms_drg_definition IS NOT NULL AND hd.provider_state IS NOT NULL{where}
+    GROUP BY hd.ms_drg_definition, hd.provider_state
+"""
+
+_DRG_PROVIDER_SELECT = """
+    INSERT INTO drg_provider_stats (ms_drg_definition, provider_id, provider_name, provider_city, provider_state,
+                                    total_discharges, average_covered_charges, average_total_payments,
+                                    average_medicare_payments, overall_rating, state_price_rank, state_avg_covered_charges)
+    SELECT hd.ms_drg_definition, hd.provider_id, hd.provider_name, hd.provider_city, hd.provider_state,
+           hd.total_discharges, hd.average_covered_charges, hd.average_total_payments, hd.average_medicare_payments,
+           sr.overall_rating,
+           RANK() OVER (PARTITION BY hd.ms_drg_definition, hd.provider_state ORDER BY hd.average_covered_charges),
+           AVG(hd.average_covered_charges) OVER (PARTITION BY hd.ms_drg_definition, hd.provider_state)
+    FROM {base} hd
+    LEFT JOIN star_rating sr ON sr.provider_id = hd.provider_id
+    WHERE hd.ms_drg_definition IS NOT NULL{where}
+"""
+
+_PROVIDER_RATING_SELECT = """
+    INSERT INTO provider_rating_stats (provider_id, provider_name, provider_city, provider_state, overall_rating,
+                                       drg_count, total_discharges, avg_covered_charges, avg_total_payments)
+    SELECT hd.provider_id, MAX(hd.provider_name), MAX(hd.provider_city), MAX(hd.provider_state), MAX(sr.overall_rating),
+           COUNT(*), SUM(hd.total_discharges), AVG(hd.average_covered_charges), AVG(hd.average_total_payments)
+    FROM {base} hd
+    LEFT JOIN star_rating sr ON sr.provider_id = hd.provider_id
+    WHERE hd.provider_id IS NOT NULL{where}
+    GROUP BY hd.provider_id
+"""
+
+
+def _base(schema_mode: str) -> str:
+    return _NORMALIZED_BASE if schema_mode == "normalized" else "hospital_data"
+
+
+def _in_filters(alias: str, **values: Optional[List[Any]]):
+    """
+    Builds " AND col IN :col" clauses for every given list, with expanding bind parameters.
+    """
+    clauses, params, binds = [], {}, []
+    for column, items in values.items():
+        if items is None:
+            continue
+        prefix = f"{alias}." if alias else ""
+        clauses.append(f" AND {prefix}{column} IN :{column}")
+        params[column] = list(items)
+        binds.append(bindparam(column, expanding=True))
+    return "".join(clauses), params, binds
+
+
+def _replace(db, table: str, insert_sql: str, schema_mode: str, **values: Optional[List[Any]]):
+    """
+    Deletes the rows of `table` matching the filters and recomputes them from the base rows.
+    """
+    if any(items is not None and not items for items in values.values()):
+        return
+    where, params, binds = _in_filters("", **values)
+    db.execute(text(f"DELETE FROM {table} WHERE 1 = 1{where}").bindparams(*binds), params)
+    where, params, binds = _in_filters("hd", **values)
+    db.execute(text(insert_sql.format(base=_base(schema_mode), where=where)).bindparams(*binds), params)
+
+
+def refresh_drg_aggregates(db, drgs: Optional[Iterable[str]], states: Optional[Iterable[str]], schema_mode: str = SCHEMA_MODE):
+    """
+    Recomputes drg_state_stats and drg_provider_stats for every (DRG, state) group with a DRG in `drgs`
+    and a state in `states`; None means all of them. Price ranks are per group, so whole groups are recomputed.
+    """
+    drgs = sorted(set(drgs)) if drgs is not None else None
+    states = sorted(set(states)) if states is not None else None
+    _replace(db, "drg_state_stats", _DRG_STATE_SELECT, schema_mode, ms_drg_definition=drgs, provider_state=states)
+    _replace(db, "drg_provider_stats", _DRG_PROVIDER_SELECT, schema_mode, ms_drg_definition=drgs, provider_state=states)
+
+
+def refresh_provider_aggregates(db, provider_ids: Optional[Iterable[int]], schema_mode: str = SCHEMA_MODE):
+    """
+    Recomputes provider_rating_stats for `provider_ids` (None means all providers).
+    """
+    provider_ids = sorted({int(p) for p in provider_ids}) if provider_ids is not None else None
+    _replace(db, "provider_rating_stats", _PROVIDER_RATING_SELECT, schema_mode, provider_id=provider_ids)
+
+
+def refresh_for_hospital_data(db, df: "pd.DataFrame", schema_mode: str = SCHEMA_MODE):
+    """
+    Refreshes the aggregates after a batch of transformed hospital_data rows was written.
+    """
+    provider_ids = df["provider_id"].dropna().astype(int).unique().tolist()
+    states = set(df["provider_state"].dropna())
+    if provider_ids:
+        # A provider that moved keeps rows in its old state's groups until those are recomputed as well
+        previous = db.execute(
+            text("SELECT DISTINCT provider_state FROM provider_rating_stats WHERE provider_id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": provider_ids},
+        ).scalars()
+        states.update(s for s in previous if s is not None)
+    refresh_drg_aggregates(db, df["ms_drg_definition"].dropna().unique().tolist(), states, schema_mode)
+    refresh_provider_aggregates(db, provider_ids, schema_mode)
+
+
+def refresh_for_ratings(db, provider_ids: Iterable[int], schema_mode: str = SCHEMA_MODE):
+    """
+    Refreshes the aggregates after star_rating rows of `provider_ids` were written.
+    """
+    provider_ids = sorted({int(p) for p in provider_ids})
+    if not provider_ids:
+        return
+    db.execute(text("""
+        UPDATE drg_provider_stats
+        SET overall_rating = (SELECT sr.overall_rating FROM star_rating sr WHERE sr.provider_id = drg_provider_stats.provider_id)
+        WHERE provider_id IN :ids
+    """).bindparams(bindparam("ids", expanding=True)), {"ids": provider_ids})
+    refresh_provider_aggregates(db, provider_ids, schema_mode)
+
+
+def rebuild_aggregates(db, schema_mode: str = SCHEMA_MODE) -> Dict[str, float]:
+    """
+    Recomputes every aggregate table from the base rows.
+    """
+    started = time.perf_counter()
+    refresh_drg_aggregates(db, None, None, schema_mode)
+    refresh_provider_aggregates(db, None, schema_mode)
+    elapsed = round(time.perf_counter() - started, 3)
+    logging.info(f"Rebuilt aggregate tables in {elapsed}s")
+    return {"seconds": elapsed}
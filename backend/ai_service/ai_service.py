@@ -1,13 +1,242 @@
 # ai_service.py
 
+import asyncio
+import json
+import logging
 import os
-from openai import AsyncOpenAI
-from typing import Dict, Any, List
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional, Union
+from models.models import SCHEMA_MODE
+from ai_service.coalescing import MicroBatcher, SharedStream, SingleFlight
+from ai_service.sql_cache import SqlCache, question_key
+
+SUMMARY_ERROR_MESSAGE = "I encountered an error while trying to summarize the results. Please try again."
+
+def no_results_message(original_query: str) -> str:
+    return f"I couldn't find any information for '{original_query}'. Please try a different query."
+
+SUMMARY_MAX_ROWS = int(os.getenv("SUMMARY_MAX_ROWS", "5"))
+
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "1000"))
+SQL_CACHE_TTL_SECONDS = float(os.getenv("SQL_CACHE_TTL_SECONDS", "86400"))
+SQL_CACHE_SIMILARITY = float(os.getenv("SQL_CACHE_SIMILARITY", "0.85"))
+
+# Concurrent identical questions (and summaries of identical rows) share one in-flight LLM call
+LLM_COALESCING_ENABLED = os.getenv("LLM_COALESCING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Distinct questions arriving within this window are sent to the LLM as one request, 0 turns batching off
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+
+NORMALIZED_SCHEMA = """
+        Table Name: provider
+        Columns:
+        - provider_id: INTEGER (Primary Key, maps to Rndrng_Prvdr_CCN in original CSV)
+        - provider_name: TEXT
+        - provider_city: TEXT
+        - provider_state: TEXT
+        - provider_zip_code: TEXT
+        - content_hash: TEXT (Internal change-detection hash used by uploads, never useful in answers)
+        Description: One row per healthcare provider.
+
+        Table Name: drg
+        Columns:
+        - drg_id: INTEGER (Primary Key, auto-increment)
+        - ms_drg_definition: TEXT (Medical Service DRG definition, unique)
+        Description: One row per DRG procedure.
+
+        Table Name: provider_drg
+        Columns:
+        - drg_id: INTEGER (Foreign Key to drg.drg_id)
+        - provider_id: INTEGER (Foreign Key to provider.provider_id)
+        - total_discharges: INTEGER
+        - average_covered_charges: REAL (Float)
+        - average_total_payments: REAL (Float)
+        - average_medicare_payments: REAL (Float)
+        - content_hash: TEXT (Internal change-detection hash used by uploads, never useful in answers)
+        Description: Pricing and volume of one DRG at one provider. Primary key is (drg_id, provider_id).
+
+        Table Name: star_rating
+        Columns:
+        - id: INTEGER (Primary Key, auto-increment)
+        - provider_id: INTEGER (Refers to provider.provider_id. Unique in this table to give one rating per provider.)
+        - overall_rating: INTEGER (Rating from 1 to 10)
+        - content_hash: TEXT (Internal change-detection hash used by uploads, never useful in answers)
+        Description: This table stores mock quality ratings for providers, linked by provider_id.
+
+        Relationships: provider_drg.provider_id = provider.provider_id, provider_drg.drg_id = drg.drg_id, star_rating.provider_id = provider.provider_id
+
+        """
+
+# Precomputed aggregate tables (aggregates.py), the same in both schema modes
+AGGREGATE_SCHEMA = """
+        Table Name: drg_state_stats
+        Columns:
+        - ms_drg_definition: TEXT (Medical Service DRG definition)
+        - provider_state: TEXT
+        - provider_count: INTEGER (Providers reporting this DRG in the state)
+        - total_discharges: INTEGER
+        - avg_covered_charges: REAL (Float)
+        - min_covered_charges: REAL (Float)
+        - max_covered_charges: REAL (Float)
+        - avg_total_payments: REAL (Float)
+        - avg_medicare_payments: REAL (Float)
+        Description: One row per (DRG, state), precomputed. Use it for averages, minimums, maximums and counts per DRG and state instead of aggregating the per-provider rows.
+
+        Table Name: drg_provider_stats
+        Columns:
+        - ms_drg_definition: TEXT
+        - provider_id, provider_name, provider_city, provider_state
+        - total_discharges: INTEGER
+        - average_covered_charges, average_total_payments, average_medicare_payments: REAL (Float)
+        - overall_rating: INTEGER (Rating from 1 to 10, may be NULL)
+        - state_price_rank: INTEGER (1 = lowest average_covered_charges for this DRG among providers in the state)
+        - state_avg_covered_charges: REAL (Average covered charges for this DRG in the state)
+        Description: One row per (DRG, provider) with its rating already joined. Use it to compare a provider with its state.
+
+        Table Name: provider_rating_stats
+        Columns:
+        - provider_id: INTEGER (Primary Key)
+        - provider_name, provider_city, provider_state: TEXT
+        - overall_rating: INTEGER (Rating from 1 to 10, may be NULL)
+        - drg_count: INTEGER (Number of DRGs the provider reports)
+        - total_discharges: INTEGER
+        - avg_covered_charges, avg_total_payments: REAL (Float, averaged over the provider's DRGs)
+        Description: One row per provider with its rating. Use it for ratings per state or city and provider-level totals.
+
+"""
+
+AGGREGATE_EXAMPLES = """
+        - "What is the average cost of heart failure treatment in each state?"
+          SELECT s.provider_state, s.ms_drg_definition, s.avg_covered_charges, s.provider_count FROM drg_state_stats AS s WHERE s.ms_drg_definition ILIKE '%HEART FAILURE%' ORDER BY s.provider_state;
+
+        - "What is the average hospital rating per state?"
+          SELECT r.provider_state, AVG(r.overall_rating) AS average_rating, COUNT(*) AS providers FROM provider_rating_stats AS r GROUP BY r.provider_state ORDER BY average_rating DESC;
+"""
+
+FLAT_EXAMPLES = """
+        - "What's the cheapest hospital for knee replacement?"
+          SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.average_covered_charges FROM hospital_data AS hd WHERE hd.ms_drg_definition ILIKE '%KNEE REPLACEMENT%' ORDER BY hd.average_covered_charges ASC LIMIT 1;
+
+        - "Which hospitals have the highest total discharges for heart surgery?"
+          SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.total_discharges FROM hospital_data AS hd WHERE hd.ms_drg_definition ILIKE '%HEART SURGERY%' ORDER BY hd.total_discharges DESC LIMIT 5;
+
+        - "Show me all providers in New York with their ratings."
+          SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.provider_state, sr.overall_rating FROM hospital_data AS hd LEFT JOIN star_rating AS sr ON hd.provider_id = sr.provider_id WHERE hd.provider_state = 'NY' LIMIT 10;
+
+        - "List the highest rated hospitals for cancer treatment."
+          SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.ms_drg_definition, sr.overall_rating FROM hospital_data AS hd LEFT JOIN star_rating AS sr ON hd.provider_id = sr.provider_id WHERE hd.ms_drg_definition ILIKE '%CANCER TREATMENT%' ORDER BY sr.overall_rating DESC LIMIT 5;
+"""
+
+NORMALIZED_EXAMPLES = """
+        - "What's the cheapest hospital for knee replacement?"
+          SELECT p.provider_id, p.provider_name, p.provider_city, pd.average_covered_charges FROM provider_drg AS pd JOIN provider AS p ON p.provider_id = pd.provider_id JOIN drg AS d ON d.drg_id = pd.drg_id WHERE d.ms_drg_definition ILIKE '%KNEE REPLACEMENT%' ORDER BY pd.average_covered_charges ASC LIMIT 1;
+
+        - "Which hospitals have the highest total discharges for heart surgery?"
+          SELECT p.provider_id, p.provider_name, p.provider_city, pd.total_discharges FROM provider_drg AS pd JOIN provider AS p ON p.provider_id = pd.provider_id JOIN drg AS d ON d.drg_id = pd.drg_id WHERE d.ms_drg_definition ILIKE '%HEART SURGERY%' ORDER BY pd.total_discharges DESC LIMIT 5;
+
+        - "Show me all providers in New York with their ratings."
+          SELECT p.provider_id, p.provider_name, p.provider_city, p.provider_state, sr.overall_rating FROM provider AS p LEFT JOIN star_rating AS sr ON p.provider_id = sr.provider_id WHERE p.provider_state = 'NY' LIMIT 10;
+
+        - "List the highest rated hospitals for cancer treatment."
+          SELECT p.provider_id, p.provider_name, p.provider_city, d.ms_drg_definition, sr.overall_rating FROM provider_drg AS pd JOIN provider AS p ON p.provider_id = pd.provider_id JOIN drg AS d ON d.drg_id = pd.drg_id LEFT JOIN star_rating AS sr ON p.provider_id = sr.provider_id WHERE d.ms_drg_definition ILIKE '%CANCER TREATMENT%' ORDER BY sr.overall_rating DESC LIMIT 5;
+"""
+
+SQL_PROMPT = """
+        You are a SQL query generator. Your task is to convert natural language questions into valid PostgreSQL SQL queries.
+        The database contains {tables}, with the following schemas and relationship:
+
+        {schema_info}
+
+        Important Rules:
+        1.  Generate only the SQL query, without any additional text, explanations, or backticks.
+        2.  Do NOT use any SQL functions or syntax that are not standard PostgreSQL.
+        3.  Do NOT include comments in the SQL query.
+        4.  Always select all relevant columns unless specific columns are requested. Use aliases for clarity (e.g., `{alias}.provider_name`, `sr.overall_rating`).
+        5.  Use `ILIKE` for case-insensitive partial string matches (e.g., `WHERE {alias}.provider_name ILIKE '%hospital%'`).
+        6.  For "cheapest", "most expensive", "highest", "lowest", use `ORDER BY` and `LIMIT`.
+        7.  For "best ratings" or "highest rated", join with `star_rating` and use `ORDER BY sr.overall_rating DESC`.
+        8.  If the query asks for "near me", you can assume a city or state and filter by `{alias}.provider_city` or `{alias}.provider_state` or `{alias}.provider_zip_code`. If no specific location is mentioned, do not add location filters.
+        9.  Ensure column names in the query exactly match the schema, and only query the tables listed above.
+        10. If the query is ambiguous or cannot be translated to a meaningful SQL query given the schema, return a simple SELECT statement like `{fallback_query}` or indicate that it's not possible.
+        11. When joining tables, use `LEFT JOIN` to ensure all relevant records from the primary table (e.g., `{detail_table}`) are included even if there's no matching data in the joined table.
+        12. If a query implies unique providers (e.g., "cheapest hospital"), you might need to use `DISTINCT` on `provider_id` or `GROUP BY provider_id` and aggregate other fields, but generally, selecting from `{detail_table}` and joining `star_rating` is sufficient.
+        13. For averages, minimums, maximums or counts per DRG and state, and for ratings per state or city, query the precomputed drg_state_stats and provider_rating_stats tables rather than aggregating the detail rows.
+        14. **VERY IMPORTANT:** If the natural language query is completely irrelevant to hospital pricing, quality, medical procedures, or hospital data (e.g., "What's the weather today?", "Tell me a joke"), return the exact string "IRRELEVANT_QUERY_SIGNAL" and nothing else.
+
+        Examples:
+        {examples}{aggregate_examples}
+        The natural language query is the user message. Reply with its SQL query only.
+"""
+
+SQL_BATCH_INSTRUCTIONS = """
+        Several questions are asked at once: the user message is a JSON object mapping question ids to natural language queries.
+        Reply with a JSON object mapping every id to the SQL query for its question, or to "IRRELEVANT_QUERY_SIGNAL", following all of the rules above.
+"""
+
+SUMMARY_PROMPT = """
+        You are a helpful assistant that summarizes hospital data.
+        The user message holds the question a user asked and the data found for it.
+
+        Please summarize this information in a concise, conversational, and user-friendly sentence or two.
+        Focus on the key findings relevant to the user's original question.
+        If there are multiple results, mention the top few most relevant ones.
+        Include specific details like hospital names, ratings, and relevant procedure names if available.
+        For ratings, if they are floats, round them to one decimal place.
+        If there are many results, summarize the most important ones without listing all.
+
+        Examples:
+        - Original Query: "Who has the best ratings for heart surgery near 10032?"
+          Results: [{'provider_name': 'Mount Sinai Hospital', 'overall_rating': 9}, {'provider_name': 'NYU Langone', 'overall_rating': 8.5}]
+          Summary: Based on data, Mount Sinai Hospital (rating: 9/10) and NYU Langone (rating: 8.5/10) have the highest ratings for cardiac procedures near 10032.
+
+        - Original Query: "What's the cheapest hospital for knee replacement?"
+          Results: [{'provider_name': 'Community Hospital', 'average_covered_charges': 25000}]
+          Summary: The cheapest hospital for knee replacement found is Community Hospital with average covered charges of $25,000.
+"""
+
 
 class AIService:
-    def __init__(self, api_key: str):
-        self.client = AsyncOpenAI(api_key=api_key)
+    def __init__(self, api_key: str, schema_mode: str = SCHEMA_MODE, client=None, sql_cache: Optional[SqlCache] = None):
+        # `client` takes anything with the AsyncOpenAI chat.completions.create interface, e.g. a local fake
+        self._client = client
+        self._api_key = api_key
         self.model = "gpt-4o"
+        self.schema_mode = schema_mode
+        if sql_cache is None and SQL_CACHE_ENABLED:
+            sql_cache = SqlCache(SQL_CACHE_SIZE, SQL_CACHE_TTL_SECONDS, SQL_CACHE_SIMILARITY)
+        self.sql_cache = sql_cache
+
+        # Rendered once: every SQL request starts with the same long prefix, which the provider can cache
+        schema_info = self._get_provider_data_schema()
+        if schema_mode == "normalized":
+            tables, examples = "'provider', 'drg', 'provider_drg' and 'star_rating'", NORMALIZED_EXAMPLES
+            alias, detail_table = "p", "provider_drg"
+            fallback_query = "SELECT p.provider_id, p.provider_name, p.provider_city, p.provider_state FROM provider AS p LIMIT 10;"
+        else:
+            tables, examples = "two tables: 'hospital_data' and 'star_rating'", FLAT_EXAMPLES
+            alias, detail_table = "hd", "hospital_data"
+            fallback_query = "SELECT * FROM hospital_data LIMIT 10;"
+        self.sql_prompt = SQL_PROMPT.format(tables=tables, schema_info=schema_info, examples=examples,
+                                            aggregate_examples=AGGREGATE_EXAMPLES, alias=alias,
+                                            detail_table=detail_table, fallback_query=fallback_query)
+        self._schema_key = f"{self.model}\n{schema_info}"
+
+        self.llm_calls = 0
+        self._single_flight = SingleFlight() if LLM_COALESCING_ENABLED else None
+        self._streams: Dict[str, SharedStream] = {}
+        self._coalesced_streams = 0
+        self._sql_batcher = None
+        if LLM_BATCH_WINDOW_MS > 0 and LLM_BATCH_MAX_SIZE > 1:
+            self._sql_batcher = MicroBatcher(self._generate_sql_batch, LLM_BATCH_WINDOW_MS / 1000, LLM_BATCH_MAX_SIZE)
+
+    @property
+    def client(self):
+        # The openai package takes most of a second to import, so it is imported with the first call
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=self._api_key)
+        return self._client
 
     def _get_provider_data_schema(self) -> str:
         """
@@ -16,7 +245,12 @@ class AIService:
         - ms_drg_definition (from ms_drg_defination)
         - provider_zip_code (from provider_zip)
         - overall_rating (from rating)
+        In the normalized schema mode the provider, drg and provider_drg tables replace hospital_data.
+        The precomputed aggregate tables are listed in both modes.
         """
+        if self.schema_mode == "normalized":
+            return NORMALIZED_SCHEMA + AGGREGATE_SCHEMA
+
         schema = """
         Table Name: hospital_data
         Columns:
@@ -31,6 +265,7 @@ class AIService:
         - average_covered_charges: REAL (Float)
         - average_total_payments: REAL (Float)
         - average_medicare_payments: REAL (Float)
+        - content_hash: TEXT (Internal change-detection hash used by uploads, never useful in answers)
         Description: This table contains all information about healthcare providers and their specific DRG procedures.
 
         Table Name: star_rating
@@ -38,12 +273,34 @@ class AIService:
         - id: INTEGER (Primary Key, auto-increment)
         - provider_id: INTEGER (Refers to hospital_data.provider_id. Unique in this table to give one rating per provider.)
         - overall_rating: INTEGER (Rating from 1 to 10)
+        - content_hash: TEXT (Internal change-detection hash used by uploads, never useful in answers)
         Description: This table stores mock quality ratings for providers, linked by provider_id.
 
         Relationship: hospital_data.provider_id = star_rating.provider_id (Conceptual join, not a database-enforced foreign key due to hospital_data.provider_id not being unique)
 
         """
-        return schema
+        return schema + AGGREGATE_SCHEMA
+
+    async def _create(self, **kwargs):
+        self.llm_calls += 1
+        return await self.client.chat.completions.create(model=self.model, **kwargs)
+
+    async def _coalesce(self, key, call):
+        if self._single_flight is None:
+            return await call()
+        return await self._single_flight.run(key, call)
+
+    def llm_stats(self) -> Dict[str, Any]:
+        """
+        LLM calls made and the ones saved by coalescing and batching.
+        """
+        coalesced = self._coalesced_streams + (self._single_flight.coalesced if self._single_flight is not None else 0)
+        stats = {"llm_calls": self.llm_calls, "coalescing": self._single_flight is not None, "coalesced_calls": coalesced,
+                 "batch_window_ms": LLM_BATCH_WINDOW_MS if self._sql_batcher is not None else 0}
+        if self._sql_batcher is not None:
+            stats["batches"] = self._sql_batcher.batches
+            stats["batched_questions"] = self._sql_batcher.batched_items
+        return stats
 
     async def generate_sql_query(self, natural_language_query: str) -> str:
         """
@@ -51,111 +308,155 @@ class AIService:
         for the 'hospital_data' and 'star_rating' tables.
         If the query is irrelevant, it returns a specific signal string.
         Corrected column names in prompt and examples to match models.py.
+        Repeated and near-identical questions are answered from the SQL cache without an LLM call,
+        concurrent identical ones share a single call and, with LLM_BATCH_WINDOW_MS set, distinct
+        ones arriving together are generated in one call.
         """
-        schema_info = self._get_provider_data_schema()
+        started = time.perf_counter()
+        if self.sql_cache is not None:
+            # Generated SQL is only valid for the schema and model that produced it
+            self.sql_cache.set_schema(self._schema_key)
+            cached_sql, tier = self.sql_cache.get(natural_language_query)
+            if cached_sql is not None:
+                self.sql_cache.record(tier, time.perf_counter() - started)
+                return cached_sql
 
-        prompt = f"""
-        You are a SQL query generator. Your task is to convert natural language questions into valid PostgreSQL SQL queries.
-        The database contains two tables: 'hospital_data' and 'star_rating', with the following schemas and relationship:
-
-        {schema_info}
-
-        Important Rules:
-        1.  Generate only the SQL query, without any additional text, explanations, or backticks.
-        2.  Do NOT use any SQL functions or syntax that are not standard PostgreSQL.
-        3.  Do NOT include comments in the SQL query.
-        4.  Always select all relevant columns unless specific columns are requested. Use aliases for clarity (e.g., `hd.provider_name`, `sr.overall_rating`).
-        5.  Use `ILIKE` for case-insensitive partial string matches (e.g., `WHERE hd.provider_name ILIKE '%hospital%'`).
-        6.  For "cheapest", "most expensive", "highest", "lowest", use `ORDER BY` and `LIMIT`.
-        7.  For "best ratings" or "highest rated", join with `star_rating` and use `ORDER BY sr.overall_rating DESC`.
-        8.  If the query asks for "near me", you can assume a city or state and filter by `hd.provider_city` or `hd.provider_state` or `hd.provider_zip_code`. If no specific location is mentioned, do not add location filters.
-        9.  Ensure column names in the query exactly match the schema.
-        10. If the query is ambiguous or cannot be translated to a meaningful SQL query given the schema, return a simple SELECT statement like `SELECT * FROM hospital_data LIMIT 10;` or indicate that it's not possible.
-        11. When joining tables, use `LEFT JOIN` to ensure all relevant records from the primary table (e.g., `hospital_data`) are included even if there's no matching data in the joined table.
-        12. If a query implies unique providers (e.g., "cheapest hospital"), you might need to use `DISTINCT` on `provider_id` or `GROUP BY provider_id` and aggregate other fields, but generally, selecting from `hospital_data` and joining `star_rating` is sufficient.
-        13. **VERY IMPORTANT:** If the natural language query is completely irrelevant to hospital pricing, quality, medical procedures, or hospital data (e.g., "What's the weather today?", "Tell me a joke"), return the exact string "IRRELEVANT_QUERY_SIGNAL" and nothing else.
-
-        Examples:
-        - "What's the cheapest hospital for knee replacement?"
-          SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.average_covered_charges FROM hospital_data AS hd WHERE hd.ms_drg_definition ILIKE '%KNEE REPLACEMENT%' ORDER BY hd.average_covered_charges ASC LIMIT 1;
-
-        - "Which hospitals have the highest total discharges for heart surgery?"
-          SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.total_discharges FROM hospital_data AS hd WHERE hd.ms_drg_definition ILIKE '%HEART SURGERY%' ORDER BY hd.total_discharges DESC LIMIT 5;
-
-        - "Show me all providers in New York with their ratings."
-          SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.provider_state, sr.overall_rating FROM hospital_data AS hd LEFT JOIN star_rating AS sr ON hd.provider_id = sr.provider_id WHERE hd.provider_state = 'NY' LIMIT 10;
+        try:
+            # Same key as the exact cache tier, so questions that differ in an operator never share a call
+            sql_query = await self._coalesce(("sql", question_key(natural_language_query)),
+                                             lambda: self._generate_uncached(natural_language_query))
+            if self.sql_cache is not None:
+                self.sql_cache.record(None, time.perf_counter() - started)
+            return sql_query
+        except Exception as e:
+            print(f"Error generating SQL query with OpenAI: {e}")
+            raise
 
-        - "List the highest rated hospitals for cancer treatment."
-          SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.ms_drg_definition, sr.overall_rating FROM hospital_data AS hd LEFT JOIN star_rating AS sr ON hd.provider_id = sr.provider_id WHERE hd.ms_drg_definition ILIKE '%CANCER TREATMENT%' ORDER BY sr.overall_rating DESC LIMIT 5;
+    async def _generate_uncached(self, natural_language_query: str) -> str:
+        if self._sql_batcher is not None:
+            sql_query = await self._sql_batcher.submit(natural_language_query)
+        else:
+            sql_query = await self._complete_sql(natural_language_query)
+        if self.sql_cache is not None:
+            self.sql_cache.put(natural_language_query, sql_query)
+        return sql_query
 
-        Natural Language Query: {natural_language_query}
+    async def _complete_sql(self, natural_language_query: str) -> str:
+        response = await self._create(
+            messages=[
+                {"role": "system", "content": self.sql_prompt},
+                {"role": "user", "content": natural_language_query}
+            ],
+            max_tokens=150,
+            temperature=0.0
+        )
+        return response.choices[0].message.content.strip()
 
-        SQL Query:
+    async def _generate_sql_batch(self, questions: List[str]) -> List[Union[str, Exception]]:
         """
+        SQL for several questions from one JSON-mode call. Questions the reply leaves out, or a reply
+        that cannot be parsed, fall back to one call per question.
+        """
+        if len(questions) == 1:
+            return [await self._complete_sql(questions[0])]
 
+        answers = {}
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
+            response = await self._create(
                 messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": natural_language_query}
+                    {"role": "system", "content": self.sql_prompt + SQL_BATCH_INSTRUCTIONS},
+                    {"role": "user", "content": json.dumps({str(i + 1): q for i, q in enumerate(questions)})}
                 ],
-                max_tokens=150,
-                temperature=0.0
+                max_tokens=150 * len(questions),
+                temperature=0.0,
+                response_format={"type": "json_object"}
             )
-            sql_query = response.choices[0].message.content.strip()
-            return sql_query
+            answers = json.loads(response.choices[0].message.content)
         except Exception as e:
-            print(f"Error generating SQL query with OpenAI: {e}")
-            raise
+            logging.warning(f"Error generating batched SQL queries with OpenAI, falling back to single calls: {e}")
+        if not isinstance(answers, dict):
+            answers = {}
+
+        results: List[Union[str, Exception, None]] = []
+        for i in range(len(questions)):
+            sql_query = answers.get(str(i + 1))
+            results.append(sql_query.strip() if isinstance(sql_query, str) and sql_query.strip() else None)
+        missing = [i for i, sql_query in enumerate(results) if sql_query is None]
+        retried = await asyncio.gather(*[self._complete_sql(questions[i]) for i in missing], return_exceptions=True)
+        for i, sql_query in zip(missing, retried):
+            results[i] = sql_query
+        return results
+
+    def _summary_messages(self, original_query: str, query_results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        # Only the first rows reach the model, however many the query returned
+        results_for_summary = query_results[:SUMMARY_MAX_ROWS]
+        results_str = "\n".join([str(row) for row in results_for_summary])
+        total = f" ({len(query_results)} rows in total)" if len(query_results) > len(results_for_summary) else ""
+
+        # The instructions are the same for every summary, only the user message varies
+        return [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f'A user asked the following question: "{original_query}"\n'
+                                        f'You found the following data{total}:\n{results_str}'}
+        ]
 
     async def summarize_results(self, original_query: str, query_results: List[Dict[str, Any]]) -> str:
         """
         Uses an OpenAI model to summarize structured query results into a natural language response.
+        Identical concurrent requests share one call.
         """
         if not query_results:
-            return f"I couldn't find any information for '{original_query}'. Please try a different query."
+            return no_results_message(original_query)
 
-        results_for_summary = query_results[:5]
-        results_str = "\n".join([str(row) for row in results_for_summary])
+        messages = self._summary_messages(original_query, query_results)
+        try:
+            return await self._coalesce(("summary", messages[-1]["content"]), lambda: self._complete_summary(messages))
+        except Exception as e:
+            print(f"Error summarizing results with OpenAI: {e}")
+            return SUMMARY_ERROR_MESSAGE
 
-        summary_prompt = f"""
-        You are a helpful assistant that summarizes hospital data.
-        A user asked the following question: "{original_query}"
-        You found the following data:
-        {results_str}
+    async def _complete_summary(self, messages: List[Dict[str, str]]) -> str:
+        response = await self._create(
+            messages=messages,
+            max_tokens=150,
+            temperature=0.2
+        )
+        return response.choices[0].message.content.strip()
 
-        Please summarize this information in a concise, conversational, and user-friendly sentence or two.
-        Focus on the key findings relevant to the user's original question.
-        If there are multiple results, mention the top few most relevant ones.
-        Include specific details like hospital names, ratings, and relevant procedure names if available.
-        For ratings, if they are floats, round them to one decimal place.
-        If there are many results, summarize the most important ones without listing all.
-
-        Examples:
-        - Original Query: "Who has the best ratings for heart surgery near 10032?"
-          Results: [{{'provider_name': 'Mount Sinai Hospital', 'overall_rating': 9}}, {{'provider_name': 'NYU Langone', 'overall_rating': 8.5}}]
-          Summary: Based on data, Mount Sinai Hospital (rating: 9/10) and NYU Langone (rating: 8.5/10) have the highest ratings for cardiac procedures near 10032.
+    async def stream_summary(self, original_query: str, query_results: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """
+        Same summary as summarize_results, yielded piece by piece as the model produces it.
+        Identical concurrent requests read one stream, replayed from its start to late joiners.
+        Errors are raised to the caller, which has already sent part of the answer.
+        """
+        if not query_results:
+            yield no_results_message(original_query)
+            return
 
-        - Original Query: "What's the cheapest hospital for knee replacement?"
-          Results: [{{'provider_name': 'Community Hospital', 'average_covered_charges': 25000}}]
-          Summary: The cheapest hospital for knee replacement found is Community Hospital with average covered charges of $25,000.
+        messages = self._summary_messages(original_query, query_results)
+        if self._single_flight is None:
+            async for token in self._stream_tokens(messages):
+                yield token
+            return
 
-        Summary:
-        """
+        key = messages[-1]["content"]
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = SharedStream(self._stream_tokens(messages))
+            self._streams[key] = stream
+            stream.add_done_callback(lambda _: self._streams.pop(key) if self._streams.get(key) is stream else None)
+        else:
+            self._coalesced_streams += 1
+        async for token in stream.subscribe():
+            yield token
 
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": summary_prompt},
-                    {"role": "user", "content": f"Summarize the data for the query: '{original_query}' and results: {query_results}"}
-                ],
-                max_tokens=150,
-                temperature=0.2
-            )
-            summary = response.choices[0].message.content.strip()
-            return summary
-        except Exception as e:
-            print(f"Error summarizing results with OpenAI: {e}")
-            return "I encountered an error while trying to summarize the results. Please try again."
\ No newline at end of file
+    async def _stream_tokens(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        stream = await self._create(
+            messages=messages,
+            max_tokens=150,
+            temperature=0.2,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
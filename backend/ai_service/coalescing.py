@@ -0,0 +1,137 @@
+# coalescing.py
+"""
+Primitives that cut the number of LLM calls under bursty load, for use on one event loop.
+
+- SingleFlight: concurrent calls with the same key share one in-flight call and its result or error.
+- SharedStream: one streamed answer replayed to every subscriber, from its first token, however late
+  the subscriber joins.
+- MicroBatcher: items submitted within `window` seconds of the first pending one, at most `max_size`,
+  are handed to one batch call together.
+
+A caller that is cancelled stops waiting, but the shared call runs to completion for the others.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(call())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()  # retrieved here, so an error nobody awaited any more is not logged as lost
+
+
+class SharedStream:
+    """
+    Reads `source` once in a background task and replays its items to every subscriber.
+    """
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.items: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        # Wake everyone waiting on the current event and give later waiters a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def add_done_callback(self, callback: Callable[[asyncio.Future], None]):
+        self._task.add_done_callback(callback)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.items):
+                yield self.items[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            if changed is self._changed:
+                await changed.wait()
+
+
+class MicroBatcher:
+    """
+    `run_batch` receives the items of a batch and returns one result per item, in order; a result that
+    is an exception is raised to that item's caller only.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Awaitable[List[Any]]], window: float, max_size: int):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.batched_items = 0
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        # Callers that gave up while waiting for the window are left out
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)  # the loop only keeps weak references to tasks
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.batched_items += len(batch)
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
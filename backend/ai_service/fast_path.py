@@ -0,0 +1,396 @@
+# fast_path.py
+"""
+Deterministic router for templated questions, in front of the LLM.
+
+Questions such as "cheapest hospital for knee replacement in NY", "top rated hospitals in Dothan" or
+"average cost of hip replacement at <provider>" are matched against a few intent patterns. Their slots
+(DRG phrase, state, city, ZIP code, provider name) are resolved against dictionaries loaded from the
+data itself, and the intent emits parameterized SQL plus a template for the answer. Nothing is guessed:
+a question whose slots do not all resolve is left to the LLM, so the fast path only ever answers
+questions it understands completely.
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ai_service.sql_cache import normalize_question
+from drg_search import DrgDictionary
+from models.models import HospitalData, Provider, SCHEMA_MODE
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+# Answer fast-path questions from a template; when off their rows are summarized by the LLM as usual
+FAST_PATH_TEMPLATE_ANSWERS = os.getenv("FAST_PATH_TEMPLATE_ANSWERS", "true").lower() in ("1", "true", "yes")
+
+STATE_NAMES = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas", "CA": "California", "CO": "Colorado",
+    "CT": "Connecticut", "DE": "Delaware", "DC": "District of Columbia", "FL": "Florida", "GA": "Georgia",
+    "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois", "IN": "Indiana", "IA": "Iowa", "KS": "Kansas",
+    "KY": "Kentucky", "LA": "Louisiana", "ME": "Maine", "MD": "Maryland", "MA": "Massachusetts",
+    "MI": "Michigan", "MN": "Minnesota", "MS": "Mississippi", "MO": "Missouri", "MT": "Montana",
+    "NE": "Nebraska", "NV": "Nevada", "NH": "New Hampshire", "NJ": "New Jersey", "NM": "New Mexico",
+    "NY": "New York", "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio", "OK": "Oklahoma",
+    "OR": "Oregon", "PA": "Pennsylvania", "PR": "Puerto Rico", "RI": "Rhode Island", "SC": "South Carolina",
+    "SD": "South Dakota", "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont", "VA": "Virginia",
+    "WA": "Washington", "WV": "West Virginia", "WI": "Wisconsin", "WY": "Wyoming",
+}
+_STATE_BY_NAME = {name.lower(): code for code, name in STATE_NAMES.items()}
+# Phrases after "in" or "near" that are not places; "me" would otherwise resolve to Maine
+_NOT_LOCATIONS = {"me", "us", "here", "my area"}
+_DRG_FILLER = {"a", "an", "the", "for", "of", "procedure", "procedures", "treatment", "treatments"}
+_ZIP = re.compile(r"^\d{5}$")
+
+_PREFIX = (r"^(?:(?:what|which|who) (?:is|are|s|has|have) |whats |find |show(?: me)? |list |tell me |give me "
+           r"|i need |im looking for )?(?:the |a )?")
+_HOSPITAL = r"(?:hospitals?|providers?|places?|options?|facilit(?:y|ies))"
+
+# (intent, pattern); the named groups are the raw slots, resolved by FastPathRouter
+_PATTERNS = [
+    ("cheapest", re.compile(
+        _PREFIX + rf"(?:cheapest|least expensive|lowest cost|lowest priced|most affordable)(?: {_HOSPITAL})? "
+        r"(?:for|to get|to have) (?P<rest>.+)$")),
+    ("top_rated", re.compile(
+        _PREFIX + rf"(?:top|best|top rated|best rated|highest rated)(?: (?P<count>\d{{1,2}}))?(?: rated)? {_HOSPITAL}"
+        r"(?: (?P<rest>(?:for|in|near|around) .+))?$")),
+    ("average_cost", re.compile(
+        _PREFIX + r"(?:average|avg|typical|mean) (?:cost|price|charge|charges|covered charges|payment|payments) "
+        r"(?:of|for) (?P<rest>.+)$")),
+    ("average_cost", re.compile(
+        r"^how much (?:does|do|is|would) (?:a |an |the )?(?P<rest>.+?) (?:cost|costs|run)(?P<tail>(?: (?:at|in|near|around) .+)?)$")),
+]
+
+
+@dataclass
+class Location:
+    description: str
+    column: str  # provider_state, provider_city or provider_zip_code
+    value: Any
+    state: Optional[str] = None
+
+
+@dataclass
+class Route:
+    """
+    A question the fast path answers: SQL with bound parameters and the template for its answer.
+    """
+    intent: str
+    sql: str
+    params: Dict[str, Any]
+    slots: Dict[str, str]
+    template: Callable[["Route", List[Dict[str, Any]]], str] = field(repr=False)
+
+    def answer(self, rows: List[Dict[str, Any]]) -> str:
+        return self.template(self, rows)
+
+
+class Vocabulary:
+    """
+    DRG descriptions, cities and provider names of the loaded data, keyed by their normalized form.
+    """
+
+    def __init__(self, drgs: DrgDictionary, cities: List[Tuple[str, str]], providers: List[Tuple[int, str]]):
+        self.drgs = drgs
+        self.cities: Dict[str, List[Tuple[str, str]]] = {}
+        for city, state in set(cities):
+            if city:
+                self.cities.setdefault(normalize_question(city), []).append((city, state))
+        self.providers: Dict[str, List[Tuple[int, str]]] = {}
+        for provider_id, name in set(providers):
+            if name:
+                self.providers.setdefault(normalize_question(name), []).append((provider_id, name))
+
+    @classmethod
+    def from_db(cls, db: Session, schema_mode: str = SCHEMA_MODE) -> "Vocabulary":
+        table = Provider if schema_mode == "normalized" else HospitalData
+        cities = db.query(table.provider_city, table.provider_state).distinct().all()
+        providers = db.query(table.provider_id, table.provider_name).distinct().all()
+        return cls(DrgDictionary.from_db(db, schema_mode), [tuple(r) for r in cities], [tuple(r) for r in providers])
+
+    def resolve_drgs(self, phrase: str) -> List[Tuple[str, Optional[int]]]:
+        return self.drgs.resolve_words([w for w in phrase.split() if w not in _DRG_FILLER])
+
+    def resolve_location(self, phrase: str) -> Optional[Location]:
+        """
+        Resolves a ZIP code, a state (code or name) or a known city, optionally followed by its state.
+        """
+        phrase = phrase.removeprefix("the ").strip()
+        if not phrase or phrase in _NOT_LOCATIONS:
+            return None
+        if _ZIP.match(phrase):
+            return Location(f"ZIP code {phrase}", "provider_zip_code", phrase)
+        code = phrase.upper() if phrase.upper() in STATE_NAMES else _STATE_BY_NAME.get(phrase)
+        if code is not None:
+            return Location(STATE_NAMES[code], "provider_state", code)
+
+        city, state_code = phrase, None
+        head, _, last = phrase.rpartition(" ")
+        if head and last.upper() in STATE_NAMES:
+            city, state_code = head, last.upper()
+        else:
+            for name, code in _STATE_BY_NAME.items():
+                if phrase.endswith(" " + name):
+                    city, state_code = phrase[: -len(name) - 1], code
+                    break
+        matches = self.cities.get(city) or self.cities.get(city.removesuffix(" city"), [])
+        if state_code is not None:
+            matches = [(c, s) for c, s in matches if s == state_code]
+        if not matches:
+            return None
+        stored_city = matches[0][0]
+        states = sorted({s for _, s in matches})
+        if len(states) == 1:
+            return Location(f"{stored_city.title()}, {states[0]}", "provider_city", stored_city, states[0])
+        return Location(stored_city.title(), "provider_city", stored_city)
+
+    def resolve_provider(self, phrase: str) -> List[Tuple[int, str]]:
+        return self.providers.get(phrase) or self.providers.get(phrase.removeprefix("the "), [])
+
+
+def _money(value) -> str:
+    return f"${float(value):,.0f}" if value is not None else "an unknown amount"
+
+
+def _where_text(route: Route) -> str:
+    if "provider" in route.slots:
+        return f" at {route.slots['provider']}"
+    if "location" in route.slots:
+        return f" in {route.slots['location']}"
+    return ""
+
+
+def _cheapest_answer(route: Route, rows: List[Dict[str, Any]]) -> str:
+    seen, providers = set(), []
+    for row in rows:
+        if row["provider_id"] not in seen:
+            seen.add(row["provider_id"])
+            providers.append(row)
+    first = providers[0]
+    answer = (f"The cheapest hospital for {route.slots['drg']}{_where_text(route)} is {first['provider_name']} in "
+              f"{str(first['provider_city']).title()}, {first['provider_state']}, with average covered charges of "
+              f"{_money(first['average_covered_charges'])} ({first['ms_drg_definition']}).")
+    others = [f"{row['provider_name']} ({_money(row['average_covered_charges'])})" for row in providers[1:3]]
+    if others:
+        answer += f" Next are {' and '.join(others)}." if len(others) > 1 else f" Next is {others[0]}."
+    return answer
+
+
+def _top_rated_answer(route: Route, rows: List[Dict[str, Any]]) -> str:
+    listed = [f"{row['provider_name']} ({row['overall_rating']}/10)" for row in rows]
+    names = listed[0] if len(listed) == 1 else ", ".join(listed[:-1]) + f" and {listed[-1]}"
+    drg = f" for {route.slots['drg']}" if "drg" in route.slots else ""
+    verb = "is" if len(listed) == 1 else "are"
+    return f"The highest rated hospital{'' if len(listed) == 1 else 's'}{drg}{_where_text(route)} {verb} {names}."
+
+
+def _average_cost_answer(route: Route, rows: List[Dict[str, Any]]) -> str:
+    row = rows[0]
+    if not row["matching_rows"]:
+        return f"I couldn't find any {route.slots['drg']} records{_where_text(route)}."
+    records = "record" if row["matching_rows"] == 1 else "records"
+    return (f"Across {row['matching_rows']:,} {route.slots['drg']} {records}{_where_text(route)}, the average covered "
+            f"charges are {_money(row['average_covered_charges'])} and the average total payment is "
+            f"{_money(row['average_total_payments'])}, of which Medicare pays {_money(row['average_medicare_payments'])} on average.")
+
+
+@dataclass
+class _IntentStats:
+    answered: int = 0
+    seconds: float = 0.0
+
+
+class FastPathRouter:
+    """
+    Matches questions against the intent patterns. Safe to share between threads; the vocabulary is
+    reloaded by refresh() whenever the data version it was read at is outdated, and questions are routed
+    with the previous one until the new one is swapped in.
+    """
+
+    def __init__(self, schema_mode: str = SCHEMA_MODE, vocabulary: Optional[Vocabulary] = None):
+        self.schema_mode = schema_mode
+        self.vocabulary = vocabulary
+        self.data_version: Optional[int] = None
+        self._intents: Dict[Optional[str], _IntentStats] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, db: Session, data_version: Optional[int] = None):
+        # One rebuild at a time; a caller that waited for another's rebuild of the same version skips its own
+        with self._refresh_lock:
+            if data_version is not None and self.vocabulary is not None and self.data_version == data_version:
+                return
+            vocabulary = Vocabulary.from_db(db, self.schema_mode)
+            self.vocabulary, self.data_version = vocabulary, data_version
+
+    def route(self, question: str) -> Optional[Route]:
+        if self.vocabulary is None:
+            return None
+        normalized = normalize_question(question)
+        for intent, pattern in _PATTERNS:
+            match = pattern.match(normalized)
+            if match is None:
+                continue
+            route = getattr(self, f"_{intent}")(match)
+            if route is not None:
+                return route
+        return None
+
+    def _split(self, rest: str, with_provider: bool = False) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Splits "<drg phrase> in <location>" / "<drg phrase> at <provider>" at the rightmost preposition
+        whose tail resolves. Returns (drg phrase, {"location": Location} or {"provider": [...]} or {}).
+        """
+        prepositions = ("in", "near", "around") + (("at",) if with_provider else ())
+        words = rest.split()
+        for i in range(len(words) - 2, 0, -1):
+            if words[i] not in prepositions:
+                continue
+            head, tail = " ".join(words[:i]), " ".join(words[i + 1:])
+            if words[i] == "at":
+                providers = self.vocabulary.resolve_provider(tail)
+                if providers:
+                    return head, {"provider": providers}
+            else:
+                location = self.vocabulary.resolve_location(tail)
+                if location is not None:
+                    return head, {"location": location}
+        return rest, {}
+
+    def _filters(self, where: Dict[str, Any], alias: str, params: Dict[str, Any], slots: Dict[str, str]) -> List[str]:
+        clauses = []
+        if "location" in where:
+            location = where["location"]
+            clauses.append(f"{alias}.{location.column} = :location")
+            params["location"] = location.value
+            if location.state is not None:
+                clauses.append(f"{alias}.provider_state = :state")
+                params["state"] = location.state
+            slots["location"] = location.description
+        if "provider" in where:
+            clauses.append(f"{alias}.provider_id IN :provider_ids")
+            params["provider_ids"] = sorted(provider_id for provider_id, _ in where["provider"])
+            slots["provider"] = where["provider"][0][1]
+        return clauses
+
+    def _drg_clause(self, phrase: str, params: Dict[str, Any], slots: Dict[str, str]) -> Optional[str]:
+        entries = self.vocabulary.resolve_drgs(phrase)
+        if not entries:
+            return None
+        slots["drg"] = phrase
+        if self.schema_mode == "normalized":
+            params["drg_ids"] = [drg_id for _, drg_id in entries]
+            return "pd.drg_id IN :drg_ids"
+        params["drgs"] = [description for description, _ in entries]
+        return "hd.ms_drg_definition IN :drgs"
+
+    def _cheapest(self, match) -> Optional[Route]:
+        phrase, where = self._split(match.group("rest"))
+        params, slots = {}, {}
+        drg = self._drg_clause(phrase, params, slots)
+        if drg is None:
+            return None
+        if self.schema_mode == "normalized":
+            clauses = [drg] + self._filters(where, "p", params, slots)
+            sql = ("SELECT p.provider_id, p.provider_name, p.provider_city, p.provider_state, d.ms_drg_definition, "
+                   "pd.average_covered_charges, pd.average_total_payments FROM provider_drg AS pd "
+                   "JOIN provider AS p ON p.provider_id = pd.provider_id JOIN drg AS d ON d.drg_id = pd.drg_id "
+                   f"WHERE {' AND '.join(clauses)} AND pd.average_covered_charges IS NOT NULL "
+                   "ORDER BY pd.average_covered_charges ASC, p.provider_id LIMIT 10")
+        else:
+            clauses = [drg] + self._filters(where, "hd", params, slots)
+            sql = ("SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.provider_state, hd.ms_drg_definition, "
+                   "hd.average_covered_charges, hd.average_total_payments FROM hospital_data AS hd "
+                   f"WHERE {' AND '.join(clauses)} AND hd.average_covered_charges IS NOT NULL "
+                   "ORDER BY hd.average_covered_charges ASC, hd.provider_id LIMIT 10")
+        return Route("cheapest", sql, params, slots, _cheapest_answer)
+
+    def _top_rated(self, match) -> Optional[Route]:
+        params, slots, clauses = {"limit": min(int(match.group("count") or 5), 20)}, {}, []
+        rest = match.group("rest")
+        if rest is not None:
+            first, _, remainder = rest.partition(" ")
+            if first == "for":
+                phrase, where = self._split(remainder)
+                drg = self._drg_clause(phrase, params, slots)
+                if drg is None:
+                    return None
+                clauses.append(drg)
+            else:
+                location = self.vocabulary.resolve_location(remainder)
+                if location is None:
+                    return None
+                where = {"location": location}
+        else:
+            where = {}
+
+        if self.schema_mode == "normalized":
+            clauses = [f"EXISTS (SELECT 1 FROM provider_drg AS pd WHERE pd.provider_id = p.provider_id AND {c})"
+                       for c in clauses] + self._filters(where, "p", params, slots)
+            sql = ("SELECT p.provider_id, p.provider_name, p.provider_city, p.provider_state, sr.overall_rating "
+                   "FROM provider AS p JOIN star_rating AS sr ON sr.provider_id = p.provider_id "
+                   f"{'WHERE ' + ' AND '.join(clauses) + ' ' if clauses else ''}"
+                   "ORDER BY sr.overall_rating DESC, p.provider_name, p.provider_id LIMIT :limit")
+        else:
+            clauses += self._filters(where, "hd", params, slots)
+            sql = ("SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.provider_state, sr.overall_rating "
+                   "FROM (SELECT DISTINCT provider_id, provider_name, provider_city, provider_state FROM hospital_data AS hd "
+                   f"{'WHERE ' + ' AND '.join(clauses) if clauses else ''}) AS hd "
+                   "JOIN star_rating AS sr ON sr.provider_id = hd.provider_id "
+                   "ORDER BY sr.overall_rating DESC, hd.provider_name, hd.provider_id LIMIT :limit")
+        return Route("top_rated", sql, params, slots, _top_rated_answer)
+
+    def _average_cost(self, match) -> Optional[Route]:
+        rest = match.group("rest") + (match.groupdict().get("tail") or "")
+        phrase, where = self._split(rest, with_provider=True)
+        if not where:
+            return None
+        params, slots = {}, {}
+        drg = self._drg_clause(phrase, params, slots)
+        if drg is None:
+            return None
+        aggregates = ("COUNT(*) AS matching_rows, SUM({a}.total_discharges) AS total_discharges, "
+                      "AVG({a}.average_covered_charges) AS average_covered_charges, "
+                      "AVG({a}.average_total_payments) AS average_total_payments, "
+                      "AVG({a}.average_medicare_payments) AS average_medicare_payments")
+        if self.schema_mode == "normalized":
+            clauses = [drg] + self._filters(where, "p", params, slots)
+            sql = (f"SELECT {aggregates.format(a='pd')} FROM provider_drg AS pd "
+                   f"JOIN provider AS p ON p.provider_id = pd.provider_id WHERE {' AND '.join(clauses)}")
+        else:
+            clauses = [drg] + self._filters(where, "hd", params, slots)
+            sql = f"SELECT {aggregates.format(a='hd')} FROM hospital_data AS hd WHERE {' AND '.join(clauses)}"
+        return Route("average_cost", sql, params, slots, _average_cost_answer)
+
+    def record(self, intent: Optional[str], seconds: float):
+        """
+        Records the end-to-end time of one answered question; intent None means it went to the LLM.
+        """
+        with self._lock:
+            stats = self._intents.setdefault(intent, _IntentStats())
+            stats.answered += 1
+            stats.seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            llm = self._intents.get(None, _IntentStats())
+            fast = {intent: s for intent, s in self._intents.items() if intent is not None}
+        fast_answered = sum(s.answered for s in fast.values())
+        fast_seconds = sum(s.seconds for s in fast.values())
+        questions = fast_answered + llm.answered
+        avg_fast = fast_seconds / fast_answered if fast_answered else None
+        avg_llm = llm.seconds / llm.answered if llm.answered else None
+        return {
+            "questions": questions,
+            "fast_path": fast_answered,
+            "llm": llm.answered,
+            "hit_rate": round(fast_answered / questions, 4) if questions else 0.0,
+            "by_intent": {intent: s.answered for intent, s in sorted(fast.items())},
+            "avg_fast_path_ms": round(avg_fast * 1000, 1) if avg_fast is not None else None,
+            "avg_llm_ms": round(avg_llm * 1000, 1) if avg_llm is not None else None,
+            # What the fast-path questions would have cost at the average LLM-path latency
+            "estimated_seconds_saved": round(fast_answered * (avg_llm - avg_fast), 3)
+            if avg_fast is not None and avg_llm is not None else None,
+        }
@@ -0,0 +1,227 @@
+# sql_cache.py
+"""
+Cache in front of AIService.generate_sql_query.
+
+Two tiers, both answered without an LLM call:
+- exact: the question, with only case and whitespace folded (question_key), was asked before.
+- similar: a past question is close enough in a hashed character n-gram space (cosine similarity)
+  AND every content word of one question has a near-identical word in the other. The word check is
+  what keeps "knee" from matching "hip" or "NY" from matching "CA", which n-gram similarity alone
+  would happily do; numbers, ZIP codes and comparison operators ("> 50000" vs "< 50000") must match
+  exactly.
+
+Entries expire after a TTL, the least recently used ones are evicted beyond `max_entries`, and the
+whole cache is dropped when the schema prompt changes (a different schema means different SQL).
+"""
+
+import difflib
+import hashlib
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+NGRAM_SIZE = 3
+VECTOR_DIM = 4096
+WORD_MATCH_RATIO = 0.8
+
+STOPWORDS = frozenset("""
+a all an and any are at be by can could do does find for from get give had has have how i in is it list me my
+near of on or please show tell than that the their them there these this to us was what whats where which who
+with would you your
+""".split())
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+_OPERATORS = re.compile(r"<=|>=|!=|<>|[<>=%]")
+
+
+def normalize_question(question: str) -> str:
+    question = _PUNCTUATION.sub(" ", question.lower().replace("'", ""))
+    return _SPACES.sub(" ", question).strip()
+
+
+def question_key(question: str) -> str:
+    """
+    The exact-tier key: `question` lowercased with whitespace collapsed. Unlike normalize_question()
+    it keeps punctuation, which in "charges > 50000" or "rating >= 4.5" changes the SQL.
+    """
+    return _SPACES.sub(" ", question.lower()).strip()
+
+
+def _content_words(question: str, normalized: str) -> FrozenSet[str]:
+    # normalize_question() drops operators, they are kept as words of their own
+    words = {w for w in normalized.split() if w not in STOPWORDS}
+    return frozenset(words.union(_OPERATORS.findall(question)))
+
+
+def _vector(normalized: str) -> np.ndarray:
+    """
+    L2-normalised bag of hashed character n-grams of the padded question.
+    """
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    padded = f" {normalized} "
+    for i in range(len(padded) - NGRAM_SIZE + 1):
+        vector[zlib.crc32(padded[i:i + NGRAM_SIZE].encode()) % VECTOR_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _words_align(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+    """
+    True when every word of `a` has a near-identical word in `b` and vice versa. Typos and plurals
+    align, different words do not, and words containing digits only align with themselves.
+    """
+    def covered(word, others):
+        if word in others:
+            return True
+        if any(c.isdigit() for c in word) or _OPERATORS.fullmatch(word):
+            return False
+        return any(difflib.SequenceMatcher(None, word, other).ratio() >= WORD_MATCH_RATIO for other in others)
+
+    return all(covered(w, b) for w in a) and all(covered(w, a) for w in b)
+
+
+@dataclass
+class _Entry:
+    sql: str
+    words: FrozenSet[str]
+    vector: np.ndarray
+    created_at: float
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    similar_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    hit_seconds: float = 0.0
+    miss_seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def as_dict(self) -> Dict[str, float]:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        hits = self.exact_hits + self.similar_hits
+        return {
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "avg_hit_ms": round(self.hit_seconds / hits * 1000, 3) if hits else None,
+            "avg_miss_ms": round(self.miss_seconds / self.misses * 1000, 3) if self.misses else None,
+        }
+
+
+class SqlCache:
+    """
+    Question -> generated SQL, with an exact and a similarity tier. Safe to share between threads.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400.0, similarity: float = 0.85):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._schema_fingerprint: Optional[str] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_schema(self, schema_text: str):
+        """
+        Drops every entry if `schema_text` differs from the schema the entries were generated for.
+        """
+        fingerprint = hashlib.sha256(schema_text.encode()).hexdigest()
+        with self._lock:
+            if fingerprint != self._schema_fingerprint:
+                if self._entries:
+                    self.stats.invalidations += 1
+                self._entries.clear()
+                self._matrix = None
+                self._schema_fingerprint = fingerprint
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def get(self, question: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns (sql, tier) where tier is "exact" or "similar", or (None, None) on a miss.
+        """
+        key = question_key(question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._fresh(entry, now):
+                    self._entries.move_to_end(key)
+                    return entry.sql, "exact"
+                del self._entries[key]
+                self._matrix = None
+
+            key = self._most_similar(question, now)
+            if key is not None:
+                self._entries.move_to_end(key)
+                return self._entries[key].sql, "similar"
+        return None, None
+
+    def put(self, question: str, sql: str):
+        key, normalized = question_key(question), normalize_question(question)
+        entry = _Entry(sql, _content_words(question, normalized), _vector(normalized), time.monotonic())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+            self._matrix = None
+
+    def record(self, tier: Optional[str], seconds: float):
+        with self.stats._lock:
+            if tier == "exact":
+                self.stats.exact_hits += 1
+            elif tier == "similar":
+                self.stats.similar_hits += 1
+            else:
+                self.stats.misses += 1
+            if tier:
+                self.stats.hit_seconds += seconds
+            else:
+                self.stats.miss_seconds += seconds
+
+    def _fresh(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created_at <= self.ttl_seconds
+
+    def _most_similar(self, question: str, now: float) -> Optional[str]:
+        if not self._entries:
+            return None
+        normalized = normalize_question(question)
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.vstack([self._entries[k].vector for k in self._matrix_keys])
+
+        scores = self._matrix @ _vector(normalized)
+        words = _content_words(question, normalized)
+        # Best scoring candidates first; the word check is the expensive part, so stop at the first that passes
+        for i in np.argsort(-scores):
+            if scores[i] < self.similarity:
+                break
+            entry = self._entries.get(self._matrix_keys[i])
+            if entry is not None and self._fresh(entry, now) and _words_align(words, entry.words):
+                return self._matrix_keys[i]
+        return None
@@ -1,43 +1,45 @@
 import os 
 from typing import Optional
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Query, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Query, Request, status, WebSocket, WebSocketDisconnect
 
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import text
+from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from dotenv import load_dotenv
-from models.models import HospitalData, StarRating, Base
-from etl import process_csv_hospital_data, process_csv_hospital_rating
+from models.models import HospitalData, StarRating, DrgStateStats, DrgProviderStats, ProviderRatingStats
+from database import engine, SessionLocal, DbSession, get_db, session_scope, run_sync, stream_partitions, dispose_engines
+from jobs import UploadJobQueue, DEFAULT_CHUNK_SIZE
+from migrations import migrate
+from geo import get_zip_index, get_provider_locations, refresh_provider_locations, rank
+import numpy as np
+from drg_search import get_drg_dictionary, refresh_drg_dictionary, escape_like
+from provider_search import cheapest_per_provider, decode_cursor, encode_cursor, PROVIDER_CANDIDATE_LIMIT
+from provider_batch import ProviderSearch, parse_searches, read_batch_store, PROVIDER_BATCH_ZIP_FILTER_LIMIT
+from columnar import ColumnarEngine, ColumnarStore, COLUMNAR_ENGINE_ENABLED, COLUMNAR_REFRESH_SECONDS
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import json
+import threading
+import time
 import logging
 import fastapi.middleware.cors
-from math import radians, cos, sin, asin, sqrt
-from geopy.geocoders import Nominatim
 from sqlalchemy import func
-from ai_service.ai_service import AIService
-from typing import List, Dict, Any, Union
+from ai_service.ai_service import AIService, SUMMARY_ERROR_MESSAGE, no_results_message
+from ai_service.fast_path import FastPathRouter, Route, FAST_PATH_ENABLED, FAST_PATH_TEMPLATE_ANSWERS
+from data_version import get_data_version
+from result_cache import ResultCache, json_default
+from sql_sandbox import UnsafeQueryError, run_readonly, validate_sql
+from typing import List, Dict, Any, Tuple, Union
 
 load_dotenv()
 
 
-DATABASE_URL = os.getenv("DATABASE_URL")
 OPENAI_API_KEY = os.getenv("OPEN_AI_API")
 
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY is not set")
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL is not set")
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 app = FastAPI(title="Healthcare Cost Navigator backend", description="API for Healthcare Cost Navigator", version="0.1.0")
 
 app.add_middleware(
@@ -47,179 +49,375 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# The schema is created and migrated by `python migrations.py` before the API starts; true runs it on every startup
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+# Builds the ZIP index, reference data, columnar engine and LLM client in the background after startup
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+
 @app.on_event("startup")
 async def startup_event():
+    if MIGRATE_ON_STARTUP:
+        try:
+            await run_in_threadpool(migrate, engine)
+            logging.info("Database tables created successfully")
+        except Exception as e:
+            logging.error(f"Error creating database tables: {e}")
+            raise
     try:
-        Base.metadata.create_all(bind=engine)
-        logging.info("Database tables created successfully")
+        await run_in_threadpool(_record_reference_version)
     except Exception as e:
-        logging.error(f"Error creating database tables: {e}")
-        raise
+        # The data version watcher keeps trying, so the API recovers once the schema exists
+        logging.error(f"Error reading the data version, has `python migrations.py` been run? {e}")
+    global _data_version_task, _warmup_task
+    _data_version_task = asyncio.create_task(_watch_data_version())
+    if WARMUP_ON_STARTUP:
+        _warmup_task = asyncio.create_task(_warm_up())
 
 
 
 
-@app.post("/upload-hospital-data")
-async def upload_hospital_data(file: UploadFile = File(...), db: Session = Depends(get_db)):
+columnar_engine = ColumnarEngine()
+_data_version_task: Optional[asyncio.Task] = None
+_warmup_task: Optional[asyncio.Task] = None
+# Reported by /ready: finished at once without WARMUP_ON_STARTUP
+_warmup: Dict[str, Any] = {"done": not WARMUP_ON_STARTUP, "steps": {}}
 
-    if not file.filename.endswith(".csv"):
-        raise HTTPException(status_code=400, detail="File must be a CSV file")
-    
+# How often each worker checks for uploads committed through other workers or processes
+DATA_VERSION_POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", str(COLUMNAR_REFRESH_SECONDS)))
+# Data version that this worker's provider locations, DRG dictionary and columnar store reflect
+_reference_version: Optional[int] = None
+_reference_lock = threading.Lock()
+
+
+def _load_columnar_engine(force: bool = False):
+    db = SessionLocal()
+    try:
+        if force:
+            columnar_engine.load(db)
+        else:
+            columnar_engine.refresh_if_stale(db)
+    finally:
+        db.close()
+
+
+def _record_reference_version():
+    global _reference_version
+    db = SessionLocal()
     try:
-        content = await file.read()
+        # Reference data is read lazily from here on, so it reflects at least this version
+        _reference_version = get_data_version(db)
+    finally:
+        db.close()
+
+
+def _refresh_reference_data() -> bool:
+    """
+    Reloads the in-process reference data when an upload, committed through any worker, has moved the
+    data version since it was read. The first worker to get there reads the database, the others map
+    what it published (shared_state.py).
+    """
+    global _reference_version
+    with _reference_lock:
+        db = SessionLocal()
         try:
-            decoded_content = content.decode("utf-8")
-        except UnicodeDecodeError:
-            decoded_content = content.decode("latin1")  # Try a different encoding
-        logging.info("Decoded content: %s", decoded_content)
-        result = await process_csv_hospital_data(decoded_content, db)
-        return result
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            version = get_data_version(db)
+            if version == _reference_version:
+                # Whatever the warm-up did not build, or failed to
+                if COLUMNAR_ENGINE_ENABLED and columnar_engine.store is None:
+                    columnar_engine.load(db)
+                if FAST_PATH_ENABLED and fast_path_router.vocabulary is None:
+                    fast_path_router.refresh(db, version)
+                return False
+            refresh_provider_locations(db)
+            refresh_drg_dictionary(db)
+            if COLUMNAR_ENGINE_ENABLED:
+                # Ratings are part of the columnar store too, so every upload reloads it
+                columnar_engine.refresh_if_stale(db)
+            if FAST_PATH_ENABLED:
+                # Three DISTINCT scans; requests keep routing with the previous vocabulary meanwhile
+                fast_path_router.refresh(db, version)
+            _reference_version = version
+            return True
+        finally:
+            db.close()
+
+
+def _warm_reference_data():
+    db = SessionLocal()
+    try:
+        get_provider_locations(db)
+        get_drg_dictionary(db)
+        version = get_data_version(db)
+        if FAST_PATH_ENABLED and fast_path_router.data_version != version:
+            fast_path_router.refresh(db, version)
+    finally:
+        db.close()
+
 
-@app.post("/upload-hospital-rating")
-async def upload_hospital_rating(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def _warm_up():
+    """
+    Builds what the first requests would otherwise wait for, one step after the other in the thread pool.
+    Requests are served in the meantime and build whatever they need that is not ready yet.
+    """
+    started = time.perf_counter()
+    steps = [("zip_index", get_zip_index), ("reference_data", _warm_reference_data)]
+    if COLUMNAR_ENGINE_ENABLED:
+        # Until it is loaded, /providers answers from SQL
+        steps.append(("columnar_engine", lambda: _load_columnar_engine(force=True)))
+    steps.append(("llm_client", lambda: global_ai_service_instance.client))
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            await run_in_threadpool(step)
+            _warmup["steps"][name] = round(time.perf_counter() - step_started, 3)
+        except Exception as e:
+            # Not fatal: the data version watcher and the request paths build it later
+            logging.error(f"Warm-up step {name} failed: {e}")
+            _warmup["steps"][name] = f"failed: {type(e).__name__}"
+    _warmup["seconds"] = round(time.perf_counter() - started, 3)
+    _warmup["done"] = True
+    logging.info(f"Warm-up finished in {_warmup['seconds']}s")
+
+
+async def _watch_data_version():
+    # Picks up uploads committed through other workers; this one also refreshes in _after_data_load
+    while True:
+        await asyncio.sleep(DATA_VERSION_POLL_SECONDS)
+        try:
+            await run_in_threadpool(_refresh_reference_data)
+        except Exception as e:
+            logging.error(f"Error refreshing reference data: {e}")
+
+
+def _after_data_load(kind: str):
+    # Runs in the API process once a worker has committed an upload
+    _refresh_reference_data()
 
+
+upload_job_queue = UploadJobQueue(SessionLocal, on_success=_after_data_load)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in (_data_version_task, _warmup_task):
+        if task is not None:
+            task.cancel()
+    upload_job_queue.shutdown()
+    await dispose_engines()
+
+
+async def _queue_upload(kind: str, file: UploadFile, options: dict, db: DbSession):
     if not file.filename.endswith(".csv"):
         raise HTTPException(status_code=400, detail="File must be a CSV file")
-    
+
     try:
-        content = await file.read()
-        try:
-            decoded_content = content.decode("utf-8")
-        except UnicodeDecodeError:
-            decoded_content = content.decode("latin1")
-        logging.info("Decoded content for hospital rating: %s", decoded_content)
-        result = await process_csv_hospital_rating(decoded_content, db)
-        return result
+        # Parsing and loading run in a worker process, only the copy to disk happens here (off the event loop)
+        path = await run_in_threadpool(upload_job_queue.spool, file.file, file.filename)
+        job_id = await run_sync(db, upload_job_queue.submit, kind, file.filename, path, options)
+        return {"status": "queued", "message": "Upload queued for processing", "job_id": job_id}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/upload-hospital-data", status_code=status.HTTP_202_ACCEPTED)
+async def upload_hospital_data(
+    file: UploadFile = File(...),
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, gt=0, description="Rows parsed and committed per batch"),
+    mode: str = Query("upsert", pattern="^(append|upsert)$", description="upsert merges on (provider_id, ms_drg_definition) and skips unchanged rows"),
+    db: DbSession = Depends(get_db)
+):
+    return await _queue_upload("hospital_data", file, {"chunk_size": chunk_size, "mode": mode}, db)
+
+@app.post("/upload-hospital-rating", status_code=status.HTTP_202_ACCEPTED)
+async def upload_hospital_rating(
+    file: UploadFile = File(...),
+    mode: str = Query("upsert", pattern="^(append|upsert)$", description="upsert merges on provider_id and skips unchanged rows"),
+    db: DbSession = Depends(get_db)
+):
+    return await _queue_upload("hospital_rating", file, {"mode": mode}, db)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, db: DbSession = Depends(get_db)):
+    job = await run_sync(db, upload_job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
-# Initialize geolocator
-geolocator = Nominatim(user_agent="healthcare_cost_navigator")
-
-# Function to get coordinates from ZIP code using geopy
-# def get_coordinates_from_zip(zip_code: str):
-#     location = geolocator.geocode(zip_code)
-#     if location:
-#         return location.latitude, location.longitude
-#     else:
-#         raise ValueError(f"Could not find coordinates for ZIP code: {zip_code}")
-
-# Function to calculate the distance between two points using the Haversine formula
-def haversine(lon1, lat1, lon2, lat2):
-    # convert decimal degrees to radians 
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    # haversine formula 
-    dlon = lon2 - lon1 
-    dlat = lat2 - lat1 
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a)) 
-    # Radius of earth in miles is 3956
-    miles = 3956 * c
-    return miles
-
-
-ZIP_CODE_LAT_LON_MAP = {
-    "36301": (31.3072, -85.3956),
-    "35801": (34.6993, -86.6902),
-    "76065": (32.5156, -97.8361),
-    "90210": (34.0195, -118.4105),
-    "90001": (33.7701, -118.1956),
-    "90002": (33.7701, -118.1956),
-    "90003": (33.7701, -118.1956),
-    "90004": (33.7701, -118.1956),
-    "90005": (33.7701, -118.1956),
-    "90006": (33.7701, -118.1956),
-    "10001": (40.7128, -74.0060),
-    "10002": (40.7128, -74.0060),
-    "10003": (40.7128, -74.0060),
-    "10004": (40.7128, -74.0060),
-    "10005": (40.7128, -74.0060),
-    "10006": (40.7128, -74.0060),
-    "10007": (40.7128, -74.0060),
-}
-
-def get_nearby_zip_codes(zip_code: str, radius_km: float) -> list[str]:
-    if zip_code in ZIP_CODE_LAT_LON_MAP:
-        C_lat, C_lon = ZIP_CODE_LAT_LON_MAP[zip_code]
-        nearby_zip_codes = []
-        for zip_code, (lat, lon) in ZIP_CODE_LAT_LON_MAP.items():
-            dist = haversine(C_lat, C_lon, lat, lon)
-            if dist <= radius_km:
-                nearby_zip_codes.append(zip_code)
-        return nearby_zip_codes
-    else:
-        return []
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    503 until the startup warm-up has finished, for readiness probes; /health only says the process is up.
+    """
+    return JSONResponse({"ready": _warmup["done"], **_warmup}, status_code=200 if _warmup["done"] else 503)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    sql_cache = global_ai_service_instance.sql_cache
+    stats = {"sql_cache": None}
+    if sql_cache is not None:
+        stats["sql_cache"] = {"entries": len(sql_cache), **sql_cache.stats.as_dict()}
+    stats["result_cache"] = result_cache.stats()
+    stats["llm"] = global_ai_service_instance.llm_stats()
+    return stats
+
+
+@app.get("/fast-path/stats")
+async def fast_path_stats():
+    """
+    Share of questions answered by the fast-path router without an LLM call, and the latency saved.
+    """
+    return {"enabled": FAST_PATH_ENABLED, "template_answers": FAST_PATH_TEMPLATE_ANSWERS, **fast_path_router.stats()}
+
+PROVIDER_STREAM_BATCH = 100
+
+
+def _provider_dict(row, distance: float) -> Dict[str, Any]:
+    return {
+        "provider_id": row.provider_id,
+        "provider_name": row.provider_name,
+        "provider_city": row.provider_city,
+        "provider_state": row.provider_state,
+        "provider_zip_code": row.provider_zip_code,
+        "ms_drg_definition": row.ms_drg_definition,
+        "total_discharges": row.total_discharges,
+        "average_covered_charges": row.average_covered_charges,
+        "average_total_payments": row.average_total_payments,
+        "overall_rating": row.overall_rating,
+        "distance_km": None if np.isnan(distance) else round(float(distance), 3)
+    }
+
+
+async def _stream_provider_page(first, batches, locations, center, limit: int):
+    """
+    Writes {"status", "data", "next_cursor"} as each batch of rows is fetched. `first` and then `batches` hold up
+    to limit + 1 rows in total, the extra row only signals that another page exists.
+    """
+    yield '{"status": "success", "data": ['
+    sent, last, more = 0, None, False
+    try:
+        rows = first
+        while rows is not None:
+            if len(rows) > limit - sent:
+                rows, more = rows[:limit - sent], True
+            if rows:
+                distances = locations.distances_km(center[0], center[1], [row.provider_id for row in rows])
+                yield ("," if sent else "") + ",".join(json.dumps(_provider_dict(row, d)) for row, d in zip(rows, distances))
+                sent += len(rows)
+                last = rows[-1]
+            if more:
+                break
+            rows = await anext(batches, None)
+    except Exception as e:
+        # The status line is already sent, so end the JSON cleanly and report the failure in the body
+        logging.error(f"Error streaming providers: {e}")
+        yield '], "next_cursor": null, "error": "Error searching hospitals"}'
+        return
+    finally:
+        await batches.aclose()
+    next_cursor = encode_cursor(p=last.average_covered_charges, id=last.provider_id) if more else None
+    yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+
+def _search_columnar(store: ColumnarStore, ms_drg: str, zip_codes, locations, center, sort: str, limit: int,
+                     after: Optional[Tuple[float, int]], offset: int, drg_rows: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    The /providers page computed from the in-memory snapshot. Prices and cursors carry the float64 values of the
+    SQL path; the order can differ from it only between prices within float32 resolution (see columnar.py).
+    """
+    rows = store.cheapest_per_provider(ms_drg, zip_codes, after=after, drg_rows=drg_rows)
+    if sort == "price":
+        page, more = rows[:limit], len(rows) > limit
+        distances = locations.distances_km(center[0], center[1], store.provider_id[page])
+        provider_list = [_provider_dict(row, d) for row, d in zip(store.rows(page), distances)]
+        next_cursor = None
+        if more:
+            price, provider_id = store.position(page[-1])
+            next_cursor = encode_cursor(p=price, id=provider_id)
+        return {"status": "success", "data": provider_list, "next_cursor": next_cursor}
+
+    candidates = rows[:PROVIDER_CANDIDATE_LIMIT]
+    distances = locations.distances_km(center[0], center[1], store.provider_id[candidates])
+    page = rank(store.price[candidates], distances, store.rating[candidates], sort)[offset:offset + limit]
+    provider_list = [_provider_dict(row, distances[i]) for row, i in zip(store.rows(candidates[page]), page)]
+    next_cursor = encode_cursor(o=offset + limit) if offset + limit < len(candidates) else None
+    return {"status": "success", "data": provider_list, "next_cursor": next_cursor}
+
 
 @app.get("/providers")
 async def search_hospitals(
     zip_code: str = Query(..., description="ZIP code to search around"),
-    radius_km: float = Query(..., description="Radius in kilometers"),
+    radius_km: float = Query(..., gt=0, description="Radius in kilometers"),
     ms_drg: str = Query(..., description="MS-DRG procedure to search for"),
-    db: Session = Depends(get_db)
+    sort: str = Query("price", pattern="^(price|distance|rating|score)$", description="price, distance, rating, or score (weighted mix of all three)"),
+    limit: int = Query(50, ge=1, le=500, description="Providers per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: DbSession = Depends(get_db)
 ):
     try:
-        logging.info(f"Received search request with zip_code: {zip_code}, radius_km: {radius_km}, ms_drg: {ms_drg}")
-
-        # Convert radius from kilometers to miles
-        radius_miles = radius_km * 0.621371
-
-        # Get coordinates from the input ZIP code using geopy
-        # zipcode= get_coordinates_from_zip(zip_code)
-        # logging.info(f"Coordinates for zip_code {zipcode}")
-        nearby_zip_codes = get_nearby_zip_codes(zip_code, radius_km)
-        # Query hospitals offering the specified MS-DRG procedure using ILIKE for case-insensitive search
-
-        logging.info(f"Nearby ZIP codes: {nearby_zip_codes}")
-
-        query = db.query(
-            HospitalData.provider_id,
-            HospitalData.provider_name,
-            HospitalData.provider_city,
-            HospitalData.provider_state,
-            HospitalData.provider_zip_code,
-            HospitalData.ms_drg_definition,
-            HospitalData.total_discharges,
-            HospitalData.average_covered_charges,
-            HospitalData.average_total_payments,
-            StarRating.overall_rating
-        ).outerjoin(StarRating, HospitalData.provider_id == StarRating.provider_id).filter(func.lower(HospitalData.ms_drg_definition).ilike(f"%{ms_drg.lower()}%"))
-
-        if nearby_zip_codes:
-            query = query.filter(HospitalData.provider_zip_code.in_(nearby_zip_codes))
-        
-        query = query.order_by(HospitalData.average_covered_charges.asc())
-        results = query.all()
-
-        provider_list = []
-        unique_provider_ids = {}
-        for row in results:
-            if row.provider_id not in unique_provider_ids:
-                unique_provider_ids[row.provider_id] = {
-                    "provider_id": row.provider_id,
-                    "provider_name": row.provider_name,
-                    "provider_city": row.provider_city,
-                    "provider_state": row.provider_state,
-                    "provider_zip_code": row.provider_zip_code,
-                    "ms_drg_definition": row.ms_drg_definition,
-                    "total_discharges": row.total_discharges,
-                    "average_covered_charges": row.average_covered_charges,
-                    "average_total_payments": row.average_total_payments,
-                    "overall_rating": row.overall_rating
-                }
-                provider_list = list(unique_provider_ids.values())
-
-        return {"status": "success", "data": provider_list}
+        logging.info(f"Received search request with zip_code: {zip_code}, radius_km: {radius_km}, ms_drg: {ms_drg}, sort: {sort}, limit: {limit}")
+
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+                after = (float(position["p"]), int(position["id"])) if sort == "price" else None
+                offset = int(position["o"]) if sort != "price" else 0
+            except (ValueError, KeyError, TypeError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        else:
+            after, offset = None, 0
+
+        # ZIP centroids within the radius, with their great-circle distance from the searched ZIP
+        nearby_zip_codes = get_zip_index().within_radius(zip_code, radius_km)
+        if not nearby_zip_codes:
+            raise HTTPException(status_code=400, detail=f"Unknown ZIP code: {zip_code}")
+
+        logging.info(f"Found {len(nearby_zip_codes)} ZIP codes within {radius_km} km of {zip_code}")
+
+        center = get_zip_index().coordinates(zip_code)
+        locations = await run_sync(db, get_provider_locations)
+
+        store = columnar_engine.store if COLUMNAR_ENGINE_ENABLED else None
+        if store is not None:
+            try:
+                return await run_in_threadpool(_search_columnar, store, ms_drg, nearby_zip_codes, locations, center,
+                                               sort, limit, after, offset)
+            except Exception as e:
+                logging.error(f"Columnar search failed, falling back to SQL: {e}")
+
+        if sort == "price":
+            # SQL keeps each provider's cheapest row and pages in price order, rows are streamed as they arrive
+            stmt = await run_sync(db, cheapest_per_provider, ms_drg, nearby_zip_codes, after=after, limit=limit + 1)
+            batches = stream_partitions(db, stmt, PROVIDER_STREAM_BATCH)
+            # Fetch the first batch here so database errors still become a 500 instead of a broken stream
+            first = await anext(batches, [])
+            return StreamingResponse(_stream_provider_page(first, batches, locations, center, limit),
+                                     media_type="application/json")
+
+        # The other sorts need every candidate, which is at most one row per provider in the radius
+        stmt = await run_sync(db, cheapest_per_provider, ms_drg, nearby_zip_codes, limit=PROVIDER_CANDIDATE_LIMIT)
+        results = await run_sync(db, lambda session: session.execute(stmt).all())
+        provider_ids = np.fromiter((row.provider_id for row in results), dtype=np.int64, count=len(results))
+        distances = locations.distances_km(center[0], center[1], provider_ids)
+        prices = np.array([row.average_covered_charges for row in results], dtype=np.float64)
+        ratings = np.array([row.overall_rating for row in results], dtype=np.float64)
+
+        page = rank(prices, distances, ratings, sort)[offset:offset + limit]
+        provider_list = [_provider_dict(results[i], distances[i]) for i in page]
+        next_cursor = encode_cursor(o=offset + limit) if offset + limit < len(results) else None
+
+        return {"status": "success", "data": provider_list, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except SQLAlchemyError as e:
         logging.error(f"SQLAlchemy error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -249,14 +447,258 @@ async def search_hospitals(
 
         # # Sort results by average_covered_charges
         # results.sort(key=lambda x: x["average_covered_charges"])
+
+# Searches of a /providers/batch request answered per thread pool call, and so per write to the response
+PROVIDER_BATCH_CHUNK = 200
+
+
+def _nearby_zip_codes(searches) -> Dict[Tuple[str, float], Dict[str, float]]:
+    # One radius lookup per (ZIP, radius) pair, however many searches share it
+    zip_index = get_zip_index()
+    nearby = {}
+    for search in searches:
+        if isinstance(search, ProviderSearch) and (search.zip_code, search.radius_km) not in nearby:
+            nearby[(search.zip_code, search.radius_km)] = zip_index.within_radius(search.zip_code, search.radius_km)
+    return nearby
+
+
+def _answer_batch_chunk(store: ColumnarStore, searches, start: int, nearby, locations,
+                        drg_rows: Dict[str, np.ndarray]) -> str:
+    """
+    NDJSON lines answering searches[start:start + PROVIDER_BATCH_CHUNK]. `drg_rows` caches the rows of every
+    keyword across chunks.
+    """
+    zip_index = get_zip_index()
+    lines = []
+    for index in range(start, min(start + PROVIDER_BATCH_CHUNK, len(searches))):
+        search = searches[index]
+        if not isinstance(search, ProviderSearch):
+            line = {"index": index, "status": "error", "detail": search}
+        elif not nearby[(search.zip_code, search.radius_km)]:
+            line = {"index": index, "status": "error", "detail": f"Unknown ZIP code: {search.zip_code}"}
+        else:
+            if search.ms_drg not in drg_rows:
+                drg_rows[search.ms_drg] = store.drg_rows(search.ms_drg)
+            try:
+                page = _search_columnar(store, search.ms_drg, nearby[(search.zip_code, search.radius_km)], locations,
+                                        zip_index.coordinates(search.zip_code), search.sort, search.limit, None, 0,
+                                        drg_rows=drg_rows[search.ms_drg])
+                line = {"index": index, **page}
+            except Exception as e:
+                logging.error(f"Error in batch search {index}: {e}")
+                line = {"index": index, "status": "error", "detail": "Error searching hospitals"}
+        lines.append(json.dumps(line) + "\n")
+    return "".join(lines)
+
+
+@app.post("/providers/batch")
+async def search_hospitals_batch(request: Request, db: DbSession = Depends(get_db)):
+    """
+    Many /providers searches in one request. The body is NDJSON (Content-Type application/x-ndjson) with one
+    search per line, or a JSON list of searches or {"searches": [...]}; a search has zip_code, radius_km and
+    ms_drg, and optionally sort and limit, as on /providers. The answer is NDJSON, one line per search in input
+    order: {"index", "status": "success", "data", "next_cursor"}, the first page of /providers, or
+    {"index", "status": "error", "detail"} for a search that failed on its own. See provider_batch.py.
+    """
+    try:
+        searches = parse_searches(await request.body(), "ndjson" in request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        nearby = await run_in_threadpool(_nearby_zip_codes, searches)
+        locations = await run_sync(db, get_provider_locations)
+        store = columnar_engine.store if COLUMNAR_ENGINE_ENABLED else None
+        if store is None:
+            # One read for the whole batch: every DRG of its keywords in every ZIP code of its radii
+            searched = [s for s in searches if isinstance(s, ProviderSearch) and nearby[(s.zip_code, s.radius_km)]]
+            zip_codes = set().union(*(nearby[(s.zip_code, s.radius_km)] for s in searched))
+            if len(zip_codes) > PROVIDER_BATCH_ZIP_FILTER_LIMIT:
+                zip_codes = None
+            store = await run_sync(db, read_batch_store, {s.ms_drg for s in searched}, zip_codes)
+    except SQLAlchemyError as e:
+        logging.error(f"SQLAlchemy error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def lines():
+        drg_rows: Dict[str, np.ndarray] = {}
+        for start in range(0, len(searches), PROVIDER_BATCH_CHUNK):
+            yield await run_in_threadpool(_answer_batch_chunk, store, searches, start, nearby, locations, drg_rows)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+STATS_MAX_LIMIT = 1000
+
+
+def _row_dict(row) -> Dict[str, Any]:
+    return {column.name: getattr(row, column.name) for column in row.__table__.columns}
+
+
+def _drg_keyword(column, ms_drg: Optional[str]):
+    return column.ilike(f"%{escape_like(ms_drg.strip())}%", escape="\\") if ms_drg and ms_drg.strip() else None
+
+
+async def _stats_rows(db: DbSession, model, filters, order_by, limit: int) -> Dict[str, Any]:
+    def query(session: Session):
+        q = session.query(model).filter(*[f for f in filters if f is not None])
+        return [_row_dict(row) for row in q.order_by(*order_by).limit(limit).all()]
+
+    try:
+        return {"status": "success", "data": await run_sync(db, query)}
+    except SQLAlchemyError as e:
+        logging.error(f"SQLAlchemy error: {e}")
+        raise HTTPException(status_code=500, detail="Error reading aggregate statistics")
+
+
+@app.get("/stats/drg-state")
+async def drg_state_stats(
+    ms_drg: Optional[str] = Query(None, description="MS-DRG keyword"),
+    state: Optional[str] = Query(None, description="Two-letter state code"),
+    limit: int = Query(100, ge=1, le=STATS_MAX_LIMIT),
+    db: DbSession = Depends(get_db)
+):
+    """
+    Provider count, discharges and average / min / max charges per (DRG, state).
+    """
+    filters = [_drg_keyword(DrgStateStats.ms_drg_definition, ms_drg),
+               DrgStateStats.provider_state == state.upper() if state else None]
+    return await _stats_rows(db, DrgStateStats, filters,
+                             (DrgStateStats.ms_drg_definition, DrgStateStats.provider_state), limit)
+
+
+@app.get("/stats/drg-provider")
+async def drg_provider_stats(
+    ms_drg: Optional[str] = Query(None, description="MS-DRG keyword"),
+    state: Optional[str] = Query(None, description="Two-letter state code"),
+    provider_id: Optional[int] = Query(None),
+    limit: int = Query(100, ge=1, le=STATS_MAX_LIMIT),
+    db: DbSession = Depends(get_db)
+):
+    """
+    Per (DRG, provider) figures with the provider's rating and its price rank within the state.
+    """
+    filters = [_drg_keyword(DrgProviderStats.ms_drg_definition, ms_drg),
+               DrgProviderStats.provider_state == state.upper() if state else None,
+               DrgProviderStats.provider_id == provider_id if provider_id is not None else None]
+    order_by = (DrgProviderStats.ms_drg_definition, DrgProviderStats.provider_state,
+                DrgProviderStats.state_price_rank, DrgProviderStats.provider_id)
+    return await _stats_rows(db, DrgProviderStats, filters, order_by, limit)
+
+
+@app.get("/stats/provider-ratings")
+async def provider_rating_stats(
+    state: Optional[str] = Query(None, description="Two-letter state code"),
+    min_rating: Optional[int] = Query(None, ge=1, le=10),
+    limit: int = Query(100, ge=1, le=STATS_MAX_LIMIT),
+    db: DbSession = Depends(get_db)
+):
+    """
+    Providers with their rating, DRG count, discharges and average charges, best rated first.
+    """
+    filters = [ProviderRatingStats.provider_state == state.upper() if state else None,
+               ProviderRatingStats.overall_rating >= min_rating if min_rating is not None else None]
+    order_by = (ProviderRatingStats.overall_rating.desc().nulls_last(), ProviderRatingStats.provider_id)
+    return await _stats_rows(db, ProviderRatingStats, filters, order_by, limit)
+
+
+@app.get("/stats/state-ratings")
+async def state_rating_stats(db: DbSession = Depends(get_db)):
+    """
+    Average provider rating and provider count per state.
+    """
+    def query(session: Session):
+        rows = session.query(
+            ProviderRatingStats.provider_state,
+            func.avg(ProviderRatingStats.overall_rating).label("average_rating"),
+            func.count(ProviderRatingStats.overall_rating).label("rated_providers"),
+            func.count().label("providers"),
+        ).group_by(ProviderRatingStats.provider_state).order_by(ProviderRatingStats.provider_state).all()
+        return [{"provider_state": r.provider_state,
+                 "average_rating": round(float(r.average_rating), 2) if r.average_rating is not None else None,
+                 "rated_providers": r.rated_providers, "providers": r.providers} for r in rows]
+
+    try:
+        return {"status": "success", "data": await run_sync(db, query)}
+    except SQLAlchemyError as e:
+        logging.error(f"SQLAlchemy error: {e}")
+        raise HTTPException(status_code=500, detail="Error reading aggregate statistics")
+
+
 global_ai_service_instance = AIService(api_key=OPENAI_API_KEY)
 
+
+result_cache = ResultCache()
+
+
+async def _fetch_rows(db: DbSession, sql_query: str, params: Optional[Dict[str, Any]] = None) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Runs the generated SQL, reusing cached rows of the same SQL for as long as no upload has changed
+    the data. Returns the data version the rows belong to along with them.
+    """
+    version = await run_sync(db, get_data_version)
+    results_as_dicts = await result_cache.get_rows(sql_query, version, params)
+    if results_as_dicts is None:
+        # Read-only, under its own statement timeout and never more than SQL_MAX_ROWS rows
+        results_as_dicts = await run_sync(db, run_readonly, sql_query, params)
+        await result_cache.put_rows(sql_query, version, results_as_dicts, params)
+    return version, results_as_dicts
+
+
+fast_path_router = FastPathRouter()
+
+
+def _fast_path_route(natural_language_query: str) -> Optional[Route]:
+    """
+    Matches the question against the fast-path intents. The router's dictionaries are reloaded with the
+    rest of the reference data (_refresh_reference_data), never on the request path; until the warm-up has
+    loaded them every question goes to the LLM.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    return fast_path_router.route(natural_language_query)
+
+
+def _template_summary(route: Optional[Route], natural_language_query: str, results_as_dicts: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    The answer of a fast-path question, or None when it is to be summarized by the LLM.
+    """
+    if route is None or not FAST_PATH_TEMPLATE_ANSWERS:
+        return None
+    return route.answer(results_as_dicts) if results_as_dicts else no_results_message(natural_language_query)
+
+
+async def _answer_with_sql(db: DbSession, natural_language_query: str, sql_query: str, route: Optional[Route] = None) -> str:
+    """
+    Runs the generated (or fast-path) SQL and summarizes the rows; rows and summary are both cached per data version.
+    """
+    params = route.params if route is not None else None
+    version, results_as_dicts = await _fetch_rows(db, sql_query, params)
+
+    summary_response = _template_summary(route, natural_language_query, results_as_dicts)
+    if summary_response is not None:
+        return summary_response
+    summary_response = await result_cache.get_summary(sql_query, version, natural_language_query, params)
+    if summary_response is None:
+        summary_response = await global_ai_service_instance.summarize_results(natural_language_query, results_as_dicts)
+        if summary_response != SUMMARY_ERROR_MESSAGE:
+            await result_cache.put_summary(sql_query, version, natural_language_query, summary_response, params)
+    return summary_response
+
+
 @app.post("/ask", response_model=Union[List[Dict[str, Any]], str]) # Updated response_model
 async def query_data_nl(
     natural_language_query: str,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
     try:
+        started = time.perf_counter()
+        # Templated questions are answered from parameterized SQL without calling the LLM
+        route = _fast_path_route(natural_language_query)
+        if route is not None:
+            summary_response = await _answer_with_sql(db, natural_language_query, route.sql, route)
+            fast_path_router.record(route.intent, time.perf_counter() - started)
+            return summary_response
 
         sql_query = await global_ai_service_instance.generate_sql_query(natural_language_query)
         if sql_query == "IRRELEVANT_QUERY_SIGNAL":
@@ -264,18 +706,18 @@ async def query_data_nl(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="I can only help with hospital pricing and quality information. Please ask about medical procedures, costs, or hospital ratings."
             )
+        # Only a single read-only SELECT over the known tables gets to the database, with a bounded LIMIT
+        sql_query = validate_sql(sql_query)
 
-        result = db.execute(text(sql_query))
-        column_names = result.keys()
-        rows = result.fetchall()
-        results_as_dicts = [dict(zip(column_names, row)) for row in rows]
-
-        # --- Summarize the results using AI service ---
-        summary_response = await global_ai_service_instance.summarize_results(natural_language_query, results_as_dicts)
+        # --- Run the SQL and summarize the results using AI service (both cached per data version) ---
+        summary_response = await _answer_with_sql(db, natural_language_query, sql_query)
+        fast_path_router.record(None, time.perf_counter() - started)
         return summary_response # Return the natural language summary
 
     except HTTPException as e:
         raise e
+    except UnsafeQueryError as e:
+        raise HTTPException(status_code=400, detail=f"The generated SQL query was rejected: {e}")
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Database error executing generated SQL: {e}. Please check the generated SQL query or your database connection.")
     except Exception as e:
@@ -284,60 +726,173 @@ async def query_data_nl(
 
         
 
+# Rows sent in the "rows" frame of /ws/ask; row_count always carries the full count
+WS_ROWS_PREVIEW = int(os.getenv("WS_ROWS_PREVIEW", "20"))
+# Questions answered concurrently per connection
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "10"))
+# Questions waiting for a slot per connection; beyond this a new question gets an error frame
+WS_MAX_QUEUED = int(os.getenv("WS_MAX_QUEUED", "10"))
+# Questions answered concurrently across all connections of this worker
+WS_GLOBAL_MAX_INFLIGHT = int(os.getenv("WS_GLOBAL_MAX_INFLIGHT", "100"))
+
+_ws_global_slots = asyncio.Semaphore(WS_GLOBAL_MAX_INFLIGHT)
+
+
+class _FrameSender:
+    """
+    Serializes frames of concurrently answered questions onto one WebSocket, tagging each with its request id.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self._lock = asyncio.Lock()
+
+    async def send(self, request_id: str, frame_type: str, **fields):
+        message = json.dumps({"type": frame_type, "id": request_id, **fields}, default=json_default)
+        async with self._lock:
+            await self.websocket.send_text(message)
+
+
+def _parse_ws_message(message: str, default_id: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Returns (request_id, question, cancel_id). A message is either the question as plain text or a
+    JSON object {"id": ..., "question": ...}; {"cancel": id} stops an in-flight question.
+    """
+    if message.lstrip().startswith("{"):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            if "cancel" in payload:
+                return default_id, None, str(payload["cancel"])
+            return str(payload.get("id", default_id)), str(payload.get("question", "")), None
+    return default_id, message, None
+
+
+async def _answer_ws_question(sender: _FrameSender, request_id: str, natural_language_query: str):
+    try:
+        async with _ws_global_slots:
+            started = time.perf_counter()
+            # 1. Templated questions get parameterized SQL from the fast path, the rest from the AI service
+            route = _fast_path_route(natural_language_query)
+            if route is not None:
+                sql_query, params = route.sql, route.params
+            else:
+                sql_query, params = await global_ai_service_instance.generate_sql_query(natural_language_query), None
+            logging.debug(f"WebSocket: Generated SQL for {request_id}: {sql_query}")
+
+            # 2. Check for irrelevant query signal
+            if sql_query == "IRRELEVANT_QUERY_SIGNAL":
+                response_message = "I can only help with hospital pricing and quality information. Please ask about medical procedures, costs, or hospital ratings."
+                await sender.send(request_id, "done", summary=response_message)
+                return
+            if route is None:
+                sql_query = validate_sql(sql_query)
+            await sender.send(request_id, "sql", sql=sql_query, **({"params": params} if params else {}))
+
+            # 3. Execute the SQL query (cached per data version)
+            async with session_scope() as db:
+                version, results_as_dicts = await _fetch_rows(db, sql_query, params)
+            await sender.send(request_id, "rows", rows=results_as_dicts[:WS_ROWS_PREVIEW], row_count=len(results_as_dicts))
+
+            # 4. Stream the summary token by token, or send a template or cached one whole
+            summary_response = _template_summary(route, natural_language_query, results_as_dicts)
+            if summary_response is None:
+                summary_response = await result_cache.get_summary(sql_query, version, natural_language_query, params)
+            if summary_response is None:
+                parts = []
+                async for token in global_ai_service_instance.stream_summary(natural_language_query, results_as_dicts):
+                    parts.append(token)
+                    await sender.send(request_id, "token", text=token)
+                summary_response = "".join(parts).strip()
+                await result_cache.put_summary(sql_query, version, natural_language_query, summary_response, params)
+            else:
+                await sender.send(request_id, "token", text=summary_response)
+            await sender.send(request_id, "done", summary=summary_response)
+            fast_path_router.record(route.intent if route is not None else None, time.perf_counter() - started)
+
+    except (asyncio.CancelledError, WebSocketDisconnect):
+        raise
+    except HTTPException as e:
+        await sender.send(request_id, "error", message=e.detail)
+    except UnsafeQueryError as e:
+        await sender.send(request_id, "error", message=f"The generated SQL query was rejected: {e}")
+    except SQLAlchemyError as e:
+        error_msg = f"Database error: {e}. Please check the generated SQL query or your database connection."
+        await sender.send(request_id, "error", message=error_msg)
+        logging.error(f"WebSocket: Sent SQLAlchemyError for {request_id}: {error_msg}")
+    except Exception as e:
+        error_msg = f"An unexpected error occurred: {e}"
+        await sender.send(request_id, "error", message=error_msg)
+        logging.error(f"WebSocket: Sent unexpected error for {request_id}: {error_msg}")
+
+
 @app.websocket("/ws/ask")
-async def websocket_query_data_nl(websocket: WebSocket, db: Session = Depends(get_db)):
+async def websocket_query_data_nl(websocket: WebSocket):
     """
     WebSocket endpoint for natural language queries, providing real-time responses.
+
+    A message is a question as plain text or {"id": ..., "question": ...}; {"cancel": id} abandons
+    one. Up to WS_MAX_INFLIGHT questions are answered concurrently and WS_MAX_QUEUED more wait for a
+    slot; further questions are refused with an error frame. Frames of different answers interleave, each carrying the id it answers (the client's, or "1", "2", ... in arrival order):
+      {"type": "sql", "id": ..., "sql": ...}                      generated SQL, before it runs
+      {"type": "rows", "id": ..., "rows": [...], "row_count": n}   first WS_ROWS_PREVIEW result rows
+      {"type": "token", "id": ..., "text": ...}                   summary text as the model produces it
+      {"type": "done", "id": ..., "summary": ...}                 full summary, the last frame of an answer
+      {"type": "error", "id": ..., "message": ...}                replaces "done" when the question fails
     """
     await websocket.accept()
-    print("WebSocket: Client connected.")
+    logging.info("WebSocket: Client connected.")
+    sender = _FrameSender(websocket)
+    slots = asyncio.Semaphore(WS_MAX_INFLIGHT)
+    in_flight: Dict[str, asyncio.Task] = {}
+    received = 0
+
+    async def answer(request_id: str, natural_language_query: str):
+        async with slots:
+            await _answer_ws_question(sender, request_id, natural_language_query)
+
+    def finished(request_id: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            # Typically the socket closing mid-answer; the main loop notices the disconnect itself
+            logging.debug(f"WebSocket: answer {request_id} stopped: {task.exception()!r}")
+        if in_flight.get(request_id) is task:
+            del in_flight[request_id]
+
     try:
         while True:
-            natural_language_query = await websocket.receive_text()
-            print(f"WebSocket: Received query: '{natural_language_query}'")
-
-            try:
-                # 1. Generate SQL query using AI service
-                sql_query = await global_ai_service_instance.generate_sql_query(natural_language_query)
-                print(f"WebSocket: Generated SQL: {sql_query}")
-
-                # 2. Check for irrelevant query signal
-                if sql_query == "IRRELEVANT_QUERY_SIGNAL":
-                    response_message = "I can only help with hospital pricing and quality information. Please ask about medical procedures, costs, or hospital ratings."
-                    await websocket.send_text(response_message)
-                    print(f"WebSocket: Sent irrelevant query response.")
-                    continue # Continue to next message
-
-                # 3. Execute the generated SQL query
-                print(f"WebSocket: Executing SQL: {sql_query}")
-                result = db.execute(text(sql_query))
-                column_names = result.keys()
-                rows = result.fetchall()
-                results_as_dicts = [dict(zip(column_names, row)) for row in rows]
-                print(f"WebSocket: Database query returned {len(results_as_dicts)} rows.")
-
-                # 4. Summarize the results using AI service
-                summary_response = await global_ai_service_instance.summarize_results(natural_language_query, results_as_dicts)
-                await websocket.send_text(summary_response)
-                print(f"WebSocket: Sent summary response.")
-
-            except HTTPException as e:
-                # Catch HTTPExceptions (like the irrelevant query one) and send their detail
-                await websocket.send_text(f"Error: {e.detail}")
-                print(f"WebSocket: Sent HTTPException detail: {e.detail}")
-            except SQLAlchemyError as e:
-                error_msg = f"Database error: {e}. Please check the generated SQL query or your database connection."
-                await websocket.send_text(f"Error: {error_msg}")
-                print(f"WebSocket: Sent SQLAlchemyError: {error_msg}")
-            except Exception as e:
-                error_msg = f"An unexpected error occurred: {e}"
-                await websocket.send_text(f"Error: {error_msg}")
-                print(f"WebSocket: Sent unexpected error: {error_msg}")
+            # The socket is always read, so cancels and disconnects are noticed while every slot is busy
+            message = await websocket.receive_text()
+            received += 1
+            request_id, natural_language_query, cancel_id = _parse_ws_message(message, str(received))
+
+            if cancel_id is not None:
+                task = in_flight.pop(cancel_id, None)
+                if task is not None:
+                    task.cancel()
+                    await sender.send(cancel_id, "error", message="Cancelled")
+                continue
+            if request_id in in_flight:
+                await sender.send(request_id, "error", message=f"Request id {request_id} is already in flight")
+                continue
+            # Backpressure: questions beyond the running and queued ones are refused, not buffered
+            if len(in_flight) >= WS_MAX_INFLIGHT + WS_MAX_QUEUED:
+                await sender.send(request_id, "error", message="Too many questions in flight, retry once one completes")
+                continue
+
+            logging.debug(f"WebSocket: Received query {request_id}: '{natural_language_query}'")
+            task = asyncio.create_task(answer(request_id, natural_language_query))
+            in_flight[request_id] = task
+            task.add_done_callback(lambda t, request_id=request_id: finished(request_id, t))
 
     except WebSocketDisconnect:
-        print("WebSocket: Client disconnected.")
+        logging.info("WebSocket: Client disconnected.")
     except Exception as e:
-        print(f"WebSocket: An unhandled error occurred in the main loop: {e}")
-
-
-
+        logging.error(f"WebSocket: An unhandled error occurred in the main loop: {e}")
+    finally:
+        # Nobody is left to read the answers: stop the LLM calls and queries still running
+        tasks = list(in_flight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,81 @@
+# benchmarks/bench_batch.py
+"""
+/providers/batch against the same searches sent one by one to /providers, on a running API.
+
+The searches are random but reproducible: ZIP codes from the bundled centroid file, a few radii and DRG
+keywords, mostly sort=price. The batch is sent --repeat times as NDJSON; the time to the first result line
+and to the last one are reported. --singles of the searches are then sent to /providers one after the
+other, and their time extrapolated to the whole batch.
+
+    uvicorn api.apis:app --port 8000 &
+    python benchmarks/bench_batch.py --url http://localhost:8000 --searches 10000
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from geo import ZIP_CENTROIDS_PATH
+
+KEYWORDS = ["heart", "knee", "sepsis", "pneumonia", "kidney", "failure", "hip", "spinal", "chest pain", "stroke"]
+RADII_KM = [25, 50, 100, 200]
+
+
+def make_searches(count: int, seed: int = 11) -> list:
+    with gzip.open(ZIP_CENTROIDS_PATH, "rt") as f:
+        zip_codes = [row["zip_code"] for row in csv.DictReader(f)]
+    rng = random.Random(seed)
+    return [{"zip_code": rng.choice(zip_codes), "radius_km": rng.choice(RADII_KM), "ms_drg": rng.choice(KEYWORDS),
+             "sort": rng.choice(["price", "price", "distance", "score"]), "limit": 20} for _ in range(count)]
+
+
+def run_batch(client: httpx.Client, searches: list) -> dict:
+    body = "\n".join(json.dumps(s) for s in searches)
+    started = time.perf_counter()
+    first_line, lines, errors = None, 0, 0
+    with client.stream("POST", "/providers/batch", content=body, headers={"Content-Type": "application/x-ndjson"}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            if first_line is None:
+                first_line = time.perf_counter() - started
+            lines += 1
+            errors += json.loads(line)["status"] != "success"
+    return {"seconds": round(time.perf_counter() - started, 3), "first_line_seconds": round(first_line or 0, 3),
+            "lines": lines, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--searches", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--singles", type=int, default=200, help="Searches also sent to /providers one by one, 0 to skip")
+    args = parser.parse_args()
+
+    searches = make_searches(args.searches)
+    with httpx.Client(base_url=args.url, timeout=600) as client:
+        batches = [run_batch(client, searches) for _ in range(args.repeat)]
+        report = {"searches": args.searches, "batch": batches}
+        if args.singles:
+            started = time.perf_counter()
+            for search in searches[:args.singles]:
+                client.get("/providers", params=search)
+            seconds = time.perf_counter() - started
+            report["singles"] = {"searches": args.singles, "seconds": round(seconds, 3),
+                                 "extrapolated_seconds": round(seconds / args.singles * args.searches, 1)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
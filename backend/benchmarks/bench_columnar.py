@@ -0,0 +1,151 @@
+# benchmarks/bench_columnar.py
+"""
+Compares the two ways /providers can compute a page: the SQL query of provider_search.cheapest_per_provider
+and the in-memory columnar.ColumnarStore. Reports p50 / p99 latency of each for random (DRG keyword, ZIP,
+radius, page) searches over the synthetic ZIP codes, and checks both return the same rows, prices and
+next_cursor, and that the SQL query continues a columnar cursor with the same page the columnar path would.
+Covered charges go up to --max-price (default $2M), past the $262,144 where float32 loses cents.
+
+Loads a synthetic DRG file into hospital_data unless --keep-data is given. Runs against BENCH_DATABASE_URL
+(or --database-url), PostgreSQL only. Without --keep-data the tables are TRUNCATED first, so never point
+it at a database you care about.
+
+    python benchmarks/bench_columnar.py --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from columnar import ColumnarStore
+from drg_search import DrgDictionary
+from etl import process_csv_hospital_data_stream
+from geo import get_zip_index
+from migrations import run_migrations
+from models.models import Base
+from provider_search import cheapest_per_provider, encode_cursor
+from benchmarks.synthetic import STATES, write_drg_csv
+
+KEYWORDS = ["knee", "heart failure", "sepsis", "chest pain", "pneumonia", "with mcc", "kidney"]
+RADII_KM = [10, 50, 200, 1000, 5000]
+PAGE_SIZE = 50
+
+
+def _load(engine, SessionLocal, rows, max_price):
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE hospital_data RESTART IDENTITY"))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_drg_csv(os.path.join(tmp, "drg.csv"), rows, max_charge=max_price)
+        db = SessionLocal()
+        try:
+            with open(path, "rb") as f:
+                process_csv_hospital_data_stream(f, db, mode="append")
+        finally:
+            db.close()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE hospital_data"))
+
+
+def _searches(count, seed=7):
+    rng = random.Random(seed)
+    zip_index = get_zip_index()
+    zip_codes = [zip_code for _, _, zip_code in STATES]
+    return [(rng.choice(KEYWORDS), zip_index.within_radius(rng.choice(zip_codes), rng.choice(RADII_KM)))
+            for _ in range(count)]
+
+
+def _page(rows):
+    """
+    The providers and prices of a page of up to PAGE_SIZE + 1 rows, and its next_cursor as /providers encodes it.
+    """
+    page = [(r.provider_id, r.average_covered_charges) for r in rows[:PAGE_SIZE]]
+    more = len(rows) > PAGE_SIZE
+    return page, encode_cursor(p=page[-1][1], id=page[-1][0]) if more else None
+
+
+def _percentiles(timings):
+    timings = np.array(timings) * 1000
+    return {"p50_ms": round(float(np.percentile(timings, 50)), 3), "p99_ms": round(float(np.percentile(timings, 99)), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows in the synthetic DRG file")
+    parser.add_argument("--searches", type=int, default=200, help="Random searches timed on each path")
+    parser.add_argument("--max-price", type=float, default=2000000, help="Largest synthetic covered charge")
+    parser.add_argument("--keep-data", action="store_true", help="Benchmark the rows already in hospital_data")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("set BENCH_DATABASE_URL or pass --database-url")
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    if not args.keep_data:
+        _load(engine, SessionLocal, args.rows, args.max_price)
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        store = ColumnarStore.from_db(db, "flat")
+        load_seconds = time.perf_counter() - started
+        dictionary = DrgDictionary.from_db(db, "flat")
+
+        searches = _searches(args.searches)
+        sql_timings, columnar_timings, mismatches, cursor_mismatches = [], [], 0, 0
+        for keyword, zip_distances in searches:
+            start = time.perf_counter()
+            stmt = cheapest_per_provider(db, keyword, zip_distances, "flat", dictionary, limit=PAGE_SIZE + 1)
+            sql_rows = db.execute(stmt).all()
+            sql_timings.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            page = store.cheapest_per_provider(keyword, zip_distances)[:PAGE_SIZE + 1]
+            columnar_rows = store.rows(page)
+            columnar_timings.append(time.perf_counter() - start)
+
+            sql_page, sql_cursor = _page(sql_rows)
+            columnar_page, columnar_cursor = _page(columnar_rows)
+            if sql_page != columnar_page:
+                mismatches += 1
+            if sql_cursor != columnar_cursor:
+                cursor_mismatches += 1
+            elif columnar_cursor is not None:
+                # The next page, continued by the other path from the columnar position
+                after = store.position(page[PAGE_SIZE - 1])
+                stmt = cheapest_per_provider(db, keyword, zip_distances, "flat", dictionary, after=after, limit=PAGE_SIZE + 1)
+                next_page = store.cheapest_per_provider(keyword, zip_distances, after=after)[:PAGE_SIZE + 1]
+                if _page(db.execute(stmt).all()) != _page(store.rows(next_page)):
+                    cursor_mismatches += 1
+    finally:
+        db.close()
+
+    results = {
+        "rows": len(store),
+        "columnar_mb": round(store.nbytes / 1024 / 1024, 2),
+        "columnar_load_seconds": round(load_seconds, 2),
+        "searches": len(searches),
+        "max_price": round(float(np.nanmax(store.exact_price)), 2) if len(store) else None,
+        "mismatched_pages": mismatches,
+        "mismatched_cursors": cursor_mismatches,
+        "sql": _percentiles(sql_timings),
+        "columnar": _percentiles(columnar_timings),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_haversine.py
+"""
+Micro-benchmark: distance + ranking for /providers candidates.
+
+Compares the per-pair math.haversine loop /providers used before with geo.ProviderLocations
+(searchsorted lookup + one vectorized haversine) followed by geo.rank.
+
+    python benchmarks/bench_haversine.py --candidates 10000 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from math import asin, cos, radians, sin, sqrt
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import EARTH_RADIUS_KM, ProviderLocations, get_zip_index, rank
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+def loop_rank(center, provider_coords, provider_ids, prices):
+    rows = []
+    for provider_id, price in zip(provider_ids, prices):
+        lat, lon = provider_coords[provider_id]
+        rows.append((scalar_haversine(center[0], center[1], lat, lon), price, provider_id))
+    rows.sort()
+    return rows
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    zip_index = get_zip_index()
+    rng = np.random.default_rng(0)
+    center = zip_index.coordinates("36301")
+
+    results = []
+    for n in args.candidates:
+        picks = rng.integers(0, len(zip_index), size=n)
+        provider_ids = np.arange(100000, 100000 + n, dtype=np.int64)
+        locations = ProviderLocations(provider_ids, zip_index.lat[picks], zip_index.lon[picks])
+        provider_coords = {int(p): (float(zip_index.lat[i]), float(zip_index.lon[i])) for p, i in zip(provider_ids, picks)}
+        prices = rng.uniform(5000, 250000, size=n)
+        ratings = rng.integers(1, 11, size=n).astype(np.float64)
+        shuffled = rng.permutation(provider_ids)
+
+        loop_seconds = _best_of(lambda: loop_rank(center, provider_coords, shuffled.tolist(), prices.tolist()), args.repeat)
+        vector_seconds = _best_of(
+            lambda: rank(prices, locations.distances_km(center[0], center[1], shuffled), ratings, "distance"),
+            args.repeat,
+        )
+        results.append({
+            "candidates": n,
+            "loop_ms": round(loop_seconds * 1000, 3),
+            "vectorized_ms": round(vector_seconds * 1000, 3),
+            "speedup": round(loop_seconds / vector_seconds, 1),
+        })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
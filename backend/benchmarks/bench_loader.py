@@ -0,0 +1,95 @@
+# benchmarks/bench_loader.py
+"""
+Compares rows/sec of the ORM (bulk_insert_mappings) and COPY loaders in etl.py.
+
+Runs against BENCH_DATABASE_URL (or --database-url). The hospital_data and star_rating tables
+in that database are TRUNCATED between runs, so never point it at a database you care about.
+
+    python benchmarks/bench_loader.py --rows 2000000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from etl import process_csv_hospital_data_stream, process_csv_hospital_rating
+from models.models import Base
+from benchmarks.synthetic import write_drg_csv
+
+RATINGS_CSV = os.path.join(os.path.dirname(__file__), "..", "..", "Hospital General Information.csv")
+
+
+def _truncate(engine):
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE hospital_data, star_rating RESTART IDENTITY"))
+
+
+def bench_ratings(engine, SessionLocal, loader):
+    with open(RATINGS_CSV, "rb") as f:
+        content = f.read().decode("latin1")
+    _truncate(engine)
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        result = asyncio.run(process_csv_hospital_rating(content, db, mode="append", loader=loader))
+        elapsed = time.perf_counter() - start
+        rows = db.execute(text("SELECT count(*) FROM star_rating")).scalar()
+    finally:
+        db.close()
+    return {"dataset": "Hospital General Information.csv", "loader": loader, "status": result["status"],
+            "rows": rows, "seconds": round(elapsed, 3), "rows_per_second": round(rows / elapsed, 1)}
+
+
+def bench_drg(engine, SessionLocal, loader, path, rows, chunk_size):
+    _truncate(engine)
+    db = SessionLocal()
+    try:
+        with open(path, "rb") as f:
+            start = time.perf_counter()
+            result = process_csv_hospital_data_stream(f, db, chunk_size=chunk_size, mode="append", loader=loader)
+            elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    return {"dataset": f"synthetic DRG ({rows} rows)", "loader": loader, "status": result["status"],
+            "rows": result["rows_written"], "seconds": round(elapsed, 3),
+            "rows_per_second": round(result["rows_written"] / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=2000000, help="Rows in the synthetic DRG file")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--loaders", default="orm,copy")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("set BENCH_DATABASE_URL or pass --database-url")
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    loaders = args.loaders.split(",")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_drg_csv(os.path.join(tmp, "drg.csv"), args.rows)
+        for loader in loaders:
+            results.append(bench_ratings(engine, SessionLocal, loader))
+            results.append(bench_drg(engine, SessionLocal, loader, path, args.rows, args.chunk_size))
+    _truncate(engine)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
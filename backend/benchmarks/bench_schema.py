@@ -0,0 +1,111 @@
+# benchmarks/bench_schema.py
+"""
+Compares the flat hospital_data table with the normalized provider / drg / provider_drg tables:
+on-disk size (heap + indexes) and latency of the /providers query for a few DRG keywords.
+
+Loads a synthetic DRG file flat, copies it with migrations.migrate_to_normalized and queries
+both layouts through provider_search.build_provider_query. Runs against BENCH_DATABASE_URL
+(or --database-url), PostgreSQL only. The tables are TRUNCATED first, so never point it at a
+database you care about.
+
+    python benchmarks/bench_schema.py --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from drg_search import DrgDictionary
+from etl import process_csv_hospital_data_stream
+from migrations import migrate_to_normalized, run_migrations
+from models.models import Base
+from provider_search import build_provider_query
+from benchmarks.synthetic import STATES, write_drg_csv
+
+TABLES = {"flat": ["hospital_data"], "normalized": ["provider", "drg", "provider_drg"]}
+KEYWORDS = ["knee", "heart failure", "sepsis", "chest pain"]
+
+
+def _truncate(engine):
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE hospital_data, provider_drg, provider, drg RESTART IDENTITY CASCADE"))
+
+
+def table_sizes(engine, schema_mode):
+    sizes = {"table_bytes": 0, "index_bytes": 0}
+    with engine.connect() as conn:
+        for table in TABLES[schema_mode]:
+            sizes["table_bytes"] += conn.execute(text(f"SELECT pg_table_size('{table}')")).scalar()
+            sizes["index_bytes"] += conn.execute(text(f"SELECT pg_indexes_size('{table}')")).scalar()
+    sizes["total_mb"] = round((sizes["table_bytes"] + sizes["index_bytes"]) / 1024 / 1024, 2)
+    return sizes
+
+
+def query_latency(SessionLocal, schema_mode, repeat):
+    zip_codes = [zip_code for _, _, zip_code in STATES]
+    db = SessionLocal()
+    try:
+        dictionary = DrgDictionary.from_db(db, schema_mode)
+        timings, rows = [], 0
+        for keyword in KEYWORDS:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = len(build_provider_query(db, keyword, zip_codes, schema_mode, dictionary).all())
+                timings.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    return {"median_ms": round(statistics.median(timings) * 1000, 2),
+            "p95_ms": round(sorted(timings)[int(len(timings) * 0.95) - 1] * 1000, 2),
+            "rows_last_query": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows in the synthetic DRG file")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs of each keyword query")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("set BENCH_DATABASE_URL or pass --database-url")
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    _truncate(engine)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_drg_csv(os.path.join(tmp, "drg.csv"), args.rows)
+        db = SessionLocal()
+        try:
+            with open(path, "rb") as f:
+                process_csv_hospital_data_stream(f, db, mode="append")
+        finally:
+            db.close()
+    migrate_to_normalized(engine)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE"))
+
+    results = []
+    for schema_mode in ("flat", "normalized"):
+        result = {"schema_mode": schema_mode, "rows": args.rows}
+        result.update(table_sizes(engine, schema_mode))
+        result.update(query_latency(SessionLocal, schema_mode, args.repeat))
+        results.append(result)
+    _truncate(engine)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/bench_snapshot.py
+"""
+Compares loading the raw CMS CSV through etl.py with restoring a Parquet snapshot of the same rows
+(snapshot.py), and reading the columnar engine's rows from the database with reading them from the snapshot.
+
+Loads a synthetic DRG file, exports a snapshot, restores it with --mode replace and checks that the table
+content is unchanged. Runs against BENCH_DATABASE_URL (or --database-url), PostgreSQL only, in the flat
+schema. hospital_data and star_rating are TRUNCATED, so never point it at a database you care about.
+
+    python benchmarks/bench_snapshot.py --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from columnar import ColumnarStore
+from etl import process_csv_hospital_data_stream
+from migrations import run_migrations
+from models.models import Base
+from snapshot import export_snapshot, restore_snapshot
+from benchmarks.synthetic import write_drg_csv
+
+CHECKSUM = """
+    SELECT COUNT(*), md5(string_agg(concat_ws('|', provider_id, ms_drg_definition, provider_name, provider_zip_code,
+                                              total_discharges, average_covered_charges, content_hash), ','
+                                    ORDER BY provider_id, ms_drg_definition))
+    FROM hospital_data
+"""
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows in the synthetic DRG file")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("set BENCH_DATABASE_URL or pass --database-url")
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE hospital_data, star_rating RESTART IDENTITY"))
+
+    results = {"rows": args.rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = write_drg_csv(os.path.join(tmp, "drg.csv"), args.rows)
+        results["csv_mb"] = round(os.path.getsize(csv_path) / 1024 / 1024, 2)
+        db = SessionLocal()
+        try:
+            with open(csv_path, "rb") as f:
+                _, results["csv_load_seconds"] = _timed(process_csv_hospital_data_stream, f, db, mode="append")
+        finally:
+            db.close()
+        with engine.connect() as conn:
+            before = tuple(conn.execute(text(CHECKSUM)).one())
+
+        snapshot_dir = os.path.join(tmp, "snapshot")
+        db = SessionLocal()
+        try:
+            manifest, results["export_seconds"] = _timed(export_snapshot, db, snapshot_dir)
+        finally:
+            db.close()
+        results["snapshot_mb"] = round(sum(t["bytes"] for t in manifest["tables"].values()) / 1024 / 1024, 2)
+
+        db = SessionLocal()
+        try:
+            restored, results["restore_seconds"] = _timed(restore_snapshot, db, snapshot_dir, "replace")
+            _, results["columnar_from_db_seconds"] = _timed(ColumnarStore.from_db, db, "flat")
+            _, results["columnar_from_snapshot_seconds"] = _timed(ColumnarStore.from_snapshot, snapshot_dir,
+                                                                  restored["data_version"])
+        finally:
+            db.close()
+        with engine.connect() as conn:
+            results["restored_identical"] = tuple(conn.execute(text(CHECKSUM)).one()) == before
+
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE hospital_data, star_rating RESTART IDENTITY"))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start cost of the API, each figure the median over --runs fresh processes:
+
+- import_seconds: `import api.apis` in a new interpreter, plus the slowest modules (cumulative, from
+  python -X importtime) of one extra import,
+- health_seconds: from launching `uvicorn api.apis:app` to the first 200 from /health,
+- first_request_seconds: from launching it to the first response to a /providers search (the
+  load_test.py default) sent right after /health answered,
+- ready_seconds: from launching it to the first 200 from /ready, i.e. the end of the background warm-up.
+
+Runs against BENCH_DATABASE_URL (or --database-url), which must already be migrated and is only read,
+e.g. one loaded by suite.py. Without one, a fresh SQLite file is migrated and the search finds nothing.
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/bench python benchmarks/bench_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+
+from benchmarks.load_test import DEFAULT_PATH, DEFAULT_PARAMS
+
+SERVER_START_TIMEOUT = 120
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import api.apis; print(time.perf_counter() - t)"
+
+
+def _env(database_url: str) -> dict:
+    return dict(os.environ, DATABASE_URL=database_url, OPEN_AI_API=os.getenv("OPEN_AI_API", "benchmark"),
+                PYTHONPATH=BACKEND_DIR)
+
+
+def measure_import(database_url: str) -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=_env(database_url),
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(database_url: str, count: int) -> list:
+    """
+    The `count` top-level modules with the largest cumulative import time, in ms.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api.apis"], cwd=BACKEND_DIR,
+                            env=_env(database_url), capture_output=True, text=True, check=True)
+    modules, children = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entry = {"module": name.strip(), "ms": round(int(cumulative) / 1000, 1)}
+        # A module is listed after the ones it imported, each nesting level indented by two more spaces
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append(entry)
+        elif depth == 0:
+            if entry["module"] == "api.apis":
+                modules = [entry] + children
+            children = []
+    return sorted(modules, key=lambda m: m["ms"], reverse=True)[:count]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(client: httpx.Client, process: subprocess.Popen, path: str, started: float, params=None):
+    deadline = started + SERVER_START_TIMEOUT
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with status {process.returncode}")
+        try:
+            response = client.get(path, params=params)
+            if params is not None or response.status_code == 200:
+                return time.perf_counter() - started, response.status_code
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{path} not answered after {SERVER_START_TIMEOUT}s")
+
+
+def measure_server(database_url: str) -> dict:
+    port = _free_port()
+    command = [sys.executable, "-m", "uvicorn", "api.apis:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=_env(database_url), stdout=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=SERVER_START_TIMEOUT) as client:
+            health, _ = _wait_for(client, process, "/health", started)
+            first_request, status = _wait_for(client, process, DEFAULT_PATH, started, DEFAULT_PARAMS)
+            ready, _ = _wait_for(client, process, "/ready", started)
+    finally:
+        process.terminate()
+        process.wait()
+    return {"health_seconds": health, "first_request_seconds": first_request, "first_request_status": status,
+            "ready_seconds": ready}
+
+
+def _median(values) -> float:
+    return round(statistics.median(values), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imported modules to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url
+        if not database_url:
+            from sqlalchemy import create_engine
+            from migrations import migrate
+
+            database_url = f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+            engine = create_engine(database_url)
+            migrate(engine)
+            engine.dispose()
+
+        imports = [measure_import(database_url) for _ in range(args.runs)]
+        servers = [measure_server(database_url) for _ in range(args.runs)]
+        report = {
+            "runs": args.runs,
+            "database": database_url.split(":", 1)[0],
+            "env": {name: os.getenv(name) for name in ("COLUMNAR_ENGINE_ENABLED", "WARMUP_ON_STARTUP", "MIGRATE_ON_STARTUP",
+                                                       "FAST_PATH_ENABLED") if os.getenv(name) is not None},
+            "import_seconds": _median(imports),
+            "health_seconds": _median([s["health_seconds"] for s in servers]),
+            "first_request_seconds": _median([s["first_request_seconds"] for s in servers]),
+            "first_request_status": servers[-1]["first_request_status"],
+            "ready_seconds": _median([s["ready_seconds"] for s in servers]),
+            "slowest_imports": slowest_imports(database_url, args.top),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+# benchmarks/fake_app.py
+"""
+The API with benchmarks/fake_llm.py in place of the OpenAI client, as an import string for uvicorn
+workers (benchmarks.fake_app:app). Every worker imports it and installs its own fake, configured by
+BENCH_LLM_LATENCY_MS and BENCH_LLM_TOKEN_MS.
+"""
+
+import os
+
+from api import apis
+from benchmarks.fake_llm import fake_ai_service
+
+apis.global_ai_service_instance = fake_ai_service(float(os.getenv("BENCH_LLM_LATENCY_MS", "500")) / 1000,
+                                                  float(os.getenv("BENCH_LLM_TOKEN_MS", "20")) / 1000)
+app = apis.app
@@ -0,0 +1,77 @@
+# benchmarks/fake_llm.py
+"""
+Stand-in for the OpenAI client, so /ask and /ws/ask can be benchmarked without network access.
+
+FakeChatClient has the AsyncOpenAI chat.completions.create interface that AIService uses. A SQL request
+is answered with a fixed query over the configured schema after `latency` seconds; a summary request with
+a fixed sentence, whole or, with stream=True, one word every `token_latency` seconds after the first.
+A batched SQL request (JSON mode) gets the same query for every question id.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import List
+
+from ai_service.ai_service import AIService
+
+FLAT_SQL = ("SELECT hd.provider_id, hd.provider_name, hd.provider_city, hd.ms_drg_definition, hd.average_covered_charges "
+            "FROM hospital_data AS hd WHERE hd.ms_drg_definition LIKE '%HEART FAILURE%' "
+            "ORDER BY hd.average_covered_charges ASC LIMIT 10;")
+NORMALIZED_SQL = ("SELECT p.provider_id, p.provider_name, p.provider_city, d.ms_drg_definition, pd.average_covered_charges "
+                  "FROM provider_drg AS pd JOIN provider AS p ON p.provider_id = pd.provider_id "
+                  "JOIN drg AS d ON d.drg_id = pd.drg_id WHERE d.ms_drg_definition LIKE '%HEART FAILURE%' "
+                  "ORDER BY pd.average_covered_charges ASC LIMIT 10;")
+SUMMARY = ("Based on the data, the least expensive hospitals for heart failure treatment are listed above, "
+           "with average covered charges starting well below the national average.")
+
+
+def _words(text: str) -> List[str]:
+    words = text.split(" ")
+    return [w + " " for w in words[:-1]] + words[-1:]
+
+
+class _Stream:
+    def __init__(self, text: str, latency: float, token_latency: float):
+        self._words = _words(text)
+        self._latency = latency
+        self._token_latency = token_latency
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        await asyncio.sleep(self._latency)
+        for i, word in enumerate(self._words):
+            if i:
+                await asyncio.sleep(self._token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+
+class FakeChatClient:
+    def __init__(self, latency: float = 0.5, token_latency: float = 0.02):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model: str, messages, stream: bool = False, **kwargs):
+        self.calls += 1
+        system_prompt = messages[0]["content"]
+        if "SQL query generator" in system_prompt:
+            text = NORMALIZED_SQL if "Table Name: provider_drg" in system_prompt else FLAT_SQL
+            if kwargs.get("response_format", {}).get("type") == "json_object":
+                text = json.dumps({question_id: text for question_id in json.loads(messages[-1]["content"])})
+        else:
+            text = SUMMARY
+        if stream:
+            return _Stream(text, self.latency, self.token_latency)
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def fake_ai_service(latency: float = 0.5, token_latency: float = 0.02) -> AIService:
+    """
+    An AIService whose model calls go to a FakeChatClient, with the SQL cache as configured.
+    """
+    return AIService(api_key="benchmark", client=FakeChatClient(latency, token_latency))
@@ -0,0 +1,104 @@
+# benchmarks/load_test.py
+"""
+Concurrent load test for a running API. Fires GET requests at each concurrency level and reports
+throughput and latency percentiles. Alongside the load it polls a cheap probe endpoint (/health): if
+database work blocked the event loop, the probe would queue behind every in-flight request.
+
+    uvicorn api.apis:app --port 8000 &
+    python benchmarks/load_test.py --url http://localhost:8000 --concurrency 1,4,16,64
+
+The default request is a /providers search over the synthetic data set (benchmarks/synthetic.py);
+pass --path and --params for anything else.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+DEFAULT_PATH = "/providers"
+DEFAULT_PARAMS = {"zip_code": "36301", "radius_km": "400", "ms_drg": "heart", "sort": "price", "limit": "50"}
+
+
+async def _worker(client, path, params, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, params=params)
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+
+async def _probe(client, probe_path, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            await client.get(probe_path)
+        except httpx.HTTPError:
+            pass  # a probe that times out still counts, with the time it waited
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.1)
+
+
+def _percentile(latencies, q):
+    if not latencies:
+        return None
+    latencies = sorted(latencies)
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1)
+
+
+async def run_level(url, path, params, concurrency, seconds, probe_path):
+    latencies, errors, probe_latencies = [], [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        await client.get(path, params=params)  # warm up
+        start = time.perf_counter()
+        deadline = start + seconds
+        async with httpx.AsyncClient(base_url=url, timeout=60) as probe_client:
+            await asyncio.gather(
+                _probe(probe_client, probe_path, deadline, probe_latencies),
+                *[_worker(client, path, params, deadline, latencies, errors) for _ in range(concurrency)],
+            )
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+        "probe_p50_ms": _percentile(probe_latencies, 0.5),
+        "probe_p95_ms": _percentile(probe_latencies, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--params", default=json.dumps(DEFAULT_PARAMS), help="Query parameters as a JSON object")
+    parser.add_argument("--probe-path", default="/health")
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of each concurrency level")
+    args = parser.parse_args()
+
+    params = json.loads(args.params)
+    results = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        results.append(asyncio.run(run_level(args.url, args.path, params, concurrency, args.seconds, args.probe_path)))
+        print(json.dumps(results[-1]))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
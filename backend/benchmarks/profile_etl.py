@@ -0,0 +1,167 @@
+# benchmarks/profile_etl.py
+"""
+Per-stage time and peak RSS of the ETL transform pipeline (etl.py) for:
+
+- the hospital rating file (Hospital General Information.csv) and a 10x synthetic copy of it, whose
+  rows repeat the original ones under new provider ids,
+- a synthetic CMS DRG file of --drg-rows rows, read in upload-sized chunks.
+
+Each file is profiled in a fresh process, so peak RSS is the file's own. Stages are cumulative over the
+chunks of a file; peak_rss_mb is the process's high-water mark at the end of the stage. With
+--database-url (or BENCH_DATABASE_URL) the insert stage runs as well, as an upsert inside a transaction
+that is rolled back, so the database is left unchanged.
+
+    python benchmarks/profile_etl.py --ratings "../Hospital General Information.csv" --drg-rows 1000000
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+DEFAULT_RATINGS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                               "Hospital General Information.csv")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {"seconds": 0.0})
+            entry["seconds"] = round(entry["seconds"] + time.perf_counter() - start, 4)
+            entry["peak_rss_mb"] = _peak_rss_mb()
+
+
+def _session(database_url):
+    if not database_url:
+        return None
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    return sessionmaker(bind=create_engine(database_url))()
+
+
+def profile_ratings(path: str, database_url=None) -> dict:
+    from etl import LATIN1_FALLBACK, detect_encoding, fill_missing_ratings, read_hospital_rating_csv, _transform_hospital_rating, write_dataframe
+    from models.models import StarRating
+
+    timer = StageTimer()
+    with timer.stage("read_decode"):
+        with open(path, "rb") as f:
+            encoding = detect_encoding(f)
+            text = f.read().decode(encoding, LATIN1_FALLBACK)
+    with timer.stage("parse"):
+        df = read_hospital_rating_csv(io.StringIO(text))
+    del text
+    with timer.stage("transform_hash"):
+        df = _transform_hospital_rating(df)
+    with timer.stage("fill_ratings"):
+        df = fill_missing_ratings(df)
+    db = _session(database_url)
+    if db is not None:
+        try:
+            with timer.stage("insert"):
+                write_dataframe(df, StarRating, db, "upsert")
+        finally:
+            db.rollback()
+            db.close()
+    return {"file": os.path.basename(path), "rows": len(df), "stages": timer.stages, "peak_rss_mb": _peak_rss_mb()}
+
+
+def profile_drg(path: str, chunk_size: int, database_url=None) -> dict:
+    from etl import detect_encoding, read_hospital_data_csv, _transform_hospital_data, write_hospital_data
+
+    timer = StageTimer()
+    db = _session(database_url)
+    rows = 0
+    try:
+        with open(path, "rb") as f:
+            reader = read_hospital_data_csv(f, chunksize=chunk_size, encoding=detect_encoding(f))
+            while True:
+                with timer.stage("parse"):
+                    chunk = next(reader, None)
+                if chunk is None:
+                    break
+                with timer.stage("transform_hash"):
+                    df = _transform_hospital_data(chunk)
+                rows += len(df)
+                if db is not None:
+                    with timer.stage("insert"):
+                        write_hospital_data(df, db, "upsert")
+    finally:
+        if db is not None:
+            db.rollback()
+            db.close()
+    return {"file": os.path.basename(path), "rows": rows, "stages": timer.stages, "peak_rss_mb": _peak_rss_mb()}
+
+
+def write_scaled_ratings(source: str, target: str, factor: int) -> str:
+    """
+    Writes `factor` copies of the rating file, every copy under provider ids shifted by a multiple of 1,000,000.
+    """
+    with open(source, "rb") as f:
+        from etl import detect_encoding
+        encoding = detect_encoding(f)
+    df = pd.read_csv(source, dtype=str, keep_default_na=False, encoding=encoding)
+    ids = pd.to_numeric(df["Provider ID"], errors="coerce")
+    copies = []
+    for k in range(factor):
+        copy = df.copy()
+        copy["Provider ID"] = (ids + k * 1000000).astype("Int64").astype(str).str.zfill(6)
+        copies.append(copy)
+    pd.concat(copies).to_csv(target, index=False, encoding=encoding)
+    return target
+
+
+def _run(fn, *args) -> dict:
+    # A fresh process per file, so every peak RSS starts from the interpreter's baseline
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ratings", default=DEFAULT_RATINGS, help="Hospital General Information.csv")
+    parser.add_argument("--scale", type=int, default=10, help="Copies of the rating file in the synthetic one")
+    parser.add_argument("--drg-rows", type=int, default=1000000, help="Rows in the synthetic DRG file, 0 to skip")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per DRG batch, as in the upload")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    args = parser.parse_args()
+
+    from benchmarks.synthetic import write_drg_csv
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        results.append(_run(profile_ratings, args.ratings, args.database_url))
+        scaled = write_scaled_ratings(args.ratings, os.path.join(tmp, f"ratings_x{args.scale}.csv"), args.scale)
+        results.append(_run(profile_ratings, scaled, args.database_url))
+        if args.drg_rows:
+            drg = write_drg_csv(os.path.join(tmp, "drg.csv"), args.drg_rows)
+            results.append(_run(profile_drg, drg, args.chunk_size, args.database_url))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+# benchmarks/suite.py
+"""
+End-to-end benchmark of the backend, reproducible across commits. For every --rows size it:
+
+1. generates a synthetic CMS DRG file (benchmarks/synthetic.py, deterministic) and loads it, together with
+   Hospital General Information.csv, through etl.py in a fresh process (time, rows/s, peak RSS),
+2. starts the API under uvicorn in a child process, with --workers worker processes and the OpenAI client
+   replaced by benchmarks/fake_llm.py (--llm-latency-ms before the first token, --llm-token-ms between
+   streamed ones),
+3. drives it at each --concurrency level for --seconds: GET /providers (with a /health probe, as in
+   load_test.py), POST /ask with a new question every time, and /ws/ask, one WebSocket per client asking
+   one question at a time,
+4. records the server's cache and LLM call counters (/cache/stats, from whichever worker answers) and the
+   memory of its process tree (RSS and PSS summed over all processes, where /proc is available; PSS
+   counts pages shared between workers once), stops it and records its peak RSS.
+
+The report is printed, and written to --output, as JSON with the commit, the settings and, per scenario
+and level, throughput and p50/p95/p99 latency in ms (for /ws/ask also the time to the first token).
+
+Runs against BENCH_DATABASE_URL (or --database-url), whose data tables are TRUNCATED first, so never
+point it at a database you care about. Without one, every size gets a fresh SQLite file as an in-process
+stand-in; it needs no server but loads through ORM inserts, so use PostgreSQL for the large sizes.
+Caches, the fast path and the columnar engine follow the usual environment variables, which are recorded
+in the report; set SQL_CACHE_ENABLED=false to have every /ask question go to the (fake) model.
+
+    python benchmarks/suite.py --rows 10000 --output bench-10k.json
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/bench python benchmarks/suite.py --rows 1000000,10000000 \\
+        --data-dir /var/tmp/bench-data --output bench-large.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+import numpy as np
+
+from benchmarks.load_test import DEFAULT_PARAMS, run_level
+from benchmarks.profile_etl import DEFAULT_RATINGS, StageTimer, _peak_rss_mb
+
+DATA_TABLES = ["hospital_data", "star_rating", "provider_drg", "provider", "drg",
+               "drg_state_stats", "drg_provider_stats", "provider_rating_stats"]
+# Settings that change what is measured, recorded with every report
+RECORDED_ENV = ["SCHEMA_MODE", "DB_ASYNC", "DB_POOL_SIZE", "COLUMNAR_ENGINE_ENABLED", "SNAPSHOT_DIR",
+                "SQL_CACHE_ENABLED", "RESULT_CACHE_URL", "FAST_PATH_ENABLED", "WS_MAX_INFLIGHT"]
+QUESTION = "Which hospitals are the least expensive for heart failure treatment? (benchmark question {n})"
+SERVER_START_TIMEOUT = 120
+
+
+# --- Loading ---
+
+def load_data(database_url: str, drg_path: str, ratings_path: str) -> dict:
+    """
+    Empties the data tables and loads both files through the ETL, the way upload jobs do.
+    Runs in its own process, so peak RSS is the load's own.
+    """
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+    from etl import LATIN1_FALLBACK, detect_encoding, process_csv_hospital_data_stream, process_csv_hospital_rating
+    from migrations import run_migrations
+    from models.models import Base
+
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {', '.join(DATA_TABLES)} RESTART IDENTITY"))
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    timer = StageTimer()
+    try:
+        with timer.stage("hospital_data"):
+            with open(drg_path, "rb") as f:
+                drg = process_csv_hospital_data_stream(f, db, mode="append")
+        with timer.stage("star_rating"):
+            with open(ratings_path, "rb") as f:
+                encoding = detect_encoding(f)
+                ratings = asyncio.run(process_csv_hospital_rating(f.read().decode(encoding, LATIN1_FALLBACK), db, mode="upsert"))
+    finally:
+        db.close()
+        engine.dispose()
+    for result in (drg, ratings):
+        if result["status"] != "success":
+            raise RuntimeError(f"Loading failed: {result.get('message')}")
+
+    seconds = timer.stages["hospital_data"]["seconds"]
+    return {
+        "hospital_data_rows": drg["rows_written"],
+        "star_rating_rows": ratings["rows_written"],
+        "hospital_data_rows_per_second": round(drg["rows_written"] / seconds, 1) if seconds else None,
+        "stages": timer.stages,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _drg_file(data_dir: str, rows: int) -> str:
+    from benchmarks.synthetic import write_drg_csv
+
+    # The file only depends on the row count, so a kept --data-dir is reused across runs
+    path = os.path.join(data_dir, f"drg_{rows}.csv")
+    if not os.path.exists(path):
+        write_drg_csv(path + ".tmp", rows)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+# --- Server ---
+
+def serve(port: int, workers: int):
+    """
+    Runs the API with the fake model (benchmarks/fake_app.py) until SIGINT or SIGTERM, in this process or,
+    like main.py with API_WORKERS, in `workers` worker processes sharing a SHARED_STATE_DIR.
+    """
+    import uvicorn
+
+    if workers <= 1:
+        uvicorn.run("benchmarks.fake_app:app", host="127.0.0.1", port=port, log_level="warning")
+        return
+    # load_data() has created and migrated the schema
+    with tempfile.TemporaryDirectory(prefix="suite-shared-") as shared_dir:
+        os.environ.setdefault("SHARED_STATE_DIR", shared_dir)
+        uvicorn.run("benchmarks.fake_app:app", host="127.0.0.1", port=port, log_level="warning", workers=workers)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid: int) -> list:
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name in parentheses may contain spaces, the parent pid follows it
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == pid:
+                children.append(int(entry))
+    return children
+
+
+def process_tree_memory(pid: int) -> Optional[dict]:
+    """
+    RSS and PSS in MB summed over `pid` and its descendants, from /proc/<pid>/smaps_rollup; None without it.
+    """
+    if not os.path.exists(f"/proc/{pid}/smaps_rollup"):
+        return None
+    totals = {"processes": 0, "rss_mb": 0.0, "pss_mb": 0.0}
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(_children(current))
+        try:
+            with open(f"/proc/{current}/smaps_rollup") as f:
+                fields = {line.split(":")[0]: line.split()[1] for line in f if line.startswith(("Rss:", "Pss:"))}
+        except OSError:
+            continue  # exited in the meantime
+        totals["processes"] += 1
+        totals["rss_mb"] += int(fields.get("Rss", 0)) / 1024
+        totals["pss_mb"] += int(fields.get("Pss", 0)) / 1024
+    totals["rss_mb"] = round(totals["rss_mb"], 1)
+    totals["pss_mb"] = round(totals["pss_mb"], 1)
+    return totals
+
+
+class Server:
+    """
+    The API in a child process. stop() returns the peak RSS in MB of the largest process in its tree, from
+    its resource usage.
+    """
+
+    def __init__(self, database_url: str, llm_latency: float, llm_token_latency: float, workers: int = 1):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, DATABASE_URL=database_url, OPEN_AI_API=os.getenv("OPEN_AI_API", "benchmark"),
+                   PYTHONPATH=BACKEND_DIR, BENCH_LLM_LATENCY_MS=str(llm_latency * 1000),
+                   BENCH_LLM_TOKEN_MS=str(llm_token_latency * 1000))
+        command = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(self.port), "--workers", str(workers)]
+        # The API prints every generated SQL query; only errors are of interest here
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+
+    def wait_ready(self):
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"API server exited with status {self.process.returncode}")
+            try:
+                if httpx.get(self.url + "/health", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise TimeoutError(f"API server not ready after {SERVER_START_TIMEOUT}s")
+
+    def stop(self) -> Optional[float]:
+        if self.process.poll() is not None:
+            return None  # already exited and reaped, its resource usage is gone
+        self.process.send_signal(signal.SIGINT)
+        _, _, usage = os.wait4(self.process.pid, 0)
+        self.process.returncode = 0  # reaped by wait4, keep Popen from waiting for it again
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return round(usage.ru_maxrss / scale, 1)
+
+
+# --- Clients ---
+
+def _latency_stats(latencies, prefix: str = "") -> dict:
+    if not latencies:
+        return {f"{prefix}p50_ms": None, f"{prefix}p95_ms": None, f"{prefix}p99_ms": None}
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {f"{prefix}p50_ms": round(float(p50), 1), f"{prefix}p95_ms": round(float(p95), 1),
+            f"{prefix}p99_ms": round(float(p99), 1)}
+
+
+async def _ask_worker(client, questions, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            question = QUESTION.format(n=next(questions))
+            response = await client.post("/ask", params={"natural_language_query": question})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+
+async def run_ask_level(url: str, concurrency: int, seconds: float, questions) -> dict:
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        deadline = start + seconds
+        await asyncio.gather(*[_ask_worker(client, questions, deadline, latencies, errors) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "requests": len(latencies), "errors": len(errors),
+            "requests_per_second": round(len(latencies) / elapsed, 1), **_latency_stats(latencies)}
+
+
+async def _ws_worker(url, questions, deadline, latencies, first_token_latencies, errors):
+    from websockets.asyncio.client import connect
+    from websockets.exceptions import WebSocketException
+
+    try:
+        async with connect(url, open_timeout=60, max_size=None) as websocket:
+            while time.perf_counter() < deadline:
+                request_id = str(next(questions))
+                start = time.perf_counter()
+                first_token = None
+                await websocket.send(json.dumps({"id": request_id, "question": QUESTION.format(n=request_id)}))
+                while True:
+                    frame = json.loads(await websocket.recv())
+                    if frame.get("id") != request_id:
+                        continue
+                    if frame["type"] == "token" and first_token is None:
+                        first_token = time.perf_counter() - start
+                    elif frame["type"] in ("done", "error"):
+                        break
+                if frame["type"] == "done":
+                    latencies.append(time.perf_counter() - start)
+                    if first_token is not None:
+                        first_token_latencies.append(first_token)
+                else:
+                    errors.append(frame.get("message"))
+    except (OSError, WebSocketException) as e:
+        errors.append(type(e).__name__)
+
+
+async def run_ws_level(url: str, concurrency: int, seconds: float, questions) -> dict:
+    latencies, first_token_latencies, errors = [], [], []
+    ws_url = url.replace("http://", "ws://", 1) + "/ws/ask"
+    start = time.perf_counter()
+    deadline = start + seconds
+    await asyncio.gather(*[_ws_worker(ws_url, questions, deadline, latencies, first_token_latencies, errors)
+                           for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "questions": len(latencies), "errors": len(errors),
+            "questions_per_second": round(len(latencies) / elapsed, 1), **_latency_stats(latencies),
+            **_latency_stats(first_token_latencies, "first_token_")}
+
+
+def run_scenarios(url: str, scenarios, levels, seconds: float) -> dict:
+    # One counter for all levels and both question scenarios, so no question is ever repeated in a run
+    questions = itertools.count()
+    results = {}
+    for scenario in scenarios:
+        results[scenario] = []
+        for concurrency in levels:
+            if scenario == "providers":
+                result = asyncio.run(run_level(url, "/providers", DEFAULT_PARAMS, concurrency, seconds, "/health"))
+            elif scenario == "ask":
+                result = asyncio.run(run_ask_level(url, concurrency, seconds, questions))
+            else:
+                result = asyncio.run(run_ws_level(url, concurrency, seconds, questions))
+            print(json.dumps({"scenario": scenario, **result}), file=sys.stderr)
+            results[scenario].append(result)
+    return results
+
+
+# --- Report ---
+
+def _commit() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def run_size(rows: int, args, data_dir: str) -> dict:
+    database_url = args.database_url or f"sqlite:///{os.path.join(data_dir, f'suite_{rows}.db')}"
+    if not args.database_url and os.path.exists(database_url[len("sqlite:///"):]):
+        os.remove(database_url[len("sqlite:///"):])
+
+    started = time.perf_counter()
+    drg_path = _drg_file(data_dir, rows)
+    result = {"rows": rows, "generate_seconds": round(time.perf_counter() - started, 3)}
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        result["etl"] = executor.submit(load_data, database_url, drg_path, args.ratings).result()
+
+    server = Server(database_url, args.llm_latency_ms / 1000, args.llm_token_ms / 1000, args.workers)
+    try:
+        server.wait_ready()
+        result["scenarios"] = run_scenarios(server.url, args.scenarios, args.levels, args.seconds)
+        # LLM calls made and saved, and cache hit rates, over the whole run
+        result["server_stats"] = httpx.get(server.url + "/cache/stats", timeout=10).json()
+        result["server_memory"] = process_tree_memory(server.process.pid)
+    finally:
+        result["server_peak_rss_mb"] = server.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="PostgreSQL to benchmark against, a fresh SQLite file per size when unset")
+    parser.add_argument("--rows", default="10000", help="Comma-separated sizes of the synthetic DRG file, e.g. 10000,1000000,10000000")
+    parser.add_argument("--ratings", default=DEFAULT_RATINGS, help="Hospital General Information.csv")
+    parser.add_argument("--scenarios", default="providers,ask,ws", help="Any of providers, ask, ws")
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of each concurrency level")
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0, help="Fake model delay before its answer or first token")
+    parser.add_argument("--llm-token-ms", type=float, default=20.0, help="Fake model delay between streamed tokens")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes, as API_WORKERS in main.py")
+    parser.add_argument("--data-dir", help="Where generated files are kept and reused, a temporary directory when unset")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",")]
+    unknown = set(args.scenarios) - {"providers", "ask", "ws"}
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.levels = [int(c) for c in args.concurrency.split(",")]
+
+    report = {
+        **_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": args.database_url.split(":", 1)[0] if args.database_url else "sqlite",
+        "settings": {
+            "seconds": args.seconds,
+            "concurrency": args.levels,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_token_ms": args.llm_token_ms,
+            "workers": args.workers,
+            "providers_params": DEFAULT_PARAMS,
+            "env": {name: os.getenv(name) for name in RECORDED_ENV if os.getenv(name) is not None},
+        },
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        for rows in (int(r) for r in args.rows.split(",")):
+            report["runs"].append(run_size(rows, args, data_dir))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve_parser = argparse.ArgumentParser(description="Runs the API with the fake model, started by the suite.")
+        serve_parser.add_argument("command", choices=["serve"])
+        serve_parser.add_argument("--port", type=int, required=True)
+        serve_parser.add_argument("--workers", type=int, default=1)
+        serve_args = serve_parser.parse_args()
+        serve(serve_args.port, serve_args.workers)
+    else:
+        main()
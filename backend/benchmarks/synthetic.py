@@ -0,0 +1,81 @@
+# benchmarks/synthetic.py
+"""
+Generates synthetic CMS inpatient (MUP_INP ... PrvSvc) shaped CSV files for benchmarks.
+"""
+
+import csv
+import random
+
+CMS_DRG_COLUMNS = [
+    "Rndrng_Prvdr_CCN",
+    "Rndrng_Prvdr_Org_Name",
+    "Rndrng_Prvdr_St",
+    "Rndrng_Prvdr_City",
+    "Rndrng_Prvdr_State_Abrvtn",
+    "Rndrng_Prvdr_State_FIPS",
+    "Rndrng_Prvdr_Zip5",
+    "Rndrng_Prvdr_RUCA",
+    "Rndrng_Prvdr_RUCA_Desc",
+    "DRG_Cd",
+    "DRG_Desc",
+    "Tot_Dschrgs",
+    "Avg_Submtd_Cvrd_Chrg",
+    "Avg_Tot_Pymt_Amt",
+    "Avg_Mdcr_Pymt_Amt",
+]
+
+DRG_STEMS = [
+    "MAJOR HIP AND KNEE JOINT REPLACEMENT OR REATTACHMENT OF LOWER EXTREMITY",
+    "HEART FAILURE AND SHOCK",
+    "SIMPLE PNEUMONIA AND PLEURISY",
+    "SEPTICEMIA OR SEVERE SEPSIS WITHOUT MV >96 HOURS",
+    "INTRACRANIAL HEMORRHAGE OR CEREBRAL INFARCTION",
+    "CHEST PAIN",
+    "PERCUTANEOUS CARDIOVASCULAR PROCEDURES WITH DRUG-ELUTING STENT",
+    "CORONARY BYPASS WITH CARDIAC CATHETERIZATION",
+    "CHRONIC OBSTRUCTIVE PULMONARY DISEASE",
+    "KIDNEY AND URINARY TRACT INFECTIONS",
+]
+DRG_SUFFIXES = ["WITH MCC", "WITH CC", "WITHOUT CC/MCC", "WITH CC/MCC", "WITHOUT MCC"]
+STATES = [("AL", "DOTHAN", "36301"), ("AL", "HUNTSVILLE", "35801"), ("TX", "WEATHERFORD", "76065"),
+          ("CA", "BEVERLY HILLS", "90210"), ("CA", "LOS ANGELES", "90001"), ("NY", "NEW YORK", "10001")]
+
+
+def write_drg_csv(path: str, rows: int, providers: int = 3000, drgs: int = 700, seed: int = 42,
+                  max_charge: float = 250000) -> str:
+    """
+    Writes `rows` CMS-shaped DRG rows to `path`, with covered charges up to `max_charge`.
+    Output is deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    drg_names = [
+        f"{DRG_STEMS[i % len(DRG_STEMS)]} {DRG_SUFFIXES[(i // len(DRG_STEMS)) % len(DRG_SUFFIXES)]} {i:03d}"
+        for i in range(drgs)
+    ]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CMS_DRG_COLUMNS)
+        for i in range(rows):
+            provider = i % providers
+            drg = (i // providers + provider) % drgs
+            state, city, zip_code = STATES[provider % len(STATES)]
+            covered = rng.uniform(5000, max_charge)
+            total = covered * rng.uniform(0.15, 0.4)
+            writer.writerow([
+                f"{10001 + provider:06d}",
+                f"SYNTHETIC MEDICAL CENTER {provider}",
+                f"{provider} MAIN ST",
+                city,
+                state,
+                "01",
+                zip_code,
+                "1",
+                "Metropolitan area core: primary flow within an urbanized area of 50,000 and greater",
+                f"{drg:03d}",
+                drg_names[drg],
+                rng.randint(11, 500),
+                round(covered, 2),
+                round(total, 2),
+                round(total * rng.uniform(0.7, 0.95), 2),
+            ])
+    return path
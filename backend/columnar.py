@@ -0,0 +1,297 @@
+# columnar.py
+"""
+In-process columnar copy of the /providers data, so a search does not need a round trip to Postgres.
+
+Every (provider, DRG) row of hospital_data (or provider_drg in the normalized schema), joined with its
+star_rating, is held in NumPy arrays: integer codes into sorted category arrays for the DRG, ZIP code,
+state, city and provider name, float32 prices and ratings for filtering and sorting, the float64 prices
+and payments that are served and put in cursors, and an int32 provider id, a few dozen bytes per row.
+Rows are sorted by DRG so that a keyword, resolved to DRG codes with a DrgDictionary, selects contiguous
+slices. The ZIP filter, the cheapest-row-per-provider dedup and the (price, provider_id) ordering are array
+operations over those slices. Served prices and price cursors are the float64 values the SQL path returns,
+so a pagination session can move between the two paths. The order is computed on float32 prices though:
+prices closer together than float32 resolution (over a cent above $131,072, an eighth of a dollar above $1,048,576)
+compare equal, so such near-ties are ordered by provider_id, and a provider with two near-equal rows may
+show either. Where that happens, rows can differ from provider_search.cheapest_per_provider and a cursor
+can skip or repeat a near-tied row when the next page is served by the other path.
+
+The data only changes on upload, so a snapshot is tagged with the data version it was read at. The API
+reloads it after each upload it committed and polls the version for uploads committed by other processes;
+a reload builds a new snapshot and swaps the reference, so a search sees either the old or the new one.
+When SNAPSHOT_DIR holds a Parquet snapshot of the current data version (snapshot.py), the rows are read
+from it, memory-mapped, instead of from the database. With several API workers the arrays are built by
+one of them and memory-mapped by all (shared_state.py).
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from data_version import get_data_version
+from drg_search import DrgDictionary
+from models.models import HospitalData, StarRating, Provider, Drg, ProviderDrg, SCHEMA_MODE
+from shared_state import load_or_build, string_array
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+COLUMNAR_ENGINE_ENABLED = os.getenv("COLUMNAR_ENGINE_ENABLED", "false").lower() in ("1", "true", "yes")
+# How often the API checks for uploads committed by other processes
+COLUMNAR_REFRESH_SECONDS = float(os.getenv("COLUMNAR_REFRESH_SECONDS", "5"))
+
+_CATEGORIES = ("ms_drg_definition", "provider_zip_code", "provider_state", "provider_city", "provider_name")
+_CODES = {"ms_drg_definition": "drg", "provider_zip_code": "zip_code", "provider_state": "state",
+          "provider_city": "city", "provider_name": "name"}
+_VALUES = ("provider_id", "price", "exact_price", "payments", "discharges", "rating")
+
+
+class ProviderRow(NamedTuple):
+    provider_id: int
+    provider_name: Optional[str]
+    provider_city: Optional[str]
+    provider_state: Optional[str]
+    provider_zip_code: Optional[str]
+    ms_drg_definition: str
+    total_discharges: Optional[int]
+    average_covered_charges: Optional[float]
+    average_total_payments: Optional[float]
+    overall_rating: Optional[int]
+
+
+def _rows_query(schema_mode: str):
+    if schema_mode == "normalized":
+        return select(
+            Provider.provider_id, Provider.provider_name, Provider.provider_city, Provider.provider_state,
+            Provider.provider_zip_code, Drg.ms_drg_definition, ProviderDrg.total_discharges,
+            ProviderDrg.average_covered_charges, ProviderDrg.average_total_payments, StarRating.overall_rating,
+        ).select_from(ProviderDrg) \
+            .join(Provider, ProviderDrg.provider_id == Provider.provider_id) \
+            .join(Drg, ProviderDrg.drg_id == Drg.drg_id) \
+            .outerjoin(StarRating, ProviderDrg.provider_id == StarRating.provider_id)
+
+    return select(
+        HospitalData.provider_id, HospitalData.provider_name, HospitalData.provider_city, HospitalData.provider_state,
+        HospitalData.provider_zip_code, HospitalData.ms_drg_definition, HospitalData.total_discharges,
+        HospitalData.average_covered_charges, HospitalData.average_total_payments, StarRating.overall_rating,
+    ).outerjoin(StarRating, HospitalData.provider_id == StarRating.provider_id) \
+        .where(HospitalData.provider_id.is_not(None), HospitalData.ms_drg_definition.is_not(None))
+
+
+def _optional(categories: np.ndarray, code) -> Optional[str]:
+    return str(categories[code]) if code >= 0 else None
+
+
+class ColumnarStore:
+    """
+    Immutable snapshot of the provider rows, see the module docstring.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], data_version: int = 0):
+        """
+        `arrays` holds the columns as from_frame() builds them: a "categories_<column>" array for each
+        category column, its codes and the value columns, all in (DRG, price) order.
+        """
+        self.data_version = data_version
+        self.categories: Dict[str, np.ndarray] = {column: arrays[f"categories_{column}"] for column in _CATEGORIES}
+        self.drg, self.zip_code, self.state, self.city, self.name = (arrays[_CODES[c]] for c in _CATEGORIES)
+        self.provider_id, self.price, self.exact_price, self.payments, self.discharges, self.rating = (
+            arrays[v] for v in _VALUES)
+
+        drgs = self.categories["ms_drg_definition"]
+        self._drg_bounds = np.searchsorted(self.drg, np.arange(len(drgs) + 1))
+        # Codes stand in for drg_ids, so resolve_ids() returns the slices to read
+        self.dictionary = DrgDictionary([(str(d), code) for code, d in enumerate(drgs)])
+        self._zip_positions = {str(z): i for i, z in enumerate(self.categories["provider_zip_code"])}
+
+    @classmethod
+    def from_frame(cls, df: "pd.DataFrame", data_version: int = 0, price_dtype=np.float32) -> "ColumnarStore":
+        """
+        Builds the arrays from rows shaped like _rows_query(). Prices are filtered and sorted as `price_dtype`.
+        """
+        # pandas (and pyarrow, for snapshots) are only imported once a store is built, not with the API
+        import pandas as pd
+
+        arrays = {}
+        codes = {}
+        for column in _CATEGORIES:
+            categorical = pd.Categorical(df[column])
+            arrays[f"categories_{column}"] = string_array(categorical.categories)
+            codes[column] = categorical.codes  # smallest integer type that fits, -1 for NULL
+
+        exact_price = pd.to_numeric(df["average_covered_charges"]).to_numpy(dtype=np.float64, na_value=np.nan)
+        price = exact_price.astype(price_dtype, copy=False)
+        # Within a DRG, cheapest first, so a page of one DRG is mostly a prefix of its slice
+        order = np.lexsort((price, codes["ms_drg_definition"]))
+
+        for column in _CATEGORIES:
+            arrays[_CODES[column]] = codes[column][order]
+        arrays["provider_id"] = df["provider_id"].to_numpy(dtype=np.int32)[order]
+        arrays["price"] = price[order]
+        # Same array when prices are already float64
+        arrays["exact_price"] = arrays["price"] if price is exact_price else exact_price[order]
+        arrays["payments"] = pd.to_numeric(df["average_total_payments"]).to_numpy(dtype=np.float64, na_value=np.nan)[order]
+        arrays["discharges"] = pd.to_numeric(df["total_discharges"]).fillna(-1).to_numpy(dtype=np.int32)[order]
+        arrays["rating"] = pd.to_numeric(df["overall_rating"]).to_numpy(dtype=np.float32, na_value=np.nan)[order]
+        return cls(arrays, data_version)
+
+    @classmethod
+    def from_db(cls, db: Session, schema_mode: str = SCHEMA_MODE, where=(), price_dtype=np.float32) -> "ColumnarStore":
+        """
+        The rows matching every clause of `where` (all of them by default), prices sorted as `price_dtype`.
+        """
+        import pandas as pd
+
+        # Read the version first: an upload committed in between makes the snapshot newer than its
+        # version, which only costs an extra reload, never a stale snapshot that looks current
+        version = get_data_version(db)
+        df = pd.read_sql(_rows_query(schema_mode).where(*where), db.connection())
+        return cls.from_frame(df, version, price_dtype)
+
+    @classmethod
+    def from_snapshot(cls, directory: str, data_version: int) -> "ColumnarStore":
+        from snapshot import read_snapshot_table
+
+        columns = ["provider_id", "provider_name", "provider_city", "provider_state", "provider_zip_code",
+                   "ms_drg_definition", "total_discharges", "average_covered_charges", "average_total_payments"]
+        df = read_snapshot_table(directory, "hospital_data", columns)
+        ratings = read_snapshot_table(directory, "star_rating", ["provider_id", "overall_rating"])
+        df = df.merge(ratings.drop_duplicates("provider_id"), on="provider_id", how="left")
+        return cls.from_frame(df.dropna(subset=["provider_id", "ms_drg_definition"]), data_version)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {f"categories_{column}": categories for column, categories in self.categories.items()}
+        arrays.update({_CODES[column]: getattr(self, _CODES[column]) for column in _CATEGORIES})
+        arrays.update({value: getattr(self, value) for value in _VALUES})
+        return arrays
+
+    def __len__(self):
+        return len(self.provider_id)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.drg, self.zip_code, self.state, self.city, self.name, self.provider_id,
+                  self.price, self.payments, self.discharges, self.rating)
+        exact = self.exact_price.nbytes if self.exact_price is not self.price else 0
+        return sum(a.nbytes for a in arrays) + exact
+
+    def drg_rows(self, ms_drg: str) -> np.ndarray:
+        """
+        Indices of every row whose DRG matches the `ms_drg` keyword.
+        """
+        drg_codes = self.dictionary.resolve_ids(ms_drg)
+        if not drg_codes:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([np.arange(self._drg_bounds[c], self._drg_bounds[c + 1]) for c in drg_codes])
+
+    def cheapest_per_provider(self, ms_drg: str, zip_codes: Iterable[str],
+                              after: Optional[Tuple[float, int]] = None,
+                              drg_rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Row indices of each provider's cheapest row matching `ms_drg` in one of `zip_codes`, ordered by
+        (average_covered_charges, provider_id) and starting after the `after` position. Rows without a price
+        are left out and ties on price go to the row with more discharges, as in the SQL version.
+        `drg_rows` is drg_rows(ms_drg), for callers that search the same keyword many times.
+        """
+        rows = self.drg_rows(ms_drg) if drg_rows is None else drg_rows
+        zip_positions = [self._zip_positions[z] for z in zip_codes if z in self._zip_positions]
+        if not len(rows) or not zip_positions:
+            return np.empty(0, dtype=np.intp)
+
+        zip_mask = np.zeros(len(self._zip_positions), dtype=bool)
+        zip_mask[zip_positions] = True
+        zip_codes_of_rows = self.zip_code[rows]
+        rows = rows[(zip_codes_of_rows >= 0) & zip_mask[zip_codes_of_rows] & ~np.isnan(self.price[rows])]
+
+        # Group by provider with its best row first, then keep the first row of every group.
+        # Negated discharges sort more discharges first and the missing value (-1) last.
+        rows = rows[np.lexsort((-self.discharges[rows], self.price[rows], self.provider_id[rows]))]
+        providers = self.provider_id[rows]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = providers[1:] != providers[:-1]
+        rows = rows[first]
+
+        rows = rows[np.lexsort((self.provider_id[rows], self.price[rows]))]
+        if after is not None:
+            after_price, after_provider = self.price.dtype.type(after[0]), after[1]
+            price, providers = self.price[rows], self.provider_id[rows]
+            rows = rows[(price > after_price) | ((price == after_price) & (providers > after_provider))]
+        return rows
+
+    def position(self, row: int) -> Tuple[float, int]:
+        """
+        The (price, provider_id) keyset position of `row`, with the float64 price the SQL path puts in its cursors.
+        """
+        return float(self.exact_price[row]), int(self.provider_id[row])
+
+    def rows(self, indices: Iterable[int]) -> List[ProviderRow]:
+        """
+        Materializes rows in the shape of the SQL result, with the float64 prices it returns.
+        """
+        c = self.categories
+        result = []
+        for i in indices:
+            price, payments, rating = self.exact_price[i], self.payments[i], self.rating[i]
+            result.append(ProviderRow(
+                provider_id=int(self.provider_id[i]),
+                provider_name=_optional(c["provider_name"], self.name[i]),
+                provider_city=_optional(c["provider_city"], self.city[i]),
+                provider_state=_optional(c["provider_state"], self.state[i]),
+                provider_zip_code=_optional(c["provider_zip_code"], self.zip_code[i]),
+                ms_drg_definition=str(c["ms_drg_definition"][self.drg[i]]),
+                total_discharges=int(self.discharges[i]) if self.discharges[i] >= 0 else None,
+                average_covered_charges=None if np.isnan(price) else float(price),
+                average_total_payments=None if np.isnan(payments) else float(payments),
+                overall_rating=None if np.isnan(rating) else int(rating),
+            ))
+        return result
+
+
+class ColumnarEngine:
+    """
+    Holds the current ColumnarStore and replaces it when the data version moves.
+    """
+
+    def __init__(self, schema_mode: str = SCHEMA_MODE):
+        self.schema_mode = schema_mode
+        self._store: Optional[ColumnarStore] = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def store(self) -> Optional[ColumnarStore]:
+        return self._store
+
+    def load(self, db: Session) -> ColumnarStore:
+        with self._load_lock:
+            started = time.perf_counter()
+            version = get_data_version(db)
+
+            def build():
+                from snapshot import current_snapshot
+
+                directory = current_snapshot(version)
+                if directory is not None:
+                    return ColumnarStore.from_snapshot(directory, version).arrays()
+                return ColumnarStore.from_db(db, self.schema_mode).arrays()
+
+            store = ColumnarStore(load_or_build(f"columnar-{self.schema_mode}", version, build), version)
+            # Swap the reference in one step so concurrent searches see either the old or the new arrays
+            self._store = store
+        logging.info(f"Columnar engine loaded {len(store)} rows ({store.nbytes / 1024 / 1024:.1f} MB) "
+                     f"at data version {store.data_version} in {time.perf_counter() - started:.2f}s")
+        return store
+
+    def refresh_if_stale(self, db: Session) -> bool:
+        """
+        Reloads when an upload has changed the data since the current snapshot was read.
+        """
+        store = self._store
+        if store is not None and get_data_version(db) == store.data_version:
+            return False
+        self.load(db)
+        return True
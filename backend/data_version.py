@@ -0,0 +1,37 @@
+# data_version.py
+"""
+Counter of committed data changes, shared by every process through the data_version table.
+
+Uploads bump it in the same transaction as the first rows they write, so a reader never sees new data
+under the version it read before the upload. A streaming upload commits many batches and bumps it once
+more when it ends, not with every batch. Caches of query results key their entries on it and need no
+other invalidation.
+"""
+
+from sqlalchemy.orm import Session
+
+from models.models import DataVersion
+
+DATA_VERSION_ID = 1
+
+
+def get_data_version(db: Session) -> int:
+    version = db.query(DataVersion.version).filter(DataVersion.id == DATA_VERSION_ID).scalar()
+    return version or 0
+
+
+def bump_data_version(db: Session):
+    """
+    Increments the counter inside the caller's transaction; the caller commits.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Data versioning is not supported on {dialect}")
+
+    table = DataVersion.__table__
+    stmt = insert(table).values(id=DATA_VERSION_ID, version=1)
+    db.execute(stmt.on_conflict_do_update(index_elements=[table.c.id], set_={"version": table.c.version + 1}))
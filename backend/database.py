@@ -0,0 +1,133 @@
+# database.py
+"""
+Engines and sessions for the API process.
+
+`engine` / `SessionLocal` are synchronous and serve startup, migrations and upload-job bookkeeping.
+Request handlers get their session from get_db(): an AsyncSession on an asyncpg engine when DB_ASYNC
+is on and the database is PostgreSQL, otherwise a regular Session whose work is moved to the thread
+pool. Either way a slow query no longer holds up the event loop.
+
+Pool size, overflow, pre-ping and the per-statement timeout of the request engine are set through
+DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS.
+"""
+
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Union
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import iterate_in_threadpool
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    raise ValueError("DATABASE_URL is not set")
+
+DB_ASYNC = os.getenv("DB_ASYNC", "true").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+_url = make_url(DATABASE_URL)
+IS_POSTGRES = _url.get_backend_name() == "postgresql"
+USE_ASYNC = DB_ASYNC and IS_POSTGRES
+
+
+def _pool_options() -> dict:
+    if _url.get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+# Startup, migrations and job bookkeeping: no statement timeout, a migration may legitimately run long
+engine = create_engine(DATABASE_URL, **_pool_options())
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+if USE_ASYNC:
+    request_engine = create_async_engine(
+        _url.set(drivername="postgresql+asyncpg"),
+        connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+        **_pool_options(),
+    )
+    RequestSession = async_sessionmaker(request_engine, autoflush=False, expire_on_commit=False)
+else:
+    if DB_ASYNC:
+        logging.info(f"DB_ASYNC needs PostgreSQL, serving {_url.get_backend_name()} through the thread pool")
+    connect_args = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"} if IS_POSTGRES else {}
+    request_engine = create_engine(DATABASE_URL, connect_args=connect_args, **_pool_options())
+    RequestSession = sessionmaker(autocommit=False, autoflush=False, bind=request_engine)
+
+DbSession = Union[AsyncSession, Session]
+
+
+async def get_db() -> AsyncIterator[DbSession]:
+    async with session_scope() as db:
+        yield db
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[DbSession]:
+    """
+    A request session outside of dependency injection, e.g. one per WebSocket message.
+    """
+    db = RequestSession()
+    try:
+        yield db
+    finally:
+        if isinstance(db, AsyncSession):
+            await db.close()
+        else:
+            await run_in_threadpool(db.close)
+
+
+async def run_sync(db: DbSession, fn, *args, **kwargs):
+    """
+    Calls fn(session, *args, **kwargs) with a synchronous Session without blocking the event loop.
+    On an AsyncSession fn runs in a greenlet and its queries are awaited on asyncpg, otherwise it
+    runs in the thread pool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+async def stream_partitions(db: DbSession, stmt, size: int) -> AsyncIterator[List]:
+    """
+    Executes `stmt` with a server-side cursor and yields its rows in lists of up to `size`.
+    """
+    if isinstance(db, AsyncSession):
+        result = await db.stream(stmt)
+        try:
+            async for rows in result.partitions(size):
+                yield rows
+        finally:
+            await result.close()
+    else:
+        result = await run_in_threadpool(db.execute, stmt, execution_options={"yield_per": size})
+        try:
+            async for rows in iterate_in_threadpool(result.partitions()):
+                yield rows
+        finally:
+            await run_in_threadpool(result.close)
+
+
+async def dispose_engines():
+    if USE_ASYNC:
+        await request_engine.dispose()
+    else:
+        request_engine.dispose()
+    engine.dispose()
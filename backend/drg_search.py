@@ -0,0 +1,157 @@
+# drg_search.py
+"""
+MS-DRG keyword search.
+
+hospital_data holds only a few hundred distinct DRG descriptions, so they are kept in an in-process
+dictionary. A keyword such as "knee" is resolved to the exact descriptions that contain it before any
+SQL runs, and /providers filters with `ms_drg_definition IN (...)`, which the B-tree index on the
+column serves. When the dictionary has no match (for example right after another process loaded new
+data) the query falls back to ILIKE, which the pg_trgm GIN index from migrations.py serves.
+
+In the normalized schema the dictionary is read from the drg table and resolves keywords to integer
+drg_ids, so provider_drg is filtered on its (drg_id, provider_id) primary key.
+
+The descriptions are read once per data version and host, and shared by the API workers (shared_state.py).
+"""
+
+import logging
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from data_version import get_data_version
+from models.models import HospitalData, Drg, ProviderDrg, SCHEMA_MODE
+from shared_state import load_or_build, string_array
+
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class DrgDictionary:
+    """
+    Distinct DRG descriptions, with their drg_id in the normalized schema, matched case-insensitively.
+    """
+
+    def __init__(self, entries: List[Tuple[str, Optional[int]]]):
+        self.entries = sorted((d, drg_id) for d, drg_id in set(entries) if d)
+        self.descriptions = [d for d, _ in self.entries]
+        self.drg_ids = [drg_id for _, drg_id in self.entries]
+        self._upper = [d.upper() for d in self.descriptions]
+
+    @classmethod
+    def from_db(cls, db: Session, schema_mode: str = SCHEMA_MODE) -> "DrgDictionary":
+        if schema_mode == "normalized":
+            return cls(db.query(Drg.ms_drg_definition, Drg.drg_id).all())
+        rows = db.query(HospitalData.ms_drg_definition).distinct().all()
+        return cls([(row[0], None) for row in rows])
+
+    def arrays(self):
+        drg_ids = [-1 if drg_id is None else drg_id for drg_id in self.drg_ids]
+        return {"descriptions": string_array(self.descriptions), "drg_ids": np.array(drg_ids, dtype=np.int64)}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "DrgDictionary":
+        drg_ids = [None if drg_id < 0 else drg_id for drg_id in arrays["drg_ids"].tolist()]
+        return cls(list(zip(arrays["descriptions"].tolist(), drg_ids)))
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def _matching(self, keyword: str) -> List[int]:
+        needle = keyword.strip().upper()
+        if not needle:
+            return []
+        return [i for i, upper in enumerate(self._upper) if needle in upper]
+
+    def resolve(self, keyword: str) -> List[str]:
+        """
+        Returns every description containing `keyword`, case-insensitively. Same semantics as ILIKE '%keyword%'.
+        """
+        return [self.descriptions[i] for i in self._matching(keyword)]
+
+    def resolve_ids(self, keyword: str) -> List[int]:
+        """
+        Same as resolve() but returns drg_ids. Only available for a dictionary read from the drg table.
+        """
+        return [self.drg_ids[i] for i in self._matching(keyword)]
+
+    def resolve_words(self, words: List[str]) -> List[Tuple[str, Optional[int]]]:
+        """
+        Returns the (description, drg_id) entries containing every one of `words`, case-insensitively,
+        in any order. A plural word also matches its singular.
+        """
+        needles = [w.strip().upper() for w in words if w.strip()]
+        if not needles:
+            return []
+
+        def contains(upper: str, needle: str) -> bool:
+            return needle in upper or (len(needle) > 3 and needle.endswith("S") and needle[:-1] in upper)
+
+        return [self.entries[i] for i, upper in enumerate(self._upper) if all(contains(upper, n) for n in needles)]
+
+
+_dictionary: Optional[DrgDictionary] = None
+_lock = threading.Lock()
+
+
+def refresh_drg_dictionary(db: Session) -> DrgDictionary:
+    global _dictionary
+    arrays = load_or_build(f"drg-dictionary-{SCHEMA_MODE}", get_data_version(db), lambda: DrgDictionary.from_db(db).arrays())
+    dictionary = DrgDictionary.from_arrays(arrays)
+    with _lock:
+        _dictionary = dictionary
+    logging.info(f"Loaded {len(dictionary)} DRG descriptions")
+    return dictionary
+
+
+def get_drg_dictionary(db: Session) -> DrgDictionary:
+    if _dictionary is None:
+        return refresh_drg_dictionary(db)
+    return _dictionary
+
+
+def drg_filter(keyword: str, db: Session, schema_mode: str = SCHEMA_MODE, dictionary: Optional[DrgDictionary] = None) -> ColumnElement:
+    """
+    Builds an index-friendly DRG predicate for a keyword search: on hospital_data.ms_drg_definition
+    in the flat schema, on provider_drg.drg_id in the normalized one (which joins drg for the fallback).
+    """
+    if dictionary is None:
+        dictionary = get_drg_dictionary(db)
+    if schema_mode == "normalized":
+        drg_ids = dictionary.resolve_ids(keyword)
+        if drg_ids:
+            return ProviderDrg.drg_id.in_(drg_ids)
+        column = Drg.ms_drg_definition
+    else:
+        matches = dictionary.resolve(keyword)
+        if matches:
+            return HospitalData.ms_drg_definition.in_(matches)
+        column = HospitalData.ms_drg_definition
+
+    # No lower() around the column: the trigram GIN index handles ILIKE directly
+    return column.ilike(f"%{escape_like(keyword.strip())}%", escape="\\")
+
+
+def drg_filter_any(keywords: Iterable[str], db: Session, schema_mode: str = SCHEMA_MODE,
+                   dictionary: Optional[DrgDictionary] = None) -> ColumnElement:
+    """
+    drg_filter() for rows matching any of `keywords`: one IN list over every DRG they resolve to, plus
+    the ILIKE fallback for each keyword the dictionary does not know.
+    """
+    if dictionary is None:
+        dictionary = get_drg_dictionary(db)
+    normalized = schema_mode == "normalized"
+    matches, fallbacks = set(), []
+    for keyword in set(keywords):
+        resolved = dictionary.resolve_ids(keyword) if normalized else dictionary.resolve(keyword)
+        if resolved:
+            matches.update(resolved)
+        else:
+            fallbacks.append(drg_filter(keyword, db, schema_mode, dictionary))
+    column = ProviderDrg.drg_id if normalized else HospitalData.ms_drg_definition
+    return or_(column.in_(sorted(matches)), *fallbacks)
@@ -1,74 +1,395 @@
 import os
 import io
 import csv
+import codecs
 import logging
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
 import pandas as pd
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy import select, func
+from sqlalchemy import select, func, text, Integer, Table
 from sqlalchemy.sql.coercions import expect
-import random
+import time
+import numpy as np
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+from models.models import HospitalData, StarRating, Provider, Drg, ProviderDrg, Base, SCHEMA_MODE
+from data_version import bump_data_version
+from jobs import DEFAULT_CHUNK_SIZE
+from aggregates import refresh_for_hospital_data, refresh_for_ratings
+
+HOSPITAL_DATA_COLUMN_MAPPING = {
+    "Rndrng_Prvdr_CCN": "provider_id",
+    "Rndrng_Prvdr_Org_Name": "provider_name",
+    "Rndrng_Prvdr_City": "provider_city",
+    "Rndrng_Prvdr_State_Abrvtn": "provider_state",
+    "Rndrng_Prvdr_Zip5": "provider_zip_code",
+    "DRG_Desc": "ms_drg_definition",
+    "Tot_Dschrgs": "total_discharges",
+    "Avg_Submtd_Cvrd_Chrg": "average_covered_charges",
+    "Avg_Tot_Pymt_Amt": "average_total_payments",
+    "Avg_Mdcr_Pymt_Amt": "average_medicare_payments",
+}
+
+# Only these columns are parsed, the ~20 other CMS columns are skipped by the CSV reader. Text columns
+# are read straight into nullable strings; numeric ones are left to the parser's native int/float
+# inference and coerced below, so a malformed value becomes NULL instead of failing the upload.
+HOSPITAL_DATA_DTYPES = {
+    "Rndrng_Prvdr_Org_Name": pd.StringDtype(),
+    "Rndrng_Prvdr_City": pd.StringDtype(),
+    "Rndrng_Prvdr_State_Abrvtn": pd.StringDtype(),
+    "DRG_Desc": pd.StringDtype(),
+}
+
+HOSPITAL_RATING_COLUMN_MAPPING = {
+    "Provider ID": "provider_id",
+    "Hospital overall rating": "overall_rating",
+}
+HOSPITAL_RATING_DTYPES = {"Provider ID": pd.StringDtype(), "Hospital overall rating": pd.StringDtype()}
+
+# Decoding error handler: bytes that are not valid utf-8 are read as latin1 instead. The encoding is sniffed
+# from the start of a file, so a latin1 character further in neither fails an upload halfway nor is lost.
+LATIN1_FALLBACK = "latin1-fallback"
+codecs.register_error(LATIN1_FALLBACK, lambda e: (e.object[e.start:e.end].decode("latin1"), e.end))
+
+# Seed of the generator that fills missing ratings with mock values from 1 to 10
+MOCK_RATING_SEED = int(os.getenv("MOCK_RATING_SEED", "42"))
+
+# Rows per statement when frames are written without COPY (the "orm" loader or a non-psycopg2 database)
+ORM_INSERT_BATCH = 10000
+
+
+# Loader used to write transformed frames: "copy" streams them with PostgreSQL COPY FROM STDIN,
+# "orm" uses Session.bulk_insert_mappings. "auto" picks COPY whenever the session is bound to psycopg2.
+ETL_LOADER = os.getenv("ETL_LOADER", "auto")
+
+COPY_NULL = "\\N"
+
+
+def _copy_supported(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def _copy_dataframe(df: pd.DataFrame, table: Table, db: Session, target: Optional[str] = None) -> int:
+    """
+    Streams a transformed frame into `table` (or the `target` table with the same columns) with
+    COPY FROM STDIN on the session's own psycopg2 connection, so the rows are committed
+    (or rolled back) with the session.
+    """
+    columns = [col for col in df.columns if col in table.c]
+    frame = df[columns].copy()
+    for col in columns:
+        # psycopg2 lets Postgres cast 3.0 into an INTEGER column on INSERT, COPY does not
+        if isinstance(table.c[col].type, Integer) and not pd.api.types.is_integer_dtype(frame[col]):
+            frame[col] = pd.to_numeric(frame[col], errors="coerce").round().astype(pd.Int64Dtype())
+
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+    buffer.seek(0)
+
+    column_list = ", ".join(columns)
+    raw_connection = db.connection().connection
+    with raw_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {target or table.name} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer,
+        )
+    return len(frame)
+
+
+def load_dataframe(df: pd.DataFrame, model, db: Session, loader: Optional[str] = None) -> int:
+    """
+    Writes a transformed frame into the model's table inside the current session transaction.
+    Uses COPY on PostgreSQL and falls back to bulk_insert_mappings on any other database.
+    The caller is responsible for committing. Returns the number of rows written.
+    """
+    loader = loader or ETL_LOADER
+    if loader not in ("auto", "copy", "orm"):
+        raise ValueError(f"Unknown ETL loader: {loader}")
+
+    if loader != "orm" and _copy_supported(db):
+        return _copy_dataframe(df, model.__table__, db)
+    if loader == "copy":
+        logging.warning(f"COPY loader requested but {db.get_bind().dialect.name} does not support it, using ORM inserts")
+
+    written = 0
+    for records in _record_batches(df):
+        db.bulk_insert_mappings(model, records)
+        written += len(records)
+    return written
+
+
+def _record_batches(df: pd.DataFrame, size: int = ORM_INSERT_BATCH):
+    """
+    Yields the rows as lists of at most `size` dicts, with None for missing values, so that only one
+    batch of Python objects exists at a time.
+    """
+    for start in range(0, len(df), size):
+        part = df.iloc[start:start + size]
+        yield part.astype(object).where(pd.notna(part), None).to_dict(orient="records")
+
+
+# Columns that identify a row across uploads. Upserts match on these and only rewrite rows
+# whose content_hash changed.
+UPSERT_KEYS = {
+    "hospital_data": ["provider_id", "ms_drg_definition"],
+    "star_rating": ["provider_id"],
+    "provider": ["provider_id"],
+    "drg": ["ms_drg_definition"],
+    "provider_drg": ["drg_id", "provider_id"],
+}
+
+
+def _add_content_hash(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds a content_hash column: a 64-bit hash of every value in the row, rendered as hex.
+    Values are hashed as strings so the result does not depend on the dtypes pandas inferred.
+    """
+    hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    df["content_hash"] = hashes.map("{:016x}".format)
+    return df
+
+
+def _conflict_action(table: Table, columns: List[str], key_columns: List[str]) -> str:
+    update_columns = [col for col in columns if col not in key_columns]
+    if not update_columns:
+        return "DO NOTHING"
+    action = f"DO UPDATE SET {', '.join(f'{col} = EXCLUDED.{col}' for col in update_columns)}"
+    if "content_hash" in columns:
+        action += f" WHERE {table.name}.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+    return action
+
+
+def _upsert_via_staging(df: pd.DataFrame, table: Table, key_columns: List[str], db: Session) -> int:
+    """
+    COPYs the frame into a temporary staging table and merges it into `table` with a single
+    INSERT ... ON CONFLICT, skipping rows whose content_hash is unchanged.
+    """
+    columns = [col for col in df.columns if col in table.c]
+    column_list = ", ".join(columns)
+    stage = f"{table.name}_stage"
+
+    db.execute(text(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {column_list} FROM {table.name} WITH NO DATA"))
+    _copy_dataframe(df, table, db, target=stage)
+
+    result = db.execute(text(f"""
+        INSERT INTO {table.name} ({column_list})
+        SELECT {column_list} FROM {stage}
+        ON CONFLICT ({", ".join(key_columns)}) {_conflict_action(table, columns, key_columns)}
+    """))
+    db.execute(text(f"DROP TABLE {stage}"))
+    return result.rowcount
+
+
+def _upsert_via_insert(df: pd.DataFrame, table: Table, key_columns: List[str], db: Session) -> int:
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Upsert mode is not supported on {dialect}")
+
+    columns = [col for col in df.columns if col in table.c]
+
+    stmt = insert(table)
+    update_columns = [col for col in columns if col not in key_columns]
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={col: stmt.excluded[col] for col in update_columns},
+            where=table.c.content_hash.is_distinct_from(stmt.excluded.content_hash) if "content_hash" in columns else None,
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=key_columns)
+    stmt = stmt.returning(*table.primary_key.columns)
+    return sum(len(db.execute(stmt, records).all()) for records in _record_batches(df[columns]))
+
+
+def upsert_dataframe(df: pd.DataFrame, model, db: Session, loader: Optional[str] = None) -> Dict[str, int]:
+    """
+    Merges a transformed frame into the model's table keyed on UPSERT_KEYS, inside the current
+    session transaction. New rows are inserted, rows with a changed content_hash are updated and
+    unchanged rows are skipped. The caller is responsible for committing.
+    """
+    loader = loader or ETL_LOADER
+    if loader not in ("auto", "copy", "orm"):
+        raise ValueError(f"Unknown ETL loader: {loader}")
+
+    table = model.__table__
+    key_columns = UPSERT_KEYS[table.name]
+
+    # NULL keys never conflict, and a key repeated inside one statement cannot be merged twice
+    df = df.dropna(subset=key_columns).drop_duplicates(subset=key_columns, keep="last")
+
+    if loader != "orm" and _copy_supported(db):
+        written = _upsert_via_staging(df, table, key_columns, db)
+    else:
+        written = _upsert_via_insert(df, table, key_columns, db)
+    return {"written": written, "unchanged": len(df) - written}
+
+
+LOAD_MODES = ("append", "upsert")
+
+
+def write_dataframe(df: pd.DataFrame, model, db: Session, mode: str = "upsert", loader: Optional[str] = None) -> Dict[str, int]:
+    """
+    Appends or upserts a transformed frame depending on `mode`. Returns written/unchanged row counts.
+    """
+    if mode == "append":
+        return {"written": load_dataframe(df, model, db, loader), "unchanged": 0}
+    if mode == "upsert":
+        return upsert_dataframe(df, model, db, loader)
+    raise ValueError(f"Unknown load mode: {mode}")
+
+
+PROVIDER_COLUMNS = ["provider_id", "provider_name", "provider_city", "provider_state", "provider_zip_code"]
+PROVIDER_DRG_COLUMNS = ["provider_id", "total_discharges", "average_covered_charges", "average_total_payments",
+                        "average_medicare_payments", "content_hash"]
+
+
+def _write_normalized(df: pd.DataFrame, db: Session, mode: str, loader: Optional[str]) -> Dict[str, int]:
+    """
+    Splits transformed hospital_data rows into the provider / drg dimensions and the provider_drg
+    fact table. Dimensions are always merged, facts are appended or upserted depending on `mode`.
+    """
+    providers = df[PROVIDER_COLUMNS].dropna(subset=["provider_id"]).drop_duplicates("provider_id", keep="last")
+    upsert_dataframe(_add_content_hash(providers.copy()), Provider, db, loader)
+
+    drgs = df[["ms_drg_definition"]].dropna().drop_duplicates()
+    upsert_dataframe(drgs, Drg, db, loader)
+    drg_ids = dict(
+        db.query(Drg.ms_drg_definition, Drg.drg_id).filter(Drg.ms_drg_definition.in_(drgs["ms_drg_definition"].tolist())).all()
+    )
+
+    # The fact row keeps the hash of the whole flat row, so a renamed provider or DRG counts as a change too
+    facts = df[PROVIDER_DRG_COLUMNS].copy()
+    facts["drg_id"] = df["ms_drg_definition"].map(drg_ids).astype(pd.Int64Dtype())
+    return write_dataframe(facts.dropna(subset=["drg_id"]), ProviderDrg, db, mode, loader)
+
+
+def write_hospital_data(df: pd.DataFrame, db: Session, mode: str = "upsert", loader: Optional[str] = None) -> Dict[str, int]:
+    """
+    Writes transformed hospital_data rows into the tables of the configured SCHEMA_MODE.
+    """
+    if SCHEMA_MODE == "normalized":
+        return _write_normalized(df, db, mode, loader)
+    return write_dataframe(df, HospitalData, db, mode, loader)
+
+
+def read_hospital_data_csv(source, chunksize: Optional[int] = None, encoding: Optional[str] = None):
+    """
+    pd.read_csv limited to the CMS columns hospital_data keeps, with the text columns typed at read time.
+    """
+    return pd.read_csv(source, chunksize=chunksize, encoding=encoding, encoding_errors=LATIN1_FALLBACK,
+                       usecols=lambda col: col in HOSPITAL_DATA_COLUMN_MAPPING, dtype=HOSPITAL_DATA_DTYPES)
+
+
+def read_hospital_rating_csv(source, encoding: Optional[str] = None) -> pd.DataFrame:
+    return pd.read_csv(source, encoding=encoding,
+                       usecols=lambda col: col in HOSPITAL_RATING_COLUMN_MAPPING, dtype=HOSPITAL_RATING_DTYPES)
+
+
+def _transform_hospital_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Renames the CMS columns to the hospital_data schema, drops everything else and coerces types.
+    Every column ends up as a nullable extension type (Int64, Float64 or string), with <NA> for missing values.
+    """
+    dfTransformed = df.rename(columns=HOSPITAL_DATA_COLUMN_MAPPING)
+
+    target_columns = list(HOSPITAL_DATA_COLUMN_MAPPING.values())
+    cols_to_drop = [col for col in dfTransformed.columns if col not in target_columns]
+    dfTransformed = dfTransformed.drop(columns=cols_to_drop)
+
+    dfTransformed["provider_id"] = pd.to_numeric(dfTransformed["provider_id"], errors="coerce").astype(pd.Int64Dtype())
+    dfTransformed["total_discharges"] = pd.to_numeric(dfTransformed["total_discharges"], errors="coerce").astype(pd.Int64Dtype())
+    dfTransformed["average_covered_charges"] = pd.to_numeric(dfTransformed["average_covered_charges"], errors="coerce").astype(pd.Float64Dtype())
+    dfTransformed["average_total_payments"] = pd.to_numeric(dfTransformed["average_total_payments"], errors="coerce").astype(pd.Float64Dtype())
+    dfTransformed["average_medicare_payments"] = pd.to_numeric(dfTransformed["average_medicare_payments"], errors="coerce").astype(pd.Float64Dtype())
+    dfTransformed["provider_state"] = dfTransformed["provider_state"].str.upper()
+    # Zip5 is parsed as a number (a float if a batch has blanks), so restore the leading zeros of e.g. 01001
+    zip_codes = pd.to_numeric(dfTransformed["provider_zip_code"], errors="coerce").astype(pd.Int64Dtype())
+    dfTransformed["provider_zip_code"] = zip_codes.astype(pd.StringDtype()).str.zfill(5)
+
+    for col in ["provider_name", "provider_city", "provider_state", "ms_drg_definition"]:
+        # A no-op for frames from read_hospital_data_csv, which are typed at read time
+        dfTransformed[col] = dfTransformed[col].astype(pd.StringDtype())
+
+    return _add_content_hash(dfTransformed)
+
+
+def _transform_hospital_rating(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Renames the rating columns, drops everything else and coerces types ("Not Available" becomes <NA>).
+    """
+    dfTransformed = df.rename(columns=HOSPITAL_RATING_COLUMN_MAPPING)
+    dfTransformed = dfTransformed.drop(columns=[col for col in dfTransformed.columns
+                                                if col not in HOSPITAL_RATING_COLUMN_MAPPING.values()])
+
+    dfTransformed["provider_id"] = pd.to_numeric(dfTransformed["provider_id"], errors="coerce").astype(pd.Int64Dtype())
+    dfTransformed["overall_rating"] = pd.to_numeric(dfTransformed["overall_rating"], errors="coerce").astype(pd.Float64Dtype())
+
+    # Hash the source values before the mock fill below, so a re-upload of an unrated provider
+    # counts as unchanged and keeps the rating it was given the first time
+    return _add_content_hash(dfTransformed)
+
+
+def fill_missing_ratings(df: pd.DataFrame, rng: Optional[np.random.Generator] = None) -> pd.DataFrame:
+    """
+    Replaces missing overall_rating values with mock ratings from 1 to 10, drawn in one vectorized call.
+    """
+    rng = rng if rng is not None else np.random.default_rng(MOCK_RATING_SEED)
+    ratings = df["overall_rating"].astype(pd.Int64Dtype())
+    missing = ratings.isna().to_numpy()
+    if missing.any():
+        ratings[missing] = rng.integers(1, 11, size=int(missing.sum()))
+    df["overall_rating"] = ratings
+    return df
+
+
+def detect_encoding(file_obj: BinaryIO, sample_size: int = 65536) -> str:
+    """
+    Sniffs the encoding of an uploaded file from its first bytes and rewinds it.
+    Falls back to latin1, which accepts any byte sequence. Decode with errors=LATIN1_FALLBACK, since the rest
+    of a file sniffed as utf-8 can still hold latin1 bytes.
+    """
+    sample = file_obj.read(sample_size)
+    file_obj.seek(0)
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample is still valid utf-8
+        if e.start < len(sample) - 3:
+            return "latin1"
+    return "utf-8"
 
-from models.models import HospitalData, StarRating, Base
 
-async def process_csv_hospital_data(decoded_content: str, db: Session):
+async def process_csv_hospital_data(decoded_content: str, db: Session, mode: str = "upsert", loader: Optional[str] = None):
     try:
         logging.info("Processing CSV file")
-        df = pd.read_csv(io.StringIO(decoded_content))
+        df = read_hospital_data_csv(io.StringIO(decoded_content))
         logging.info(f"Loaded {len(df)} rows from CSV")
 
-
-        column_maping = {
-            "Rndrng_Prvdr_CCN": "provider_id",
-            "Rndrng_Prvdr_Org_Name": "provider_name",
-            "Rndrng_Prvdr_City": "provider_city",
-            "Rndrng_Prvdr_State_Abrvtn": "provider_state",
-            "Rndrng_Prvdr_Zip5": "provider_zip_code",
-            "DRG_Desc": "ms_drg_definition",
-            "Tot_Dschrgs": "total_discharges",
-            "Avg_Submtd_Cvrd_Chrg": "average_covered_charges",
-            "Avg_Tot_Pymt_Amt": "average_total_payments",
-            "Avg_Mdcr_Pymt_Amt": "average_medicare_payments",
-        }
-
-        dfTransformed = df.rename(columns=column_maping)
-
-        logging.info(f"Transformed {len(dfTransformed)} rows from CSV")
-
-        target_columns = list(column_maping.values())
-        logging.info(f"Target columns: {target_columns}")
-        cols_to_drop = [col for col in dfTransformed.columns if col not in target_columns]
-        dfTransformed = dfTransformed.drop(columns=cols_to_drop)
-
-        logging.info(f"Dropped {len(cols_to_drop)} columns from CSV")
-
-        dfTransformed["provider_id"] = pd.to_numeric(dfTransformed["provider_id"], errors="coerce").astype(pd.Int64Dtype())
-        dfTransformed["total_discharges"] = pd.to_numeric(dfTransformed["total_discharges"], errors="coerce").astype(pd.Int64Dtype())
-        dfTransformed["average_covered_charges"] = pd.to_numeric(dfTransformed["average_covered_charges"], errors="coerce").astype(pd.Float64Dtype())
-        dfTransformed["average_total_payments"] = pd.to_numeric(dfTransformed["average_total_payments"], errors="coerce").astype(pd.Float64Dtype())
-        dfTransformed["average_medicare_payments"] = pd.to_numeric(dfTransformed["average_medicare_payments"], errors="coerce").astype(pd.Float64Dtype())
-        dfTransformed["provider_state"] = dfTransformed["provider_state"].str.upper()
-        dfTransformed["provider_zip_code"] = dfTransformed["provider_zip_code"].astype(str).replace('<NA>', None)
-
-        for col in ["provider_name", "provider_city", "provider_state", "ms_drg_definition"]:
-            dfTransformed[col] = dfTransformed[col].astype(str).replace('nan', None)
+        dfTransformed = _transform_hospital_data(df)
 
         logging.info(f"Converted {len(dfTransformed)} rows from CSV")
 
-        data_to_insert = dfTransformed.where(pd.notna(dfTransformed), None).to_dict(orient="records")
-
-        if not data_to_insert:
+        if dfTransformed.empty:
             logging.info("No data to insert")
             return {"status": "success", "message": "No valid data to insert"}
 
-        logging.info(f"Inserting {len(data_to_insert)} rows into database")
+        logging.info(f"Writing {len(dfTransformed)} rows into database ({mode})")
 
         try:
-            db.bulk_insert_mappings(HospitalData, data_to_insert)
+            counts = write_hospital_data(dfTransformed, db, mode, loader)
+            if counts["written"]:
+                refresh_for_hospital_data(db, dfTransformed)
+                bump_data_version(db)
             db.commit()
-            logging.info("Data inserted successfully")
-            return {"status": "success", "message": "Data inserted successfully"}
+            logging.info(f"Data inserted successfully: {counts['written']} written, {counts['unchanged']} unchanged")
+            return {"status": "success", "message": "Data inserted successfully",
+                    "rows_written": counts["written"], "rows_unchanged": counts["unchanged"]}
         except IntegrityError as e:
             db.rollback()
             logging.error(f"Integrity error: {e}")
@@ -82,49 +403,122 @@ async def process_csv_hospital_data(decoded_content: str, db: Session):
         return {"status": "error", "message": "Unexpected error: " + str(e)}
 
 
-async def process_csv_hospital_rating(decoded_content: str, db: Session):
-    try:
-        logging.info("Processing CSV file for Star Rating")
-        df = pd.read_csv(io.StringIO(decoded_content))
-        logging.info(f"Loaded {len(df)} rows from CSV")
-
-        column_mapping = {
-            "Provider ID": "provider_id",
-            "Hospital overall rating": "overall_rating"
+def process_csv_hospital_data_stream(file_obj: BinaryIO, db: Session, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: Optional[str] = None, mode: str = "upsert", loader: Optional[str] = None, progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """
+    Streams a CMS DRG CSV from a binary file object into hospital_data.
+    The file is parsed, transformed and committed `chunk_size` rows at a time, so memory stays
+    bounded regardless of file size. Batches committed before a failure are kept.
+    In "upsert" mode rows are merged on (provider_id, ms_drg_definition) and unchanged rows are skipped.
+    `progress`, if given, is called with the running stats after every committed batch.
+    The data version is bumped with the first batch that writes rows and once more when the upload ends,
+    not after every batch, so readers reload their caches and reference data twice per upload.
+    """
+    start = time.perf_counter()
+    rows_written = 0
+    rows_unchanged = 0
+    batches_committed = 0
+    version_bumped = False
+    written_since_bump = False
+
+    def _stats():
+        elapsed = time.perf_counter() - start
+        rows_processed = rows_written + rows_unchanged
+        return {
+            "rows_written": rows_written,
+            "rows_unchanged": rows_unchanged,
+            "batches_committed": batches_committed,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(rows_processed / elapsed, 1) if elapsed > 0 else 0.0,
         }
 
-        dfTransformed = df.rename(columns=column_mapping)
+    try:
+        encoding = encoding or detect_encoding(file_obj)
+        logging.info(f"Streaming CSV file in batches of {chunk_size} rows (encoding: {encoding}, mode: {mode})")
+
+        for chunk in read_hospital_data_csv(file_obj, chunksize=chunk_size, encoding=encoding):
+            dfTransformed = _transform_hospital_data(chunk)
+            if dfTransformed.empty:
+                continue
+
+            try:
+                counts = write_hospital_data(dfTransformed, db, mode, loader)
+                if counts["written"]:
+                    # Aggregates change in the batch's transaction, readers never see them disagree with the rows
+                    refresh_for_hospital_data(db, dfTransformed)
+                    if not version_bumped:
+                        # New rows never show under the version caches were filled at before the upload
+                        bump_data_version(db)
+                db.commit()
+                if counts["written"]:
+                    written_since_bump = version_bumped
+                    version_bumped = True
+            except IntegrityError as e:
+                db.rollback()
+                logging.error(f"Integrity error in batch {batches_committed + 1}: {e}")
+                return {"status": "error", "message": "Integrity error: " + str(e), **_stats()}
+            except SQLAlchemyError as e:
+                db.rollback()
+                logging.error(f"SQLAlchemy error in batch {batches_committed + 1}: {e}")
+                return {"status": "error", "message": "SQLAlchemy error: " + str(e), **_stats()}
+
+            rows_written += counts["written"]
+            rows_unchanged += counts["unchanged"]
+            batches_committed += 1
+            logging.info(f"Committed batch {batches_committed} ({rows_written} written, {rows_unchanged} unchanged so far)")
+            if progress:
+                progress(_stats())
+
+        stats = _stats()
+        if not rows_written and not rows_unchanged:
+            logging.info("No data to insert")
+            return {"status": "success", "message": "No valid data to insert", **stats}
+
+        logging.info(f"Wrote {rows_written} rows ({rows_unchanged} unchanged) in {batches_committed} batches ({stats['rows_per_second']} rows/sec)")
+        return {"status": "success", "message": "Data inserted successfully", **stats}
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return {"status": "error", "message": "Unexpected error: " + str(e), **_stats()}
+    finally:
+        if written_since_bump:
+            # Also after a failure: the batches committed before it stay
+            _bump_after_upload(db)
 
-        logging.info(f"Transformed {len(dfTransformed)} rows from CSV")
 
-        target_columns = list(column_mapping.values())
-        logging.info(f"Target columns: {target_columns}")
-        cols_to_drop = [col for col in dfTransformed.columns if col not in target_columns]
-        dfTransformed = dfTransformed.drop(columns=cols_to_drop)
+def _bump_after_upload(db: Session):
+    try:
+        db.rollback()
+        bump_data_version(db)
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        logging.error(f"Could not bump the data version after the upload: {e}")
 
-        logging.info(f"Dropped {len(cols_to_drop)} columns from CSV")
 
-        dfTransformed["provider_id"] = pd.to_numeric(dfTransformed["provider_id"], errors="coerce").astype(pd.Int64Dtype())
-        dfTransformed["overall_rating"] = pd.to_numeric(dfTransformed["overall_rating"], errors="coerce").astype(pd.Float64Dtype())
+async def process_csv_hospital_rating(decoded_content: str, db: Session, mode: str = "upsert", loader: Optional[str] = None):
+    try:
+        logging.info("Processing CSV file for Star Rating")
+        df = read_hospital_rating_csv(io.StringIO(decoded_content))
+        logging.info(f"Loaded {len(df)} rows from CSV")
 
-        # Replace null values in 'overall_rating' with random numbers from 1 to 10
-        dfTransformed["overall_rating"] = dfTransformed["overall_rating"].apply(lambda x: random.randint(1, 10) if pd.isna(x) else x)
+        dfTransformed = fill_missing_ratings(_transform_hospital_rating(df))
 
         logging.info(f"Converted {len(dfTransformed)} rows from CSV")
 
-        data_to_insert = dfTransformed.where(pd.notna(dfTransformed), None).to_dict(orient="records")
-
-        if not data_to_insert:
+        if dfTransformed.empty:
             logging.info("No data to insert")
             return {"status": "success", "message": "No valid data to insert"}
 
-        logging.info(f"Inserting {len(data_to_insert)} rows into StarRating table")
+        logging.info(f"Writing {len(dfTransformed)} rows into StarRating table ({mode})")
 
         try:
-            db.bulk_insert_mappings(StarRating, data_to_insert)
+            counts = write_dataframe(dfTransformed, StarRating, db, mode, loader)
+            if counts["written"]:
+                refresh_for_ratings(db, dfTransformed["provider_id"].dropna())
+                bump_data_version(db)
             db.commit()
-            logging.info("Data inserted successfully into StarRating table")
-            return {"status": "success", "message": "Data inserted successfully"}
+            logging.info(f"Data inserted successfully into StarRating table: {counts['written']} written, {counts['unchanged']} unchanged")
+            return {"status": "success", "message": "Data inserted successfully",
+                    "rows_written": counts["written"], "rows_unchanged": counts["unchanged"]}
         except IntegrityError as e:
             db.rollback()
             logging.error(f"Integrity error: {e}")
@@ -0,0 +1,241 @@
+# geo.py
+"""
+ZIP code centroids, radius search and provider distance ranking.
+
+Centroids for every US ZIP code are loaded once from a bundled gzip CSV (zip_code, lat, lon) and
+indexed with a KD-tree over unit vectors on the sphere. A radius query converts the great-circle
+radius to the equivalent straight-line (chord) distance, asks the tree for candidates and then
+computes exact haversine distances for those candidates only.
+
+The centroids and the provider coordinates are read once per host and shared by the API workers
+(shared_state.py); the provider coordinates are versioned with the data.
+"""
+
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from shared_state import load_or_build, string_array
+
+EARTH_RADIUS_KM = 6371.0088
+
+ZIP_CENTROIDS_PATH = os.getenv(
+    "ZIP_CENTROIDS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "zip_centroids.csv.gz"),
+)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in kilometers. Accepts scalars or NumPy arrays (broadcast).
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _unit_vectors(lat, lon) -> np.ndarray:
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+class ZipIndex:
+    """
+    Spatial index over ZIP code centroids.
+    """
+
+    def __init__(self, zip_codes: np.ndarray, lat: np.ndarray, lon: np.ndarray):
+        self.zip_codes = np.asarray(zip_codes, dtype=object)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self._positions = {zip_code: i for i, zip_code in enumerate(self.zip_codes)}
+        from scipy.spatial import cKDTree  # imported with the first index rather than with the API
+
+        self._tree = cKDTree(_unit_vectors(self.lat, self.lon))
+
+    @classmethod
+    def from_csv(cls, path: str = ZIP_CENTROIDS_PATH) -> "ZipIndex":
+        import pandas as pd
+
+        df = pd.read_csv(path, dtype={"zip_code": str, "lat": np.float64, "lon": np.float64})
+        logging.info(f"Loaded {len(df)} ZIP code centroids from {path}")
+        return cls(df["zip_code"].to_numpy(), df["lat"].to_numpy(), df["lon"].to_numpy())
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"zip_codes": string_array(self.zip_codes), "lat": self.lat, "lon": self.lon}
+
+    def __len__(self):
+        return len(self.zip_codes)
+
+    def __contains__(self, zip_code: str):
+        return zip_code in self._positions
+
+    def coordinates(self, zip_code: str) -> Optional[Tuple[float, float]]:
+        i = self._positions.get(zip_code)
+        if i is None:
+            return None
+        return float(self.lat[i]), float(self.lon[i])
+
+    def within_radius(self, zip_code: str, radius_km: float) -> Dict[str, float]:
+        """
+        Returns {zip_code: distance_km} for every ZIP whose centroid lies within `radius_km`
+        of `zip_code`'s centroid, including the ZIP itself. Empty if the ZIP is unknown.
+        """
+        i = self._positions.get(zip_code)
+        if i is None:
+            return {}
+
+        # Chord length subtending the same angle as the great-circle radius; capped at the diameter
+        angle = min(radius_km / EARTH_RADIUS_KM, np.pi)
+        chord = 2 * np.sin(angle / 2)
+        candidates = np.asarray(self._tree.query_ball_point(self._tree.data[i], chord + 1e-12), dtype=np.intp)
+
+        distances = haversine_km(self.lat[i], self.lon[i], self.lat[candidates], self.lon[candidates])
+        keep = distances <= radius_km
+        return dict(zip(self.zip_codes[candidates[keep]], distances[keep].round(3).tolist()))
+
+
+@lru_cache(maxsize=1)
+def get_zip_index() -> ZipIndex:
+    stat = os.stat(ZIP_CENTROIDS_PATH)
+    arrays = load_or_build("zip-index", f"{stat.st_size}-{stat.st_mtime_ns}", lambda: ZipIndex.from_csv().arrays())
+    return ZipIndex(arrays["zip_codes"], arrays["lat"], arrays["lon"])
+
+
+class ProviderLocations:
+    """
+    Coordinates of every provider, keyed by provider_id and taken from its ZIP centroid.
+    CMS provider ids (CCNs) are small integers, so a direct-address table maps an id to its row
+    and a batch of ids resolves with a single gather instead of a hash lookup per id.
+    """
+
+    def __init__(self, provider_ids: np.ndarray, lat: np.ndarray, lon: np.ndarray, slots: Optional[np.ndarray] = None):
+        provider_ids = np.asarray(provider_ids, dtype=np.int64)
+        self.provider_ids = provider_ids
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        if slots is None:
+            size = int(provider_ids.max()) + 1 if len(provider_ids) else 0
+            slots = np.full(size, -1, dtype=np.int32)
+            slots[provider_ids] = np.arange(len(provider_ids), dtype=np.int32)
+        self._slots = slots
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, str]], zip_index: ZipIndex) -> "ProviderLocations":
+        """
+        Builds the arrays from (provider_id, provider_zip_code) pairs. Providers whose ZIP is unknown are skipped.
+        """
+        located = {}
+        for provider_id, zip_code in rows:
+            coordinates = zip_index.coordinates(zip_code) if zip_code else None
+            if provider_id is not None and provider_id >= 0 and coordinates is not None:
+                located[provider_id] = coordinates
+        ids = np.fromiter(located.keys(), dtype=np.int64, count=len(located))
+        coords = np.array(list(located.values()), dtype=np.float64).reshape(-1, 2)
+        return cls(ids, coords[:, 0], coords[:, 1])
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"provider_ids": self.provider_ids, "lat": self.lat, "lon": self.lon, "slots": self._slots}
+
+    def __len__(self):
+        return len(self.provider_ids)
+
+    def coordinates(self, provider_ids) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (lat, lon) arrays aligned with `provider_ids`, NaN where a provider has no location.
+        """
+        provider_ids = np.asarray(provider_ids, dtype=np.int64)
+        in_range = (provider_ids >= 0) & (provider_ids < len(self._slots))
+        slots = np.full(len(provider_ids), -1, dtype=np.int32)
+        slots[in_range] = self._slots[provider_ids[in_range]]
+        found = slots >= 0
+        lat = np.where(found, self.lat.take(slots, mode="clip") if len(self.lat) else np.nan, np.nan)
+        lon = np.where(found, self.lon.take(slots, mode="clip") if len(self.lon) else np.nan, np.nan)
+        return lat, lon
+
+    def distances_km(self, lat: float, lon: float, provider_ids) -> np.ndarray:
+        """
+        Great-circle distance from (lat, lon) to every provider in `provider_ids`, computed in one batch.
+        """
+        provider_lat, provider_lon = self.coordinates(provider_ids)
+        return haversine_km(lat, lon, provider_lat, provider_lon)
+
+
+_provider_locations: Optional[ProviderLocations] = None
+
+
+def refresh_provider_locations(db) -> ProviderLocations:
+    """
+    Rebuilds the provider coordinate arrays from hospital_data (or provider), or maps the ones another
+    worker built for the current data version. Call after every data load.
+    """
+    from data_version import get_data_version
+    from models.models import HospitalData, Provider, SCHEMA_MODE
+
+    global _provider_locations
+
+    def build():
+        if SCHEMA_MODE == "normalized":
+            rows = db.query(Provider.provider_id, Provider.provider_zip_code).all()
+        else:
+            rows = db.query(HospitalData.provider_id, HospitalData.provider_zip_code).distinct().all()
+        return ProviderLocations.from_rows(rows, get_zip_index()).arrays()
+
+    arrays = load_or_build(f"provider-locations-{SCHEMA_MODE}", get_data_version(db), build)
+    locations = ProviderLocations(arrays["provider_ids"], arrays["lat"], arrays["lon"], arrays["slots"])
+    # Swap the reference in one step so concurrent readers see either the old or the new arrays
+    _provider_locations = locations
+    logging.info(f"Located {len(locations)} providers")
+    return locations
+
+
+def get_provider_locations(db) -> ProviderLocations:
+    if _provider_locations is None:
+        return refresh_provider_locations(db)
+    return _provider_locations
+
+
+# Weights of the combined "score" sort. Each factor is min-max normalised over the candidate set,
+# lower is better for price and distance and higher is better for rating.
+SCORE_WEIGHTS = {"price": 0.4, "distance": 0.35, "rating": 0.25}
+
+
+def _normalise(values: np.ndarray, missing: float) -> np.ndarray:
+    low, high = np.nanmin(values, initial=np.inf), np.nanmax(values, initial=-np.inf)
+    if not np.isfinite(low) or high == low:
+        normalised = np.zeros_like(values)
+    else:
+        normalised = (values - low) / (high - low)
+    return np.where(np.isnan(normalised), missing, normalised)
+
+
+def rank(price: np.ndarray, distance: np.ndarray, rating: np.ndarray, sort: str = "price") -> np.ndarray:
+    """
+    Returns the order in which to present candidates for `sort` in price, distance, rating or score.
+    Missing values sort last. The sort is stable, so pass candidates in price order to break ties by price.
+    """
+    price = np.asarray(price, dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+    rating = np.asarray(rating, dtype=np.float64)
+
+    if sort == "price":
+        key = price
+    elif sort == "distance":
+        key = distance
+    elif sort == "rating":
+        key = -rating
+    elif sort == "score":
+        key = (
+            SCORE_WEIGHTS["price"] * _normalise(price, 1.0)
+            + SCORE_WEIGHTS["distance"] * _normalise(distance, 1.0)
+            + SCORE_WEIGHTS["rating"] * (1.0 - _normalise(rating, 0.0))
+        )
+    else:
+        raise ValueError(f"Unknown sort: {sort}")
+
+    # NaN already sorts after every number in np.argsort
+    return np.argsort(key, kind="stable")
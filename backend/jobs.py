@@ -0,0 +1,218 @@
+# jobs.py
+"""
+Background upload jobs.
+
+Upload endpoints spool the file to disk, record an EtlJob row and hand the file to a process pool,
+so pandas parsing and the database load never run on the API event loop. Workers write their
+progress to the etl_job table after every committed batch, which lets /jobs/{id} report it from
+any API process.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from models.models import EtlJob
+
+ETL_WORKERS = int(os.getenv("ETL_WORKERS", "2"))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", tempfile.gettempdir())
+
+# Rows per batch for streaming uploads. Each batch is parsed, coerced and committed
+# on its own so peak memory is bounded by the batch size, not the file size.
+DEFAULT_CHUNK_SIZE = 50000
+
+JOB_KINDS = ("hospital_data", "hospital_rating")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _update_job(SessionFactory, job_id: str, **fields):
+    db = SessionFactory()
+    try:
+        db.query(EtlJob).filter(EtlJob.id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+
+def job_to_dict(job: EtlJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "filename": job.filename,
+        "state": job.state,
+        "rows_written": job.rows_written,
+        "rows_unchanged": job.rows_unchanged,
+        "rows_processed": (job.rows_written or 0) + (job.rows_unchanged or 0),
+        "batches_committed": job.batches_committed,
+        "rows_per_second": job.rows_per_second,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# --- Worker process side ---
+
+_worker_session_factory = None
+
+
+def _get_worker_session_factory():
+    # Each worker process builds its own engine, connections cannot be shared across processes
+    global _worker_session_factory
+    if _worker_session_factory is None:
+        load_dotenv()
+        engine = create_engine(os.getenv("DATABASE_URL"))
+        _worker_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return _worker_session_factory
+
+
+def run_upload_job(job_id: str, kind: str, path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs one upload in a worker process: loads the spooled file, records progress on the
+    EtlJob row and removes the file when done.
+    """
+    # Imported here so only worker processes pay for pandas
+    from etl import LATIN1_FALLBACK, detect_encoding, process_csv_hospital_data_stream, process_csv_hospital_rating
+
+    SessionFactory = _get_worker_session_factory()
+    _update_job(SessionFactory, job_id, state="running", started_at=_now())
+
+    def _progress(stats):
+        _update_job(
+            SessionFactory, job_id,
+            rows_written=stats["rows_written"],
+            rows_unchanged=stats["rows_unchanged"],
+            batches_committed=stats["batches_committed"],
+            rows_per_second=stats["rows_per_second"],
+        )
+
+    db = SessionFactory()
+    try:
+        with open(path, "rb") as f:
+            if kind == "hospital_data":
+                result = process_csv_hospital_data_stream(
+                    f, db, chunk_size=options["chunk_size"], mode=options["mode"], progress=_progress
+                )
+            else:
+                encoding = detect_encoding(f)
+                result = asyncio.run(process_csv_hospital_rating(f.read().decode(encoding, LATIN1_FALLBACK), db, mode=options["mode"]))
+    finally:
+        db.close()
+        os.remove(path)
+
+    final = {
+        "state": "succeeded" if result["status"] == "success" else "failed",
+        "finished_at": _now(),
+        "rows_written": result.get("rows_written", 0),
+        "rows_unchanged": result.get("rows_unchanged", 0),
+        "error": result["message"] if result["status"] != "success" else None,
+    }
+    for key in ("batches_committed", "rows_per_second"):
+        if key in result:
+            final[key] = result[key]
+    _update_job(SessionFactory, job_id, **final)
+    return result
+
+
+# --- API process side ---
+
+class UploadJobQueue:
+    """
+    Owns the worker process pool and creates EtlJob rows for the API process.
+    """
+
+    def __init__(self, SessionFactory: sessionmaker, max_workers: int = ETL_WORKERS, upload_dir: str = UPLOAD_DIR,
+                 on_success: Optional[Callable[[str], None]] = None):
+        self.SessionFactory = SessionFactory
+        self.on_success = on_success
+        self.max_workers = max_workers
+        self.upload_dir = upload_dir
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the API process runs an event loop and connection pools that must not be copied
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def spool(self, source: BinaryIO, filename: str) -> str:
+        """
+        Copies an upload to a file the worker processes can open. Blocking, run it in a thread.
+        """
+        suffix = os.path.splitext(filename)[1]
+        fd, path = tempfile.mkstemp(prefix="upload-", suffix=suffix, dir=self.upload_dir)
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(source, out, length=1024 * 1024)
+        return path
+
+    def submit(self, db: Session, kind: str, filename: str, path: str, options: Dict[str, Any]) -> str:
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = str(uuid.uuid4())
+        try:
+            db.add(EtlJob(id=job_id, kind=kind, filename=filename, state="queued"))
+            db.commit()
+        except Exception:
+            os.remove(path)
+            raise
+
+        try:
+            future = self.executor.submit(run_upload_job, job_id, kind, path, options)
+        except Exception as e:
+            # e.g. BrokenProcessPool: the job would otherwise stay queued forever with its file on disk
+            logging.error(f"Could not queue upload job {job_id}: {e}")
+            os.remove(path)
+            _update_job(self.SessionFactory, job_id, state="failed", error=str(e), finished_at=_now())
+            if isinstance(e, BrokenProcessPool):
+                self._discard_executor()
+            raise
+        future.add_done_callback(lambda f: self._on_done(job_id, kind, path, f))
+        logging.info(f"Queued {kind} upload {filename} as job {job_id}")
+        return job_id
+
+    def _on_done(self, job_id: str, kind: str, path: str, future: Future):
+        # Only reached with an exception if the worker crashed before it could record the failure itself
+        error = "Cancelled on shutdown" if future.cancelled() else future.exception()
+        if error is None:
+            if self.on_success and future.result()["status"] == "success":
+                try:
+                    self.on_success(kind)
+                except Exception as e:
+                    logging.error(f"Post-load hook failed for job {job_id}: {e}")
+            return
+        logging.error(f"Upload job {job_id} failed: {error}")
+        if os.path.exists(path):
+            os.remove(path)
+        _update_job(self.SessionFactory, job_id, state="failed", error=str(error), finished_at=_now())
+
+    def _discard_executor(self):
+        # A broken pool refuses every later job, the next submit starts a new one
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get(self, db: Session, job_id: str) -> Optional[Dict[str, Any]]:
+        job = db.get(EtlJob, job_id)
+        return job_to_dict(job) if job else None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,63 @@
+# main.py
+"""
+Runs the API with uvicorn.
+
+API_WORKERS (default 1) sets the number of worker processes. With more than one, MIGRATE_ON_STARTUP
+migrates the schema here once before the workers start, and the workers share their read-only
+reference data through memory-mapped files in SHARED_STATE_DIR (a temporary directory for this launch
+unless set, see shared_state.py). Otherwise run `python migrations.py` first.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+
 import uvicorn
-from api.apis import app
+from dotenv import load_dotenv
+
+load_dotenv()
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+
+
+def __getattr__(name):
+    # `uvicorn main:app` keeps working without importing the app when this module is run as a script
+    if name == "app":
+        from api.apis import app
+        return app
+    raise AttributeError(name)
+
+
+def _migrate():
+    from sqlalchemy import create_engine
+    from migrations import migrate
+
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    try:
+        migrate(engine)
+    finally:
+        engine.dispose()
+
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    if API_WORKERS <= 1:
+        from api.apis import app
+        uvicorn.run(app, host=API_HOST, port=API_PORT)
+    else:
+        if os.getenv("MIGRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes"):
+            # Once here rather than in every worker at the same time
+            _migrate()
+            os.environ["MIGRATE_ON_STARTUP"] = "false"
+        shared_dir = None
+        if not os.getenv("SHARED_STATE_DIR"):
+            shared_dir = tempfile.mkdtemp(prefix="outfox-shared-")
+            os.environ["SHARED_STATE_DIR"] = shared_dir  # inherited by the workers
+        try:
+            uvicorn.run("api.apis:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
+        finally:
+            if shared_dir is not None:
+                shutil.rmtree(shared_dir, ignore_errors=True)
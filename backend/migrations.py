@@ -0,0 +1,151 @@
+# migrations.py
+"""
+Idempotent schema migrations for databases created before a model change.
+
+Base.metadata.create_all only creates missing tables, it never alters existing ones.
+Each migration below brings an older PostgreSQL database up to the current models and
+is safe to run on every startup.
+"""
+
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from aggregates import rebuild_aggregates
+from models.models import Base, SCHEMA_MODE
+
+
+def _add_upsert_keys(conn: Connection):
+    """
+    Adds content_hash columns and the (provider_id, ms_drg_definition) unique key used by upsert uploads.
+    Duplicate DRG rows left behind by earlier re-uploads are removed first, keeping the newest one.
+    """
+    conn.execute(text("ALTER TABLE hospital_data ADD COLUMN IF NOT EXISTS content_hash VARCHAR(16)"))
+    conn.execute(text("ALTER TABLE star_rating ADD COLUMN IF NOT EXISTS content_hash VARCHAR(16)"))
+
+    existing = {c["name"] for c in inspect(conn).get_unique_constraints("hospital_data")}
+    existing |= {i["name"] for i in inspect(conn).get_indexes("hospital_data")}
+    if "uq_hospital_data_provider_drg" in existing:
+        return
+
+    deleted = conn.execute(text("""
+        DELETE FROM hospital_data a
+        USING hospital_data b
+        WHERE a.provider_id = b.provider_id
+          AND a.ms_drg_definition = b.ms_drg_definition
+          AND a.id < b.id
+    """)).rowcount
+    logging.info(f"Removed {deleted} duplicate hospital_data rows before adding unique key")
+    conn.execute(text(
+        "ALTER TABLE hospital_data ADD CONSTRAINT uq_hospital_data_provider_drg UNIQUE (provider_id, ms_drg_definition)"
+    ))
+
+
+def _add_drg_trigram_index(conn: Connection):
+    """
+    Adds a pg_trgm GIN index so ILIKE '%keyword%' on ms_drg_definition no longer scans the whole table.
+    Skipped with a warning where the pg_trgm extension is not installed on the server.
+    """
+    savepoint = conn.begin_nested()
+    try:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        savepoint.commit()
+    except Exception as e:
+        savepoint.rollback()
+        logging.warning(f"pg_trgm is not available, DRG keyword fallback searches will scan hospital_data: {e}")
+        return
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_hospital_data_ms_drg_trgm ON hospital_data USING gin (ms_drg_definition gin_trgm_ops)"
+    ))
+
+
+def _populate_aggregates(conn: Connection):
+    """
+    Builds the aggregate tables of aggregates.py once for data loaded before they existed. Uploads keep
+    them up to date from then on.
+    """
+    if conn.execute(text("SELECT 1 FROM drg_state_stats LIMIT 1")).first() is not None:
+        return
+    rebuild_aggregates(conn, SCHEMA_MODE)
+
+
+# Arbitrary application-wide key of the advisory lock that serializes run_migrations
+MIGRATION_LOCK_KEY = 7213004401
+
+MIGRATIONS = [
+    _add_upsert_keys,
+    _add_drg_trigram_index,
+    _populate_aggregates,
+]
+
+
+def migrate_to_normalized(engine: Engine):
+    """
+    Copies existing hospital_data rows into the provider / drg / provider_drg tables used by
+    SCHEMA_MODE=normalized. Rows already present are left alone, so it can be re-run safely.
+    hospital_data itself is not modified; drop it once the normalized mode is verified.
+    """
+    with engine.begin() as conn:
+        providers = conn.execute(text("""
+            INSERT INTO provider (provider_id, provider_name, provider_city, provider_state, provider_zip_code)
+            SELECT DISTINCT ON (provider_id) provider_id, provider_name, provider_city, provider_state, provider_zip_code
+            FROM hospital_data
+            ORDER BY provider_id, id DESC
+            ON CONFLICT (provider_id) DO NOTHING
+        """)).rowcount
+        drgs = conn.execute(text("""
+            INSERT INTO drg (ms_drg_definition)
+            SELECT DISTINCT ms_drg_definition FROM hospital_data WHERE ms_drg_definition IS NOT NULL
+            ON CONFLICT (ms_drg_definition) DO NOTHING
+        """)).rowcount
+        facts = conn.execute(text("""
+            INSERT INTO provider_drg (drg_id, provider_id, total_discharges, average_covered_charges,
+                                      average_total_payments, average_medicare_payments, content_hash)
+            SELECT d.drg_id, hd.provider_id, hd.total_discharges, hd.average_covered_charges,
+                   hd.average_total_payments, hd.average_medicare_payments, hd.content_hash
+            FROM hospital_data hd
+            JOIN drg d ON d.ms_drg_definition = hd.ms_drg_definition
+            ON CONFLICT (drg_id, provider_id) DO NOTHING
+        """)).rowcount
+    logging.info(f"Normalized hospital_data: {providers} providers, {drgs} DRGs, {facts} provider_drg rows")
+    return {"provider": providers, "drg": drgs, "provider_drg": facts}
+
+
+def migrate(engine: Engine):
+    """
+    Creates missing tables and runs the migrations: the explicit schema step before the API starts.
+    """
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+
+def run_migrations(engine: Engine):
+    if engine.dialect.name != "postgresql":
+        logging.info(f"Skipping migrations on {engine.dialect.name}, create_all builds the current schema")
+        return
+
+    with engine.begin() as conn:
+        # API workers starting together migrate one after the other; the later ones find nothing left to do
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        for migration in MIGRATIONS:
+            logging.info(f"Running migration {migration.__name__}")
+            migration(conn)
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from dotenv import load_dotenv
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description="Create and migrate the database schema.")
+    parser.add_argument("--normalize", action="store_true",
+                        help="Also copy hospital_data into the provider / drg / provider_drg tables")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    migrate(engine)
+    if args.normalize:
+        migrate_to_normalized(engine)
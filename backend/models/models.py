@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float
+import os
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, func
 from sqlalchemy.orm import relationship, declarative_base
-from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.schema import UniqueConstraint, Index
 
 
 Base = declarative_base()
 
+# "flat" keeps every DRG row in hospital_data. "normalized" stores providers and DRGs once in the
+# provider / drg dimension tables and the per-(DRG, provider) figures in the narrow provider_drg table.
+SCHEMA_MODE = os.getenv("SCHEMA_MODE", "flat")
+
 class HospitalData(Base):
     __tablename__ = "hospital_data"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -18,6 +23,9 @@ class HospitalData(Base):
     average_covered_charges = Column(Float)
     average_total_payments = Column(Float)
     average_medicare_payments = Column(Float)
+    content_hash = Column(String(16))  # Hash of the source row, used to skip unchanged rows on re-upload
+
+    __table_args__ = (UniqueConstraint('provider_id', 'ms_drg_definition', name='uq_hospital_data_provider_drg'),)
 
     def __repr__(self):
         return f"<HospitalData(id={self.id}, provider_id={self.provider_id}, name={self.provider_name}, provider_city={self.provider_city}, provider_state={self.provider_state}, provider_zip_code={self.provider_zip_code}, ms_drg_definition={self.ms_drg_definition}, total_discharges={self.total_discharges}, average_covered_charges={self.average_covered_charges}, average_total_payments={self.average_total_payments}, average_medicare_payments={self.average_medicare_payments})>"
@@ -28,8 +36,137 @@ class StarRating(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     provider_id = Column(Integer, nullable=False)
     overall_rating = Column(Integer)
+    content_hash = Column(String(16))
 
     __table_args__ = (UniqueConstraint('provider_id', name='uq_star_rating_provider_id'),)
 
     def __repr__(self):
-        return f"<StarRating(id={self.id}, provider_id={self.provider_id}, overall_rating={self.overall_rating}, mortality_rating={self.mortality_rating}, safety_of_care_rating={self.safety_of_care_rating}, readmission_rating={self.readmission_rating}, patient_experience_rating={self.patient_experience_rating}, effective_care_rating={self.effective_care_rating})>"
\ No newline at end of file
+        return f"<StarRating(id={self.id}, provider_id={self.provider_id}, overall_rating={self.overall_rating}, mortality_rating={self.mortality_rating}, safety_of_care_rating={self.safety_of_care_rating}, readmission_rating={self.readmission_rating}, patient_experience_rating={self.patient_experience_rating}, effective_care_rating={self.effective_care_rating})>"
+
+
+class Provider(Base):
+    __tablename__ = "provider"
+    provider_id = Column(Integer, primary_key=True, autoincrement=False)  # CMS CCN
+    provider_name = Column(String)
+    provider_city = Column(String)
+    provider_state = Column(String)
+    provider_zip_code = Column(String, index=True)
+    content_hash = Column(String(16))
+
+    def __repr__(self):
+        return f"<Provider(provider_id={self.provider_id}, name={self.provider_name}, provider_city={self.provider_city}, provider_state={self.provider_state}, provider_zip_code={self.provider_zip_code})>"
+
+
+class Drg(Base):
+    __tablename__ = "drg"
+    drg_id = Column(Integer, primary_key=True, autoincrement=True)
+    ms_drg_definition = Column(String, nullable=False, unique=True)
+
+    def __repr__(self):
+        return f"<Drg(drg_id={self.drg_id}, ms_drg_definition={self.ms_drg_definition})>"
+
+
+class ProviderDrg(Base):
+    __tablename__ = "provider_drg"
+    drg_id = Column(Integer, ForeignKey("drg.drg_id"), primary_key=True)
+    provider_id = Column(Integer, ForeignKey("provider.provider_id"), primary_key=True)
+    total_discharges = Column(Integer)
+    average_covered_charges = Column(Float)
+    average_total_payments = Column(Float)
+    average_medicare_payments = Column(Float)
+    content_hash = Column(String(16))
+
+    provider = relationship("Provider")
+    drg = relationship("Drg")
+
+    # The primary key (drg_id, provider_id) serves DRG searches, this one serves per-provider lookups
+    __table_args__ = (Index("ix_provider_drg_provider_id", "provider_id"),)
+
+    def __repr__(self):
+        return f"<ProviderDrg(drg_id={self.drg_id}, provider_id={self.provider_id}, total_discharges={self.total_discharges}, average_covered_charges={self.average_covered_charges}, average_total_payments={self.average_total_payments}, average_medicare_payments={self.average_medicare_payments})>"
+
+
+class EtlJob(Base):
+    __tablename__ = "etl_job"
+    id = Column(String(36), primary_key=True)
+    kind = Column(String, nullable=False)  # "hospital_data" or "hospital_rating"
+    filename = Column(String)
+    state = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    rows_written = Column(Integer, default=0)
+    rows_unchanged = Column(Integer, default=0)
+    batches_committed = Column(Integer, default=0)
+    rows_per_second = Column(Float, default=0.0)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<EtlJob(id={self.id}, kind={self.kind}, filename={self.filename}, state={self.state}, rows_written={self.rows_written}, rows_unchanged={self.rows_unchanged})>"
+
+
+class DataVersion(Base):
+    # Single row counting committed data changes; cached query results are only valid for the version they were read at
+    __tablename__ = "data_version"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DataVersion(version={self.version})>"
+
+
+# Aggregate tables, maintained by aggregates.py at the end of every upload batch. They answer the
+# per-state, per-DRG and per-provider analytics questions from thousands of rows instead of the fact rows.
+
+class DrgStateStats(Base):
+    __tablename__ = "drg_state_stats"
+    ms_drg_definition = Column(String, primary_key=True)
+    provider_state = Column(String, primary_key=True, index=True)
+    provider_count = Column(Integer)
+    total_discharges = Column(Integer)
+    avg_covered_charges = Column(Float)
+    min_covered_charges = Column(Float)
+    max_covered_charges = Column(Float)
+    avg_total_payments = Column(Float)
+    avg_medicare_payments = Column(Float)
+
+    def __repr__(self):
+        return f"<DrgStateStats(ms_drg_definition={self.ms_drg_definition}, provider_state={self.provider_state}, provider_count={self.provider_count}, avg_covered_charges={self.avg_covered_charges})>"
+
+
+class DrgProviderStats(Base):
+    # One row per (DRG, provider) with its rating and its price rank among the providers of its state
+    __tablename__ = "drg_provider_stats"
+    ms_drg_definition = Column(String, primary_key=True)
+    provider_id = Column(Integer, primary_key=True)
+    provider_name = Column(String)
+    provider_city = Column(String)
+    provider_state = Column(String)
+    total_discharges = Column(Integer)
+    average_covered_charges = Column(Float)
+    average_total_payments = Column(Float)
+    average_medicare_payments = Column(Float)
+    overall_rating = Column(Integer)
+    state_price_rank = Column(Integer)  # 1 = lowest average covered charges for this DRG in the state
+    state_avg_covered_charges = Column(Float)
+
+    __table_args__ = (Index("ix_drg_provider_stats_provider_id", "provider_id"),)
+
+    def __repr__(self):
+        return f"<DrgProviderStats(ms_drg_definition={self.ms_drg_definition}, provider_id={self.provider_id}, state_price_rank={self.state_price_rank}, overall_rating={self.overall_rating})>"
+
+
+class ProviderRatingStats(Base):
+    __tablename__ = "provider_rating_stats"
+    provider_id = Column(Integer, primary_key=True, autoincrement=False)
+    provider_name = Column(String)
+    provider_city = Column(String)
+    provider_state = Column(String, index=True)
+    overall_rating = Column(Integer)
+    drg_count = Column(Integer)
+    total_discharges = Column(Integer)
+    avg_covered_charges = Column(Float)
+    avg_total_payments = Column(Float)
+
+    def __repr__(self):
+        return f"<ProviderRatingStats(provider_id={self.provider_id}, provider_name={self.provider_name}, provider_state={self.provider_state}, overall_rating={self.overall_rating})>"
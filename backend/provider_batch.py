@@ -0,0 +1,95 @@
+# provider_batch.py
+"""
+Request parsing and the shared data read for /providers/batch, which answers many /providers searches,
+e.g. the (zip_code, radius_km, ms_drg) tuples of a price-comparison job, in one request.
+
+Every search of a batch is answered from one ColumnarStore: the columnar engine's when it is loaded,
+otherwise one built for the batch by read_batch_store() with a single query over every DRG its keywords
+match and every ZIP code its radii cover. That store keeps prices as float64, so its answers are those of
+the SQL path of /providers. Searches are answered in input order with the same code as /providers, first
+page only; a next_cursor continues on /providers.
+"""
+
+import json
+import os
+from typing import Any, Iterable, List, NamedTuple, Optional, Union
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from columnar import ColumnarStore
+from drg_search import drg_filter_any
+from models.models import HospitalData, Provider, SCHEMA_MODE
+
+PROVIDER_BATCH_MAX_SEARCHES = int(os.getenv("PROVIDER_BATCH_MAX_SEARCHES", "10000"))
+# Beyond this many ZIP codes the batch read takes every provider of its DRGs rather than list the ZIPs
+PROVIDER_BATCH_ZIP_FILTER_LIMIT = int(os.getenv("PROVIDER_BATCH_ZIP_FILTER_LIMIT", "5000"))
+
+SORTS = ("price", "distance", "rating", "score")
+
+
+class ProviderSearch(NamedTuple):
+    zip_code: str
+    radius_km: float
+    ms_drg: str
+    sort: str = "price"
+    limit: int = 50
+
+
+def _search(item: Any) -> Union[ProviderSearch, str]:
+    """
+    The search described by one item of the request, or why it is not one. Same rules as the /providers query.
+    """
+    if not isinstance(item, dict):
+        return "A search must be an object with zip_code, radius_km and ms_drg"
+    missing = [field for field in ("zip_code", "radius_km", "ms_drg") if item.get(field) in (None, "")]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    try:
+        radius_km = float(item["radius_km"])
+        limit = int(item.get("limit", 50))
+    except (TypeError, ValueError):
+        return "radius_km must be a number and limit an integer"
+    if not np.isfinite(radius_km) or radius_km <= 0:
+        return "radius_km must be a positive number"
+    sort = item.get("sort", "price")
+    if sort not in SORTS:
+        return f"sort must be one of {', '.join(SORTS)}"
+    if not 1 <= limit <= 500:
+        return "limit must be between 1 and 500"
+    return ProviderSearch(str(item["zip_code"]), radius_km, str(item["ms_drg"]), sort, limit)
+
+
+def parse_searches(body: bytes, ndjson: bool) -> List[Union[ProviderSearch, str]]:
+    """
+    The searches of a request body: NDJSON with one search per line, or JSON holding a list of searches or
+    {"searches": [...]}. An invalid search becomes its error message, so it fails on its own; a body that
+    cannot be read at all raises ValueError.
+    """
+    try:
+        text = body.decode("utf-8")
+        if ndjson:
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            items = json.loads(text)
+            if isinstance(items, dict):
+                items = items.get("searches")
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Malformed request body: {e}")
+    if not isinstance(items, list):
+        raise ValueError('Expected a list of searches, {"searches": [...]} or NDJSON')
+    if len(items) > PROVIDER_BATCH_MAX_SEARCHES:
+        raise ValueError(f"At most {PROVIDER_BATCH_MAX_SEARCHES} searches per batch, got {len(items)}")
+    return [_search(item) for item in items]
+
+
+def read_batch_store(db: Session, keywords: Iterable[str], zip_codes: Optional[Iterable[str]],
+                     schema_mode: str = SCHEMA_MODE) -> ColumnarStore:
+    """
+    The rows of every DRG matching one of `keywords` in one of `zip_codes` (None for all), in one query.
+    """
+    where = [drg_filter_any(keywords, db, schema_mode)]
+    if zip_codes is not None:
+        column = Provider.provider_zip_code if schema_mode == "normalized" else HospitalData.provider_zip_code
+        where.append(column.in_(sorted(zip_codes)))
+    return ColumnarStore.from_db(db, schema_mode, where=where, price_dtype=np.float64)
@@ -0,0 +1,123 @@
+# provider_search.py
+"""
+SQL for /providers, built for whichever SCHEMA_MODE is configured.
+
+Both schemas return the same labelled columns, so callers do not need to know which tables are behind them.
+
+cheapest_per_provider() keeps only each provider's cheapest matching row in SQL (a ROW_NUMBER window) and
+pages through the result with a keyset on (average_covered_charges, provider_id). That bounds the size of a
+page, not its cost: the window runs over every row matching the DRG and ZIP filter before the keyset and
+LIMIT apply, so each page, later ones included, reads and sorts the full match set and takes longer the
+broader the DRG keyword and the radius are. A read that stops after a page would need the matches in price
+order from an index, which a keyword spanning several DRGs and a radius spanning many ZIP codes does not
+get from a btree; an anti-join that applies the keyset first (no cheaper row of the same provider) tried
+instead sorted the same matches and was about twice as slow.
+"""
+
+import base64
+import json
+import os
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.sql import Select
+
+from drg_search import DrgDictionary, drg_filter
+from models.models import HospitalData, StarRating, Provider, Drg, ProviderDrg, SCHEMA_MODE
+
+# Upper bound on providers ranked in memory for the distance, rating and score sorts
+PROVIDER_CANDIDATE_LIMIT = int(os.getenv("PROVIDER_CANDIDATE_LIMIT", "5000"))
+
+
+def build_provider_query(db: Session, ms_drg: str, zip_codes: Iterable[str], schema_mode: str = SCHEMA_MODE,
+                         dictionary: Optional[DrgDictionary] = None) -> Query:
+    """
+    Rows for every (provider, DRG) pair matching the `ms_drg` keyword in one of `zip_codes`,
+    joined with the provider's rating and ordered by average covered charges.
+    """
+    zip_codes = list(zip_codes)
+    predicate = drg_filter(ms_drg, db, schema_mode, dictionary)
+
+    if schema_mode == "normalized":
+        return db.query(
+            Provider.provider_id,
+            Provider.provider_name,
+            Provider.provider_city,
+            Provider.provider_state,
+            Provider.provider_zip_code,
+            Drg.ms_drg_definition,
+            ProviderDrg.total_discharges,
+            ProviderDrg.average_covered_charges,
+            ProviderDrg.average_total_payments,
+            StarRating.overall_rating
+        ).select_from(ProviderDrg) \
+            .join(Provider, ProviderDrg.provider_id == Provider.provider_id) \
+            .join(Drg, ProviderDrg.drg_id == Drg.drg_id) \
+            .outerjoin(StarRating, ProviderDrg.provider_id == StarRating.provider_id) \
+            .filter(predicate) \
+            .filter(Provider.provider_zip_code.in_(zip_codes)) \
+            .order_by(ProviderDrg.average_covered_charges.asc())
+
+    return db.query(
+        HospitalData.provider_id,
+        HospitalData.provider_name,
+        HospitalData.provider_city,
+        HospitalData.provider_state,
+        HospitalData.provider_zip_code,
+        HospitalData.ms_drg_definition,
+        HospitalData.total_discharges,
+        HospitalData.average_covered_charges,
+        HospitalData.average_total_payments,
+        StarRating.overall_rating
+    ).outerjoin(StarRating, HospitalData.provider_id == StarRating.provider_id) \
+        .filter(predicate) \
+        .filter(HospitalData.provider_zip_code.in_(zip_codes)) \
+        .order_by(HospitalData.average_covered_charges.asc())
+
+
+def cheapest_per_provider(db: Session, ms_drg: str, zip_codes: Iterable[str], schema_mode: str = SCHEMA_MODE,
+                          dictionary: Optional[DrgDictionary] = None, after: Optional[Tuple[float, int]] = None,
+                          limit: Optional[int] = None) -> Select:
+    """
+    One row per provider, its cheapest match for `ms_drg`, ordered by (average_covered_charges, provider_id).
+    `after` is the (average_covered_charges, provider_id) of the last row of the previous page.
+    Providers with no price for any matching DRG are left out, they have no place in a price ordering.
+    """
+    query = build_provider_query(db, ms_drg, zip_codes, schema_mode, dictionary).order_by(None)
+    entity = ProviderDrg if schema_mode == "normalized" else HospitalData
+    provider_id = Provider.provider_id if schema_mode == "normalized" else HospitalData.provider_id
+    ranked = query.add_columns(
+        func.row_number().over(
+            partition_by=provider_id,
+            order_by=(entity.average_covered_charges.asc().nulls_last(), entity.total_discharges.desc().nulls_last()),
+        ).label("price_rank")
+    ).subquery()
+
+    price, provider = ranked.c.average_covered_charges, ranked.c.provider_id
+    stmt = select(*[c for c in ranked.c if c.name != "price_rank"]) \
+        .where(ranked.c.price_rank == 1, price.is_not(None)) \
+        .order_by(price.asc(), provider.asc())
+    if after is not None:
+        after_price, after_provider = after
+        stmt = stmt.where(or_(price > after_price, and_(price == after_price, provider > after_provider)))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def encode_cursor(**position) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Reverses encode_cursor(). Raises ValueError for anything that is not a cursor this module issued.
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Malformed cursor")
+    if not isinstance(position, dict):
+        raise ValueError("Malformed cursor")
+    return position
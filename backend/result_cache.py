@@ -0,0 +1,172 @@
+# result_cache.py
+"""
+Cache of executed NL query results and their summaries.
+
+Rows are keyed on the canonicalized SQL text, its bound parameters if any, and the data version
+(data_version.py), summaries on the same plus the normalized question, since the summary is written
+for the question asked. An upload that changes data bumps the version, so entries are never stale
+and are simply left to age out of the backend.
+
+The backend is chosen by RESULT_CACHE_URL:
+- unset or memory://  in-process LRU with TTL, per API worker (also the stand-in for tests)
+- redis://...         shared by every API worker, needs the `redis` package
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai_service.sql_cache import normalize_question
+
+RESULT_CACHE_URL = os.getenv("RESULT_CACHE_URL", "memory://")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1000"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+
+_QUOTED_OR_SPACE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|\s+")
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Collapses whitespace outside quoted literals and identifiers and drops trailing semicolons.
+    Letter case is kept: it is significant inside literals.
+    """
+    collapsed = _QUOTED_OR_SPACE.sub(lambda m: m.group(1) or " ", sql.strip())
+    return collapsed.rstrip("; ").strip()
+
+
+def json_default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class MemoryBackend:
+    """
+    In-process LRU with per-entry TTL.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if time.monotonic() > expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Shared backend for multi-worker deployments. Eviction is left to Redis (TTL plus its maxmemory policy).
+    """
+
+    def __init__(self, url: str, prefix: str = "outfox:result:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RESULT_CACHE_URL points to Redis but the redis package is not installed")
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(self.prefix + key)
+        return value.decode() if value is not None else None
+
+    async def set(self, key: str, value: str, ttl_seconds: float):
+        await self.client.set(self.prefix + key, value, ex=max(1, int(ttl_seconds)))
+
+
+def backend_from_url(url: str = RESULT_CACHE_URL):
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported RESULT_CACHE_URL: {url}")
+
+
+class ResultCache:
+    """
+    Rows and summaries of executed generated SQL. A failing backend is logged and treated as a miss.
+    """
+
+    def __init__(self, backend=None, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.backend = backend if backend is not None else backend_from_url()
+        self.ttl_seconds = ttl_seconds
+        self.hits = {"rows": 0, "summary": 0}
+        self.misses = {"rows": 0, "summary": 0}
+
+    @staticmethod
+    def _key(kind: str, sql: str, version: int, params: Optional[Dict[str, Any]], question: Optional[str] = None) -> str:
+        parts = [kind, str(version), canonicalize_sql(sql)]
+        if params:
+            parts.append(json.dumps(params, sort_keys=True, default=json_default))
+        if question is not None:
+            parts.append(normalize_question(question))
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    async def _get(self, kind: str, key: str):
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logging.warning(f"Result cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses[kind] += 1
+            return None
+        self.hits[kind] += 1
+        return json.loads(value)
+
+    async def _set(self, key: str, value: Any):
+        try:
+            await self.backend.set(key, json.dumps(value, default=json_default), self.ttl_seconds)
+        except Exception as e:
+            logging.warning(f"Result cache write failed: {e}")
+
+    async def get_rows(self, sql: str, version: int, params: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        return await self._get("rows", self._key("rows", sql, version, params))
+
+    async def put_rows(self, sql: str, version: int, rows: List[Dict[str, Any]], params: Optional[Dict[str, Any]] = None):
+        await self._set(self._key("rows", sql, version, params), rows)
+
+    async def get_summary(self, sql: str, version: int, question: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        return await self._get("summary", self._key("summary", sql, version, params, question))
+
+    async def put_summary(self, sql: str, version: int, question: str, summary: str, params: Optional[Dict[str, Any]] = None):
+        await self._set(self._key("summary", sql, version, params, question), summary)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"backend": type(self.backend).__name__}
+        for kind in ("rows", "summary"):
+            lookups = self.hits[kind] + self.misses[kind]
+            stats[f"{kind}_hits"] = self.hits[kind]
+            stats[f"{kind}_misses"] = self.misses[kind]
+            stats[f"{kind}_hit_rate"] = round(self.hits[kind] / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,102 @@
+# shared_state.py
+"""
+Read-only reference arrays shared by the API workers of one host through memory-mapped files.
+
+With SHARED_STATE_DIR set (main.py sets it when API_WORKERS > 1), the first worker to need a set of
+arrays, say the columnar store at data version 42, builds it and writes it as .npy files to
+SHARED_STATE_DIR/columnar-flat/42. Every worker, the builder included, then maps those files read-only,
+so the data is read from the database once and its pages sit in the OS page cache once, however many
+workers use them. A set is written to a temporary directory and renamed into place, so a reader never
+sees a partial one; a lock file keeps workers from building the same set at the same time. Publishing
+a version removes the older ones; workers still mapping them keep their pages until they move on.
+
+Without SHARED_STATE_DIR every process builds its own arrays in memory, as before.
+Strings are stored as fixed-width unicode arrays, since object arrays cannot be memory-mapped.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; concurrent builds are then only wasted work, publishing stays atomic
+    fcntl = None
+
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR")
+
+Arrays = Dict[str, np.ndarray]
+
+
+def string_array(values) -> np.ndarray:
+    """
+    Fixed-width unicode array of `values` (None becomes ""), which unlike an object array can be mapped.
+    """
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def _map(path: str) -> Optional[Arrays]:
+    if not os.path.isdir(path):
+        return None
+    return {name[:-len(".npy")]: np.load(os.path.join(path, name), mmap_mode="r", allow_pickle=False)
+            for name in os.listdir(path) if name.endswith(".npy")}
+
+
+@contextmanager
+def _build_lock(path: str):
+    if fcntl is None:
+        yield
+        return
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _publish(parent: str, version: str, arrays: Arrays):
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=parent)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+    try:
+        os.rename(staging, os.path.join(parent, version))
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)  # published by another process in the meantime
+        return
+    for other in os.listdir(parent):
+        if other != version and not other.startswith("."):
+            shutil.rmtree(os.path.join(parent, other), ignore_errors=True)
+
+
+def load_or_build(name: str, version, build: Callable[[], Arrays], directory: Optional[str] = SHARED_STATE_DIR) -> Arrays:
+    """
+    The arrays of `name` at `version`: mapped from `directory` when published there, otherwise built with
+    `build()` and published first. Without a directory, just `build()`.
+    """
+    if not directory:
+        return build()
+    parent = os.path.join(directory, name)
+    path = os.path.join(parent, str(version))
+    arrays = _map(path)
+    if arrays is not None:
+        return arrays
+
+    os.makedirs(parent, exist_ok=True)
+    with _build_lock(os.path.join(parent, ".lock")):
+        arrays = _map(path)
+        if arrays is not None:
+            return arrays
+        started = time.perf_counter()
+        built = build()
+        _publish(parent, str(version), built)
+        logging.info(f"Published shared {name} {version} in {time.perf_counter() - started:.2f}s")
+    # None only if a newer version replaced this one in the meantime
+    arrays = _map(path)
+    return arrays if arrays is not None else built
@@ -0,0 +1,246 @@
+# snapshot.py
+"""
+Parquet snapshots of the cleaned, typed data, so a rebuilt database is restored without re-parsing CSV.
+
+A snapshot is a directory with hospital_data.parquet, star_rating.parquet and manifest.json. The rows are
+the ones the ETL wrote, content_hash included, in the hospital_data layout whatever the SCHEMA_MODE, so a
+snapshot taken in one mode restores into the other. Both tables are read in one REPEATABLE READ transaction
+and streamed to zstd-compressed Parquet in batches of SNAPSHOT_BATCH_ROWS.
+
+restore_snapshot() reads the files batch by batch through memory-mapped Arrow and writes them with the ETL's
+COPY loader in a single transaction: "replace" truncates the tables first, "upsert" merges like a re-upload.
+The aggregate tables are rebuilt and the data version bumped before the commit.
+
+manifest.json records the data version the files match. ColumnarEngine reads a snapshot instead of the
+database at startup when that version is still current (SNAPSHOT_DIR).
+
+    python snapshot.py export /var/backups/cms-2024
+    python snapshot.py restore /var/backups/cms-2024 --mode replace
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from aggregates import rebuild_aggregates
+from data_version import bump_data_version, get_data_version
+from etl import write_dataframe, write_hospital_data
+from models.models import HospitalData, StarRating, Provider, Drg, ProviderDrg, SCHEMA_MODE
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+SNAPSHOT_BATCH_ROWS = int(os.getenv("SNAPSHOT_BATCH_ROWS", "100000"))
+SNAPSHOT_COMPRESSION = os.getenv("SNAPSHOT_COMPRESSION", "zstd")
+
+MANIFEST = "manifest.json"
+SNAPSHOT_FORMAT = 1
+
+SCHEMAS = {
+    "hospital_data": pa.schema([
+        ("provider_id", pa.int32()),
+        ("provider_name", pa.string()),
+        ("provider_city", pa.string()),
+        ("provider_state", pa.string()),
+        ("provider_zip_code", pa.string()),
+        ("ms_drg_definition", pa.string()),
+        ("total_discharges", pa.int32()),
+        ("average_covered_charges", pa.float64()),
+        ("average_total_payments", pa.float64()),
+        ("average_medicare_payments", pa.float64()),
+        ("content_hash", pa.string()),
+    ]),
+    "star_rating": pa.schema([
+        ("provider_id", pa.int32()),
+        ("overall_rating", pa.int32()),
+        ("content_hash", pa.string()),
+    ]),
+}
+# Low-cardinality columns, read back as pandas categoricals without materializing every string
+DICTIONARY_COLUMNS = ["provider_name", "provider_city", "provider_state", "provider_zip_code", "ms_drg_definition"]
+
+
+def _query(table: str, schema_mode: str):
+    if table == "star_rating":
+        return select(StarRating.provider_id, StarRating.overall_rating, StarRating.content_hash) \
+            .order_by(StarRating.provider_id)
+    if schema_mode == "normalized":
+        return select(
+            ProviderDrg.provider_id, Provider.provider_name, Provider.provider_city, Provider.provider_state,
+            Provider.provider_zip_code, Drg.ms_drg_definition, ProviderDrg.total_discharges,
+            ProviderDrg.average_covered_charges, ProviderDrg.average_total_payments,
+            ProviderDrg.average_medicare_payments, ProviderDrg.content_hash,
+        ).select_from(ProviderDrg) \
+            .join(Provider, ProviderDrg.provider_id == Provider.provider_id) \
+            .join(Drg, ProviderDrg.drg_id == Drg.drg_id) \
+            .order_by(Drg.ms_drg_definition, ProviderDrg.provider_id)
+    columns = [HospitalData.__table__.c[name] for name in SCHEMAS["hospital_data"].names]
+    # Sorted by DRG so every row group covers few DRGs, which keeps its dictionaries small
+    return select(*columns).order_by(HospitalData.ms_drg_definition, HospitalData.provider_id)
+
+
+def _path(directory: str, table: str) -> str:
+    return os.path.join(directory, f"{table}.parquet")
+
+
+def read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]):
+    # Written last and renamed into place, so a directory with a manifest always holds complete files
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def export_snapshot(db: Session, directory: str, schema_mode: str = SCHEMA_MODE,
+                    batch_rows: int = SNAPSHOT_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Writes hospital_data and star_rating to Parquet files in `directory` and returns the manifest.
+    `db` should be a fresh session: on PostgreSQL its transaction is switched to REPEATABLE READ so that
+    the data version and both tables are read from one consistent snapshot.
+    """
+    os.makedirs(directory, exist_ok=True)
+    started = time.perf_counter()
+    if db.get_bind().dialect.name == "postgresql":
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    manifest = {"format": SNAPSHOT_FORMAT, "data_version": get_data_version(db), "schema_mode": schema_mode,
+                "created_at": datetime.now(timezone.utc).isoformat(), "tables": {}}
+
+    connection = db.connection().execution_options(stream_results=True)
+    for table, schema in SCHEMAS.items():
+        path = _path(directory, table)
+        rows = 0
+        with pq.ParquetWriter(path + ".tmp", schema, compression=SNAPSHOT_COMPRESSION) as writer:
+            for chunk in pd.read_sql(_query(table, schema_mode), connection, chunksize=batch_rows):
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                rows += len(chunk)
+        os.replace(path + ".tmp", path)
+        manifest["tables"][table] = {"rows": rows, "bytes": os.path.getsize(path)}
+    db.rollback()
+
+    manifest["export_seconds"] = round(time.perf_counter() - started, 3)
+    _write_manifest(directory, manifest)
+    logging.info(f"Exported snapshot to {directory}: {manifest['tables']}")
+    return manifest
+
+
+def iter_snapshot(directory: str, table: str, batch_rows: int = SNAPSHOT_BATCH_ROWS,
+                  columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Yields the rows of one snapshot table as DataFrames of at most `batch_rows` rows, read memory-mapped.
+    """
+    parquet = pq.ParquetFile(_path(directory, table), memory_map=True)
+    for batch in parquet.iter_batches(batch_size=batch_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+def read_snapshot_table(directory: str, table: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Reads a whole snapshot table memory-mapped, with the low-cardinality string columns as categoricals.
+    """
+    names = columns if columns is not None else SCHEMAS[table].names
+    dictionary = [c for c in DICTIONARY_COLUMNS if c in names]
+    return pq.read_table(_path(directory, table), columns=columns, memory_map=True,
+                         read_dictionary=dictionary).to_pandas()
+
+
+def _truncate(db: Session, schema_mode: str):
+    if schema_mode == "normalized":
+        db.execute(text("TRUNCATE provider_drg, provider, drg, star_rating RESTART IDENTITY"))
+    else:
+        db.execute(text("TRUNCATE hospital_data, star_rating RESTART IDENTITY"))
+
+
+def restore_snapshot(db: Session, directory: str, mode: str = "replace",
+                     batch_rows: int = SNAPSHOT_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Loads a snapshot into the tables of the configured SCHEMA_MODE and commits. "replace" swaps the whole content of
+    the tables, "upsert" merges on the upload keys and skips rows whose content_hash is unchanged.
+    """
+    if mode not in ("replace", "upsert"):
+        raise ValueError(f"Unknown restore mode: {mode}")
+    manifest = read_manifest(directory)
+    if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{directory} does not hold a snapshot in format {SNAPSHOT_FORMAT}")
+
+    started = time.perf_counter()
+    write_mode = "append" if mode == "replace" else "upsert"
+    counts = {"hospital_data": 0, "star_rating": 0}
+    try:
+        if mode == "replace":
+            _truncate(db, SCHEMA_MODE)
+        for df in iter_snapshot(directory, "hospital_data", batch_rows):
+            counts["hospital_data"] += write_hospital_data(df, db, write_mode)["written"]
+        for df in iter_snapshot(directory, "star_rating", batch_rows):
+            counts["star_rating"] += write_dataframe(df, StarRating, db, write_mode)["written"]
+        rebuild_aggregates(db, SCHEMA_MODE)
+        bump_data_version(db)
+        data_version = get_data_version(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if mode == "replace":
+        # The database now holds exactly the snapshot's rows, under a new version
+        manifest["data_version"] = data_version
+        _write_manifest(directory, manifest)
+    elapsed = round(time.perf_counter() - started, 3)
+    logging.info(f"Restored snapshot {directory} ({mode}): {counts} rows written in {elapsed}s")
+    return {"status": "success", "rows_written": counts, "data_version": data_version, "elapsed_seconds": elapsed}
+
+
+def current_snapshot(data_version: int, directory: Optional[str] = SNAPSHOT_DIR) -> Optional[str]:
+    """
+    Returns `directory` if it holds a snapshot of exactly the data at `data_version`, else None.
+    """
+    if not directory:
+        return None
+    manifest = read_manifest(directory)
+    if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return directory if manifest.get("data_version") == data_version else None
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from migrations import run_migrations
+    from models.models import Base
+
+    parser = argparse.ArgumentParser(description="Export or restore a Parquet snapshot of the loaded data.")
+    parser.add_argument("action", choices=["export", "restore"])
+    parser.add_argument("directory")
+    parser.add_argument("--mode", choices=["replace", "upsert"], default="replace",
+                        help="restore only: replace the tables' content or merge into it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        if args.action == "export":
+            print(json.dumps(export_snapshot(db, args.directory), indent=2))
+        else:
+            print(json.dumps(restore_snapshot(db, args.directory, args.mode), indent=2))
+    finally:
+        db.close()
@@ -0,0 +1,119 @@
+# sql_sandbox.py
+"""
+Bounded execution of LLM-generated SQL.
+
+validate_sql() parses the model's output and only lets through a single read-only query over the
+tables of the active schema: no DDL or DML, no SELECT INTO or row locks, no system catalogs and no
+server-side functions such as pg_sleep or pg_read_file. It returns the query with its outermost LIMIT
+injected or clamped to SQL_MAX_ROWS.
+
+run_readonly() executes a query inside a savepoint that is made read-only and given its own statement
+timeout (SQL_SANDBOX_TIMEOUT_MS) and is always rolled back, so the settings never outlive the query.
+Rows are read through a server-side cursor and at most `max_rows` of them are fetched.
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+
+import sqlglot
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+from sqlglot import exp
+
+from aggregates import AGGREGATE_TABLES
+from models.models import SCHEMA_MODE
+
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "1000"))
+SQL_SANDBOX_TIMEOUT_MS = int(os.getenv("SQL_SANDBOX_TIMEOUT_MS", "5000"))
+
+_AGGREGATE_TABLES = frozenset(AGGREGATE_TABLES)
+QUERYABLE_TABLES = {
+    "flat": frozenset({"hospital_data", "star_rating"}) | _AGGREGATE_TABLES,
+    "normalized": frozenset({"provider", "drg", "provider_drg", "star_rating"}) | _AGGREGATE_TABLES,
+}
+
+# Functions PostgreSQL provides for administration, file and network access or session state
+_DENIED_FUNCTION_PREFIXES = ("pg_", "lo_", "dblink", "txid_")
+_DENIED_FUNCTIONS = frozenset({
+    "set_config", "current_setting", "version", "inet_server_addr", "inet_server_port",
+    "query_to_xml", "query_to_xml_and_xmlschema", "table_to_xml", "cursor_to_xml", "database_to_xml",
+})
+_WRITE_NODES = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+                exp.TruncateTable, exp.Command, exp.Into, exp.Lock)
+
+
+class UnsafeQueryError(ValueError):
+    """
+    The generated SQL is not a single read-only query over the known tables.
+    """
+
+
+def _function_name(node: exp.Func) -> str:
+    return (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).lower()
+
+
+def validate_sql(sql: str, schema_mode: str = SCHEMA_MODE, max_rows: int = SQL_MAX_ROWS) -> str:
+    """
+    Returns `sql` rewritten with a LIMIT of at most `max_rows`, or raises UnsafeQueryError.
+    """
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="postgres") if s is not None]
+    except sqlglot.errors.ParseError as e:
+        # The exception text highlights the error position with terminal escape codes, the description does not
+        reason = e.errors[0].get("description") if e.errors else str(e)
+        raise UnsafeQueryError(f"could not parse the query: {reason}")
+    if len(statements) != 1:
+        raise UnsafeQueryError("exactly one statement is allowed")
+    query = statements[0]
+    if not isinstance(query, exp.Query):
+        raise UnsafeQueryError(f"only SELECT queries are allowed, not {query.key.upper()}")
+
+    for node in query.find_all(*_WRITE_NODES):
+        raise UnsafeQueryError(f"{node.key.upper()} is not allowed in a read-only query")
+
+    allowed = QUERYABLE_TABLES[schema_mode]
+    cte_names = {cte.alias_or_name for cte in query.find_all(exp.CTE)}
+    for table in query.find_all(exp.Table):
+        if not isinstance(table.this, exp.Identifier):
+            raise UnsafeQueryError("only tables may appear in FROM and JOIN")
+        if table.catalog or table.db not in ("", "public"):
+            raise UnsafeQueryError(f"table {table.sql('postgres')} is not queryable")
+        if table.name not in allowed and table.name not in cte_names:
+            raise UnsafeQueryError(f"unknown table {table.name}")
+
+    for function in query.find_all(exp.Func):
+        name = _function_name(function)
+        if name.startswith(_DENIED_FUNCTION_PREFIXES) or name in _DENIED_FUNCTIONS:
+            raise UnsafeQueryError(f"function {name} is not allowed")
+
+    limit = query.args.get("limit")
+    current = limit.expression if isinstance(limit, exp.Limit) else None
+    if not (isinstance(current, exp.Literal) and current.is_int and int(current.this) <= max_rows):
+        query = query.limit(max_rows, copy=False)
+    return query.sql(dialect="postgres")
+
+
+def run_readonly(db: Session, sql: str, params: Optional[Dict[str, Any]] = None,
+                 max_rows: int = SQL_MAX_ROWS, timeout_ms: int = SQL_SANDBOX_TIMEOUT_MS) -> List[Dict[str, Any]]:
+    """
+    Executes `sql` read-only with a statement timeout and returns up to `max_rows` rows as dicts.
+    List parameters are expanded for `IN :name`.
+    """
+    statement = text(sql)
+    if params:
+        statement = statement.bindparams(*[bindparam(k, expanding=True) for k, v in params.items() if isinstance(v, list)])
+
+    savepoint = db.begin_nested()
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            # SET LOCAL lasts until the savepoint is rolled back below
+            db.execute(text("SET LOCAL transaction_read_only = on"))
+            db.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+        result = db.execute(statement, params or {}, execution_options={"yield_per": min(max_rows, 500)})
+        try:
+            column_names = list(result.keys())
+            return [dict(zip(column_names, row)) for row in result.fetchmany(max_rows)]
+        finally:
+            result.close()
+    finally:
+        savepoint.rollback()
@@ -28,9 +28,22 @@ const ChatPage = () => {
       };
 
       ws.onmessage = (event) => {
-        // The server sends plain text summaries or error messages, not JSON
-        const aiResponse = event.data;
-        setMessages((prev) => [...prev, { id: Date.now(), content: aiResponse, role: 'ai' }]);
+        // The server sends JSON frames tagged with the id of the question they answer:
+        // sql, rows, token (repeated), then done or error. Answers to different questions interleave.
+        const frame = JSON.parse(event.data);
+        const answerId = `${frame.id}-answer`;
+        const setAnswer = (update) => setMessages((prev) => (
+          prev.some((msg) => msg.id === answerId)
+            ? prev.map((msg) => (msg.id === answerId ? { ...msg, content: update(msg.content) } : msg))
+            : [...prev, { id: answerId, content: update(''), role: 'ai' }]
+        ));
+        if (frame.type === 'token') {
+          setAnswer((content) => content + frame.text);
+        } else if (frame.type === 'done') {
+          setAnswer(() => frame.summary);
+        } else if (frame.type === 'error') {
+          setAnswer(() => frame.message);
+        }
         scrollToBottom();
       };
 
@@ -66,9 +79,10 @@ const ChatPage = () => {
   const sendMessage = () => {
     const query = input.trim();
     if (socketRef.current && socketRef.current.readyState === WebSocket.OPEN && query) {
-      // The server expects plain text (the natural language query itself)
-      socketRef.current.send(query);
-      setMessages((prev) => [...prev, { id: Date.now(), content: query, role: 'user' }]);
+      // Questions are answered concurrently; the id ties the server's frames to this question
+      const id = String(Date.now());
+      socketRef.current.send(JSON.stringify({ id, question: query }));
+      setMessages((prev) => [...prev, { id, content: query, role: 'user' }]);
       setInput(''); // Clear input field
     } else if (!isConnected) {
       setMessages((prev) => [...prev, { id: Date.now(), content: 'Not connected to server. Please wait.', role: 'status' }]);
@@ -1,6 +1,11 @@
 import React, { useState } from 'react';
 import axios from 'axios';
 
+const BACKEND_URL = "http://127.0.0.1:8000";
+const JOB_POLL_INTERVAL_MS = 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 const FileUpload = ({ endpoint, label }) => {
   const [file, setFile] = useState(null);
   const [message, setMessage] = useState('');
@@ -24,14 +29,30 @@ const FileUpload = ({ endpoint, label }) => {
     formData.append('file', file);
 
     try {
-      const url = "http://127.0.0.1:8000" + endpoint
+      const url = BACKEND_URL + endpoint
       console.log(url)
       const response = await axios.post(url, formData, {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
       });
-      setMessage(response.data.message || 'File uploaded successfully!');
+
+      // The upload is processed in the background, poll the job until it finishes
+      const jobId = response.data.job_id;
+      setMessage('Processing...');
+      while (true) {
+        await sleep(JOB_POLL_INTERVAL_MS);
+        const { data: job } = await axios.get(`${BACKEND_URL}/jobs/${jobId}`);
+        if (job.state === 'succeeded') {
+          setMessage(`File uploaded successfully! ${job.rows_written} rows written, ${job.rows_unchanged} unchanged.`);
+          break;
+        }
+        if (job.state === 'failed') {
+          setMessage(`Error uploading file: ${job.error}`);
+          break;
+        }
+        setMessage(`Processing... ${job.rows_processed} rows (${job.rows_per_second} rows/sec)`);
+      }
     } catch (error) {
       console.error('Error uploading file:', error);
       setMessage(`Error uploading file: ${error.response?.data?.detail || error.message}`);
@@ -5,15 +5,36 @@ const GetProvidersPage = () => {
   const [zipCode, setZipCode] = useState('');
   const [radius, setRadius] = useState('');
   const [msDrg, setMsDrg] = useState('');
+  const [sort, setSort] = useState('price');
   const [providers, setProviders] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState('');
 
+  const fetchPage = async (cursor) => {
+    const response = await axios.get('http://localhost:8000/providers', {
+      params: {
+        zip_code: zipCode,
+        radius_km: parseFloat(radius), // Ensure radius is a number
+        ms_drg: msDrg,
+        sort: sort,
+        cursor: cursor || undefined,
+      },
+    });
+    // Assuming response.data.data contains the array of providers
+    if (!response.data || !response.data.data) {
+      throw new Error('Unexpected response format from server.');
+    }
+    setNextCursor(response.data.next_cursor || null);
+    return response.data.data;
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     setIsLoading(true);
     setError('');
     setProviders([]); // Clear previous results
+    setNextCursor(null);
 
     if (!zipCode || !radius || !msDrg) {
       setError('Please fill in all search fields.');
@@ -22,21 +43,10 @@ const GetProvidersPage = () => {
     }
 
     try {
-      const response = await axios.get('http://localhost:8000/providers', {
-        params: {
-          zip_code: zipCode,
-          radius_km: parseFloat(radius), // Ensure radius is a number
-          ms_drg: msDrg,
-        },
-      });
-      // Assuming response.data.data contains the array of providers
-      if (response.data && response.data.data) {
-        setProviders(response.data.data);
-        if (response.data.data.length === 0) {
-          setError('No providers found matching your criteria.');
-        }
-      } else {
-        setError('Unexpected response format from server.');
+      const page = await fetchPage(null);
+      setProviders(page);
+      if (page.length === 0) {
+        setError('No providers found matching your criteria.');
       }
     } catch (err) {
       console.error('Error fetching providers:', err);
@@ -46,6 +56,20 @@ const GetProvidersPage = () => {
     }
   };
 
+  const handleLoadMore = async () => {
+    setIsLoading(true);
+    setError('');
+    try {
+      const page = await fetchPage(nextCursor);
+      setProviders((previous) => [...previous, ...page]);
+    } catch (err) {
+      console.error('Error fetching providers:', err);
+      setError(`Error fetching providers: ${err.response?.data?.detail || err.message}`);
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   return (
     <div className="providers-container">
       <h2>Find Healthcare Providers</h2>
@@ -83,6 +107,20 @@ const GetProvidersPage = () => {
             className="form-input"
           />
         </div>
+        <div className="form-group">
+          <label htmlFor="sort" className="form-label">Sort by:</label>
+          <select
+            id="sort"
+            value={sort}
+            onChange={(e) => setSort(e.target.value)}
+            className="form-input"
+          >
+            <option value="price">Lowest price</option>
+            <option value="distance">Nearest</option>
+            <option value="rating">Highest rating</option>
+            <option value="score">Best overall</option>
+          </select>
+        </div>
         <button
           type="submit"
           disabled={isLoading}
@@ -96,13 +134,14 @@ const GetProvidersPage = () => {
 
       <div className="results-section">
         <h3>Search Results:</h3>
-        {providers.length > 0 ? (
+        {providers.length > 0 && (
           <ul className="provider-list">
             {providers.map((provider) => (
               <li key={provider.provider_id} className="provider-card">
                 <p className="provider-name">{provider.provider_name}</p>
                 <p className="provider-detail">{provider.ms_drg_defination}</p>
                 <p className="provider-location">Location: {provider.provider_city}, {provider.provider_state} {provider.provider_zip}</p>
+                <p>Distance: <span className="provider-value">{provider.distance_km != null ? `${provider.distance_km.toFixed(1)} km` : 'N/A'}</span></p>
                 <p>Avg. Covered Charges: <span className="provider-value">${provider.average_covered_charges?.toFixed(2) || 'N/A'}</span></p>
                 <p>Avg. Total Payments: <span className="provider-value">${provider.average_total_payments?.toFixed(2) || 'N/A'}</span></p>
                 <p>Star Rating: <span className="provider-value">{provider.star_rating || 'N/A'}/10</span></p>
@@ -110,8 +149,14 @@ const GetProvidersPage = () => {
               </li>
             ))}
           </ul>
-        ) : (
-          !isLoading && !error && <p className="no-results-message">No results to display. Use the form above to search.</p>
+        )}
+        {providers.length > 0 && nextCursor && (
+          <button onClick={handleLoadMore} disabled={isLoading} className="search-button">
+            {isLoading ? 'Loading...' : 'Load more'}
+          </button>
+        )}
+        {providers.length === 0 && !isLoading && !error && (
+          <p className="no-results-message">No results to display. Use the form above to search.</p>
         )}
       </div>
     </div>